@@ -5,6 +5,21 @@
 #                                      IMPORTS
 # ==============================================================================
 
+import hashlib
+import importlib
+import marshal
+import os
+import re
+import sys
+from operator import attrgetter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from graphalchemy.blueprints.types import Type
+from graphalchemy.blueprints.types import defining_class
 from graphalchemy.blueprints.types import List
 from graphalchemy.blueprints.types import Dict
 
@@ -37,6 +52,10 @@ class Model(object):
         self.indices = {}
         self.class_ = None
         self.logger = kwargs.get('logger', None)
+        self._hydrator = None
+        self._record_class = None
+        self._record_hydrator = None
+        self._validator = None
 
 
     def register_class(self, class_):
@@ -75,6 +94,8 @@ class Model(object):
         :returns: This object itself.
         :rtype: graphalchemy.blueprints.schema.Model
         """
+        if self.metadata is not None and self.metadata.frozen:
+            raise Exception('Cannot add a property to a frozen model.')
         if prop.name_py in self._properties:
             raise Exception('Cannot override previously set property.')
         self._properties[prop.name_py] = prop
@@ -83,6 +104,84 @@ class Model(object):
         if prop.prefix == True:
             prop.name_db = self.model_name + '_' + prop.name_db
         prop.model = self
+        self._reset_compiled()
+        return self
+
+
+    def get_hydrator(self):
+        """ Returns the function building objects of this model from database
+        rows. It is compiled on first use, and again after the model changes.
+
+        Example use :
+        >>> website = model.get_hydrator()({'_id': 123, 'name': u'Foo'})
+
+        :returns: The hydrator, see compile_hydrator().
+        :rtype: callable
+        """
+        if self._hydrator is None:
+            self._hydrator = compile_hydrator(self, self.metadata.for_model(self))
+        return self._hydrator
+
+
+    def get_record_class(self):
+        """ Returns the compact, read-only class that read-only queries hydrate
+        elements of this model into. It is generated on first use.
+
+        :returns: The record class, see compile_record_class().
+        :rtype: type
+        """
+        if self._record_class is None:
+            self._record_class = compile_record_class(self)
+        return self._record_class
+
+
+    def get_record_hydrator(self):
+        """ :returns: The function building records of this model from
+        database rows.
+        :rtype: callable
+        """
+        if self._record_hydrator is None:
+            self._record_hydrator = compile_hydrator(self, self.get_record_class(), record=True)
+        return self._record_hydrator
+
+
+    def get_validator(self):
+        """ Returns the function validating objects of this model. It is
+        compiled on first use, and again after the model changes.
+
+        Example use :
+        >>> ok, errors = model.get_validator()(website)
+
+        :returns: The validator, see compile_validator().
+        :rtype: callable
+        """
+        if self._validator is None:
+            self._validator = compile_validator(self)
+        return self._validator
+
+
+    def is_valid(self, obj):
+        """ Checks whether an object passes the validation of all the
+        properties of this model, without building any error message.
+
+        :param obj: The object to check.
+        :type obj: object
+        :rtype: bool
+        """
+        return self.get_validator().is_valid(obj)
+
+
+    def _reset_compiled(self):
+        """ Forgets the hydrators, the record class and the validator, after
+        the model changed.
+
+        :returns: This object itself.
+        :rtype: graphalchemy.blueprints.schema.Model
+        """
+        self._hydrator = None
+        self._record_class = None
+        self._record_hydrator = None
+        self._validator = None
         return self
 
 
@@ -151,6 +250,7 @@ class Node(Model):
         :rtype: graphalchemy.blueprints.schema.Node
         """
         self.class_ = class_
+        self._reset_compiled()
         self.metadata.bind_node(class_, self)
         return self
 
@@ -190,6 +290,8 @@ class Node(Model):
             direction = Relationship.IN
 
         setattr(self.class_, name, RelationProxy(adjacency, direction, name))
+        self._record_class = None
+        self._record_hydrator = None
         return self
 
 
@@ -206,6 +308,10 @@ class RelationDict(dict):
 
     This class overloads the classic dictionary representation in order to allow
     to easily add adjacent vertices and update the corresponding edges.
+
+    The relations of a persisted node are loaded from the database on first
+    read, through the session of the node, according to the loading strategy
+    of the adjacency. Relations added in memory before are kept.
     """
 
     def __init__(self, adjacency, direction, parent):
@@ -218,6 +324,8 @@ class RelationDict(dict):
         else:
             self.__directref = adjacency.in_method
             self.__backref = adjacency.out_method
+        # New nodes have no relation in the database
+        self.__loaded = getattr(getattr(parent, '__ga_state', None), 'id', None) is None
 
     def append(self, node):
         """ Allows a list-like behavior like :
@@ -247,12 +355,132 @@ class RelationDict(dict):
         else:
             relationship.outV = node
             relationship.inV = self.__parent
-        # Reverse side
+        # Reverse side, without loading it
         reverse = getattr(node, self.__backref)
-        if relationship not in reverse:
+        if not dict.__contains__(reverse, relationship):
             # (prevents infinite loop)
             reverse[relationship] = self.__parent
 
+    def is_loaded(self):
+        """ :returns: Whether the relations in the database are known.
+        :rtype: bool
+        """
+        return self.__loaded
+
+    def invalidate(self):
+        """ Forgets the relations loaded from the database, so that they are
+        loaded again on next read. Relations that are not persisted yet are
+        kept.
+
+        :returns: This object itself.
+        :rtype: graphalchemy.blueprints.schema.RelationDict
+        """
+        for relationship in dict.keys(self):
+            if getattr(relationship, 'id', None) is not None:
+                dict.__delitem__(self, relationship)
+        self.__loaded = getattr(getattr(self.__parent, '__ga_state', None), 'id', None) is None
+        return self
+
+    def _accepts(self, relationship):
+        """ :returns: Whether an edge belongs to the adjacency of this
+        dictionary.
+        :rtype: bool
+        """
+        return isinstance(relationship, self.__adjacency.relationship.class_)
+
+    def _fill(self, relations):
+        """ Sets the relations loaded from the database, and marks this
+        dictionary as loaded.
+
+        :param relations: The edges and the adjacent nodes.
+        :type relations: list<tuple>
+        """
+        for relationship, node in relations:
+            super(RelationDict, self).__setitem__(relationship, node)
+            if self.__direction == Relationship.OUT:
+                relationship.outV = self.__parent
+                relationship.inV = node
+            else:
+                relationship.outV = node
+                relationship.inV = self.__parent
+        self.__loaded = True
+        return self
+
+    def _load(self):
+        """ Loads the relations from the database if they are not known,
+        according to the loading strategy of the adjacency.
+        """
+        if self.__loaded:
+            return self
+        loading = self.__adjacency.loading
+        if loading == Adjacency.NOLOAD:
+            return self
+        state = getattr(self.__parent, '__ga_state', None)
+        session = getattr(state, 'session', None)
+        if loading == Adjacency.RAISE or session is None:
+            if loading == Adjacency.RAISE:
+                raise Exception('Relation '+str(self.__directref)+' is not loaded.')
+            # Objects out of a session cannot load anything
+            return self
+        session.load_relation(self.__parent, self.__directref)
+        return self
+
+    # Reads load the relations first
+
+    def __getitem__(self, relationship):
+        return super(RelationDict, self._load()).__getitem__(relationship)
+
+    def __delitem__(self, relationship):
+        return super(RelationDict, self._load()).__delitem__(relationship)
+
+    def __contains__(self, relationship):
+        return super(RelationDict, self._load()).__contains__(relationship)
+
+    def __iter__(self):
+        return super(RelationDict, self._load()).__iter__()
+
+    def __len__(self):
+        return super(RelationDict, self._load()).__len__()
+
+    def __eq__(self, other):
+        return super(RelationDict, self._load()).__eq__(other)
+
+    def __ne__(self, other):
+        return super(RelationDict, self._load()).__ne__(other)
+
+    def __repr__(self):
+        return super(RelationDict, self._load()).__repr__()
+
+    def get(self, relationship, default=None):
+        return super(RelationDict, self._load()).get(relationship, default)
+
+    def has_key(self, relationship):
+        return self.__contains__(relationship)
+
+    def keys(self):
+        return super(RelationDict, self._load()).keys()
+
+    def values(self):
+        return super(RelationDict, self._load()).values()
+
+    def items(self):
+        return super(RelationDict, self._load()).items()
+
+    def iterkeys(self):
+        return super(RelationDict, self._load()).iterkeys()
+
+    def itervalues(self):
+        return super(RelationDict, self._load()).itervalues()
+
+    def iteritems(self):
+        return super(RelationDict, self._load()).iteritems()
+
+    def pop(self, *args):
+        return super(RelationDict, self._load()).pop(*args)
+
+    def copy(self):
+        return dict(self.iteritems())
+
 
 class RelationProxy(object):
     """ Proxy that allows us to dynamically create a RelationShip dict
@@ -266,6 +494,8 @@ class RelationProxy(object):
         self.direction = direction
 
     def __get__(self, instance, owner):
+        if instance is None:
+            return self
         attr_name = "__ga_adj_"+self.name
         if not hasattr(instance, attr_name):
             adjacency = RelationDict(self.adjacency, self.direction, instance)
@@ -273,6 +503,52 @@ class RelationProxy(object):
         return getattr(instance, attr_name)
 
 
+def iter_relations(obj):
+    """ Iterates over the relation dictionaries that were created on a node,
+    without loading them.
+
+    :param obj: The node.
+    :type obj: object
+    :returns: The relation dictionaries.
+    :rtype: generator<graphalchemy.blueprints.schema.RelationDict>
+    """
+    for name, value in getattr(obj, '__dict__', {}).items():
+        if name.startswith('__ga_adj_'):
+            yield value
+
+
+def discard_relationship(relationship):
+    """ Removes an edge from the relation dictionaries of its ends, typically
+    after it was deleted, without loading them.
+
+    :param relationship: The edge.
+    :type relationship: object
+    """
+    for end in (getattr(relationship, 'outV', None), getattr(relationship, 'inV', None)):
+        for relation in iter_relations(end):
+            if dict.__contains__(relation, relationship):
+                dict.__delitem__(relation, relationship)
+
+
+def expire_relations(obj):
+    """ Invalidates the relation dictionaries that an element may affect,
+    after it changed in the database without them : those of the ends of an
+    edge, or those of the neighbours of a node.
+
+    :param obj: The edge or the node.
+    :type obj: object
+    """
+    if hasattr(obj, 'outV') or hasattr(obj, 'inV'):
+        relationships = [obj]
+    else:
+        relationships = [relationship for relation in iter_relations(obj) for relationship in dict.keys(relation)]
+    for relationship in relationships:
+        for end in (getattr(relationship, 'outV', None), getattr(relationship, 'inV', None)):
+            for relation in iter_relations(end):
+                if relation._accepts(relationship):
+                    relation.invalidate()
+
+
 
 class Relationship(Model):
     """ Defines a model over an edge, by specifying its properties.
@@ -328,6 +604,7 @@ class Relationship(Model):
         :rtype: graphalchemy.blueprints.schema.Model
         """
         self.class_ = class_
+        self._reset_compiled()
         self.metadata.bind_relationship(class_, self)
 
 
@@ -384,7 +661,15 @@ class Adjacency(object):
     relationship connects.
     """
 
-    def __init__(self, out_node, relationship, in_node, nullable=None, unique=True):
+    # Strategies to load the relations of a persisted node : on first read,
+    # along with the node, never, or raising an error unless they are loaded
+    # explicitly.
+    LAZY = 'lazy'
+    EAGER = 'eager'
+    NOLOAD = 'noload'
+    RAISE = 'raise'
+
+    def __init__(self, out_node, relationship, in_node, nullable=None, unique=True, loading=LAZY):
         """ Defines the constraints to apply on an adjacency.
 
         :param in_node: The node model from which the relationship emerges.
@@ -401,7 +686,12 @@ class Adjacency(object):
         :type nullable: bool
         :param direction: Whether the relation is IN-bound, or OUT-bound.
         :type direction: const
+        :param loading: How the relations of persisted nodes are loaded from
+        the database : Adjacency.LAZY, EAGER, NOLOAD or RAISE.
+        :type loading: str
         """
+        if loading not in (self.LAZY, self.EAGER, self.NOLOAD, self.RAISE):
+            raise Exception('Unknown loading strategy : '+str(loading))
         self.in_node = in_node
         self.in_method = None
         self.out_node = out_node
@@ -409,6 +699,7 @@ class Adjacency(object):
         self.relationship = relationship
         self.unique = unique
         self.nullable = nullable
+        self.loading = loading
 
 
 
@@ -516,6 +807,30 @@ class Property(object):
         return self.type.to_db(value)
 
 
+    def to_py_many(self, values):
+        """ Casts a sequence of database values to their correct type in
+        Python. See graphalchemy.blueprints.types.Type.to_py_many().
+
+        :param values: The values to cast.
+        :type values: list | numpy.ndarray
+        :returns: The casted values.
+        :rtype: list | numpy.ndarray
+        """
+        return self.type.to_py_many(values)
+
+
+    def to_db_many(self, values):
+        """ Casts a sequence of python values to their correct type in the
+        database. See graphalchemy.blueprints.types.Type.to_db_many().
+
+        :param values: The values to cast.
+        :type values: list | numpy.ndarray
+        :returns: The casted values.
+        :rtype: list
+        """
+        return self.type.to_db_many(values)
+
+
     def validate(self, value):
         """ Validates a value given the property specifications. Returns False
         and a list of errors if it fails.
@@ -525,12 +840,57 @@ class Property(object):
         :returns: A boolean and a list of potential errors.
         :rtype: bool, list
         """
-        if self.nullable == False \
-        and value is None:
-            return False, [u'Property is not nullable.']
+        if value is None:
+            if self.nullable == False:
+                return False, [u'Property is not nullable.']
+            return True, []
         return self.type.validate(value)
 
 
+    def validate_many(self, values, present=None):
+        """ Validates a whole column of values given the property
+        specifications, with vectorized operations where possible. See
+        graphalchemy.blueprints.types.Type.validate_many().
+
+        :param values: The values to validate.
+        :type values: list | numpy.ndarray
+        :param present: The mask of the values that are not null, as built by
+        graphalchemy.ogm.query.to_array(). Defaults to the values that are not
+        None.
+        :type present: numpy.ndarray
+        :returns: The mask of the valid values.
+        :rtype: numpy.ndarray
+        """
+        if numpy is None:
+            raise Exception('validate_many() requires numpy.')
+        if not isinstance(values, numpy.ndarray):
+            array = numpy.empty(len(values), dtype=object)
+            array[:] = values
+            values = array
+        if present is None:
+            if values.dtype == object:
+                present = numpy.fromiter((value is not None for value in values), dtype=bool, count=len(values))
+            else:
+                present = numpy.ones(len(values), dtype=bool)
+        valid = ~present if self.nullable != False else numpy.zeros(len(values), dtype=bool)
+        if not present.any():
+            return valid
+
+        class_ = type(self.type)
+        method = self.type.validate_many
+        if not issubclass(defining_class(class_, 'validate_many'), defining_class(class_, 'validate')):
+            # The type validates values in a way its vectorized version ignores
+            method = lambda values: Type.validate_many.im_func(self.type, values)
+        if not present.all():
+            values = values[present]
+        # Objects are converted to a proper dtype when possible, now that the
+        # nulls are gone
+        if values.dtype == object:
+            values = _narrow(values)
+        valid[present] = method(values)
+        return valid
+
+
     def __repr__(self):
         """ :returns: A readable representation of the property.
         :rtype: str
@@ -539,10 +899,266 @@ class Property(object):
 
 
 
+def _narrow(values):
+    """ Converts an array of objects to an array of the dtype NumPy infers
+    from the values, when they all are numbers, booleans or strings of the
+    same kind, for vectorized validation.
+
+    :param values: The values, none of them being None.
+    :type values: numpy.ndarray
+    :returns: The converted array, or the given one.
+    :rtype: numpy.ndarray
+    """
+    kinds = set([type(value) for value in values.tolist()])
+    if len(kinds) == 1 and kinds.pop() in (int, float, bool, str, unicode):
+        return numpy.array(values.tolist())
+    return values
+
+
 # ==============================================================================
 #                                    SERVICES
 # ==============================================================================
 
+# ==============================================================================
+#                                     HYDRATION
+# ==============================================================================
+
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def compile_hydrator(model, class_, record=False):
+    """ Generates the function that builds an object of a model from a
+    database row. The row is read once, key by key, and the converters of the
+    properties are bound directly to the function. Properties whose type does
+    not convert values are assigned as is.
+
+    The generated function takes a row without its model name and type, and
+    returns the object. It raises an Exception if the row holds a property that
+    the model does not define. Objects are built without calling their
+    constructor, which may require arguments, and the properties missing from
+    the row are None.
+
+    :param model: The model of the objects.
+    :type model: graphalchemy.blueprints.schema.Model
+    :param class_: The class mapped to the model, or its record class.
+    :type class_: object
+    :param record: Whether class_ is a record class, see compile_record_class().
+    Records are filled through their slots.
+    :type record: bool
+    :returns: The hydrator.
+    :rtype: callable
+    """
+    def unknown(row):
+        for key in row:
+            if key != '_id' and key not in model_keys:
+                raise Exception('Property retrieved but not found : '+key)
+
+    def assign(name, value):
+        if record:
+            namespace['set_'+name] = getattr(class_, name).__set__
+            return 'set_'+name+'(obj, '+value+')'
+        if IDENTIFIER.match(name):
+            return 'obj.'+name+' = '+value
+        return 'setattr(obj, '+repr(name)+', '+value+')'
+
+    model_keys = set()
+    namespace = {'class_': class_, 'unknown': unknown, 'new': class_.__new__}
+    lines = [
+        'def hydrate(row):',
+        '    obj = new(class_)',
+        '    found = 0',
+        '    if "_id" in row:',
+        '        '+assign('id', 'row["_id"]'),
+        '        found += 1',
+        '    else:',
+        '        '+assign('id', 'None'),
+    ]
+    for i, prop in enumerate(sorted(model._properties.values(), key=attrgetter('name_db'))):
+        model_keys.add(prop.name_db)
+        if type(prop.type).to_py.im_func is Type.to_py.im_func:
+            value = 'value'
+        else:
+            namespace['to_py_'+str(i)] = prop.type.to_py
+            value = 'None if value is None else to_py_'+str(i)+'(value)'
+        lines.extend([
+            '    if '+repr(prop.name_db)+' in row:',
+            '        value = row['+repr(prop.name_db)+']',
+            '        '+assign(prop.name_py, value),
+            '        found += 1',
+        ])
+        # No constructor gives a default value
+        lines.extend([
+            '    else:',
+            '        '+assign(prop.name_py, 'None'),
+        ])
+    lines.extend([
+        '    if found != len(row):',
+        '        unknown(row)',
+        '    return obj',
+    ])
+    kind = 'record' if record else 'hydrator'
+    exec model.metadata._compile(kind, model, '\n'.join(lines)) in namespace
+    return namespace['hydrate']
+
+
+class Record(object):
+    """ Base class of the compact, read-only records that read-only queries
+    hydrate instead of mapped objects. Records only hold the id and the
+    properties of an element in slots : they have no relations, and are not
+    tracked by the session. They can be promoted to mapped objects.
+
+    Example use :
+    >>> pages = repository.filter().read_only().all()
+    >>> page = pages[0].promote(session)
+    >>> page.isHostedBy
+    """
+
+    __slots__ = ()
+
+    # The model of the record, set on generated classes
+    _model = None
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Records are read-only, promote() them first.')
+
+    def __delattr__(self, name):
+        raise AttributeError('Records are read-only, promote() them first.')
+
+    def to_dict(self):
+        """ :returns: The id and the properties of the record, by name.
+        :rtype: dict
+        """
+        return dict([(name, getattr(self, name)) for name in self.__slots__])
+
+    def promote(self, session):
+        """ Converts this record into an object of the mapped class, tracked
+        by the given session.
+
+        :param session: The session to track the object in.
+        :type session: graphalchemy.ogm.session.Session
+        :returns: The mapped object.
+        :rtype: object
+        """
+        return session.promote(self)
+
+    def __repr__(self):
+        return '<'+self.__class__.__name__+' '+str(getattr(self, 'id', None))+'>'
+
+
+def compile_record_class(model):
+    """ Generates the record class of a model, with a slot for the id and for
+    each of its properties. Its adjacencies raise an error, since records
+    have no relations.
+
+    :param model: The model of the records.
+    :type model: graphalchemy.blueprints.schema.Model
+    :returns: A subclass of graphalchemy.blueprints.schema.Record.
+    :rtype: type
+    """
+    def relation(name):
+        def get(self):
+            raise AttributeError('Records have no relation '+name+', promote() them first.')
+        return property(get)
+
+    slots = ['id']
+    for name_py in sorted(model._properties.keys()):
+        if not IDENTIFIER.match(name_py):
+            raise Exception('Cannot build a record with property '+name_py)
+        slots.append(str(name_py))
+    attributes = {'__slots__': tuple(slots), '_model': model}
+    if model.is_node():
+        for name in model._adjacencies.keys():
+            attributes[name] = relation(name)
+    name = IDENTIFIER.match(model.model_name) and str(model.model_name) or 'Model'
+    return type(name+'Record', (Record, ), attributes)
+
+
+
+# ==============================================================================
+#                                     VALIDATION
+# ==============================================================================
+
+def compile_validator(model, dicts=False):
+    """ Generates the function that validates an object of a model. All the
+    properties are checked in a single pass, with the checks of their type
+    inlined : nullability, type, range, size and choices. Error messages are
+    only built for the properties that fail, by their validate() method.
+
+    The generated function takes an object, and returns a boolean stating if
+    it is valid and the lists of errors by property name. It holds a
+    validate.is_valid(obj) function that only returns the boolean.
+
+    :param model: The model of the objects.
+    :type model: graphalchemy.blueprints.schema.Model
+    :param dicts: Whether the validator takes dictionaries of the values by
+    property name instead of objects. Missing values are None.
+    :type dicts: bool
+    :returns: The validator.
+    :rtype: callable
+    """
+    def bind(constant):
+        name = '_'+str(len(namespace))
+        namespace[name] = constant
+        return name
+
+    namespace = {}
+    checks = []
+    for prop in sorted(model._properties.values(), key=attrgetter('name_py')):
+        class_ = type(prop.type)
+        if defining_class(class_, 'invalid_expression') is defining_class(class_, 'validate'):
+            expression = prop.type.invalid_expression('value', bind)
+        else:
+            # The type validates values in a way its expression ignores
+            expression = Type.invalid_expression.im_func(prop.type, 'value', bind)
+        if prop.nullable == False:
+            if expression is None:
+                expression = 'value is None'
+            else:
+                expression = 'value is None or '+expression
+        elif expression is not None:
+            expression = 'value is not None and ('+expression+')'
+        if expression is None:
+            continue
+        if dicts:
+            read = 'obj.get('+repr(prop.name_py)+')'
+        elif IDENTIFIER.match(prop.name_py):
+            read = 'obj.'+prop.name_py
+        else:
+            read = 'getattr(obj, '+repr(prop.name_py)+')'
+        checks.append((bind(prop), prop.name_py, read, expression))
+
+    lines = ['def is_valid(obj):']
+    for _, _, read, expression in checks:
+        lines.extend([
+            '    value = '+read,
+            '    if '+expression+':',
+            '        return False',
+        ])
+    lines.extend([
+        '    return True',
+        'def validate(obj):',
+        '    errors = None',
+    ])
+    for prop, name_py, read, expression in checks:
+        lines.extend([
+            '    value = '+read,
+            '    if '+expression+':',
+            '        if errors is None:',
+            '            errors = {}',
+            '        errors['+repr(name_py)+'] = '+prop+'.validate(value)[1]',
+        ])
+    lines.extend([
+        '    if errors is None:',
+        '        return True, {}',
+        '    return False, errors',
+        'validate.is_valid = is_valid',
+    ])
+    kind = 'dict_validator' if dicts else 'validator'
+    exec model.metadata._compile(kind, model, '\n'.join(lines)) in namespace
+    return namespace['validate']
+
+
+
 class MetaData(object):
     """ Holds a map of all available metadata of all mapped models. Contains a
     set of helper methods to allow fast retrieval of mappings.
@@ -556,6 +1172,25 @@ class MetaData(object):
         self._relationships = {}
         self.bind = bind
 
+        # Lookup tables, maintained by bind_node() and bind_relationship()
+        self._classes = {}
+        self._nodes_by_model_name = {}
+        self._relationships_by_model_name = {}
+        self._nodes_by_storage_key = {}
+        self._relationships_by_storage_key = {}
+        self._node_storage_keys = []
+        self._relationship_storage_keys = []
+
+        # Code generated for the models, by kind and model name, with its
+        # source, and the directory it is cached in. See freeze().
+        self._code = {}
+        self.cache_dir = None
+        self.frozen = False
+
+        # Modules of the models that are imported on first use, by model name.
+        # See defer().
+        self._deferred = {}
+
     def for_object(self, obj):
         """ Returns the model corresponding to a given Python object.
 
@@ -576,24 +1211,33 @@ class MetaData(object):
         :rtype: graphalchemy.blueprints.schema.Model
         :raises: Exception if the given class has no model.
         """
-        if class_ in self._nodes.keys():
-            return self._nodes[class_]
-        if class_ in self._relationships.keys():
-            return self._relationships[class_]
+        model = self._nodes.get(class_, None)
+        if model is not None:
+            return model
+        model = self._relationships.get(class_, None)
+        if model is not None:
+            return model
+        # The class may come from the module of a deferred model
+        if self._load_deferred_module(class_.__module__):
+            return self.for_class(class_)
         raise Exception('Unmapped class.')
 
     def for_model_name(self, model_name):
-        """ Returns the Python class corresponding to a given model.
+        """ Returns the model corresponding to a given model name.
 
-        :param model: A graphalchemy model.
-        :type model: str
-        """
-        for class_, node_model in self._nodes.items():
-            if model_name == node_model.model_name:
-                return node_model
-        for class_, relationship_model in self._relationships.items():
-            if model_name == relationship_model.model_name:
-                return node_model
+        :param model_name: The name of a graphalchemy model.
+        :type model_name: str
+        :returns: The corresponding model.
+        :rtype: graphalchemy.blueprints.schema.Model
+        """
+        model = self._nodes_by_model_name.get(model_name, None)
+        if model is not None:
+            return model
+        model = self._relationships_by_model_name.get(model_name, None)
+        if model is not None:
+            return model
+        if self._load_deferred(model_name):
+            return self.for_model_name(model_name)
         raise Exception('Unmapped model.')
 
 
@@ -603,33 +1247,280 @@ class MetaData(object):
         :param model: A graphalchemy model.
         :type model: graphalchemy.blueprints.schema.Model
         """
-        for class_, node_model in self._nodes.items():
-            if model is node_model:
-                return class_
-        for class_, relationship_model in self._relationships.items():
-            if model is relationship_model:
-                return class_
+        class_ = self._classes.get(model, None)
+        if class_ is not None:
+            return class_
         raise Exception('Unmapped model.')
 
     def for_dict(self, model_dict):
-        """ Iterates over the models in order to find the model for a given
-        dictionary.
+        """ Finds the model for a given dictionary, from the model name it
+        holds under the storage key of the models.
 
         :param model_dict: The dictionary to find a model for.
         :type model_dict: dict
         :returns: The corresponding model or None if not found.
         :rtype: graphalchemy.blueprints.schema.Model | None
         """
-        for class_, node_model in self._nodes.items():
-            if model_dict.get(node_model.model_name_storage_key, None) \
-            == node_model.model_name:
-                return node_model
-        for class_, relationship_model in self._relationships.items():
-            if model_dict.get(relationship_model.model_name_storage_key, None) \
-            == relationship_model.model_name:
-                return relationship_model
+        for key in self._node_storage_keys:
+            model = self._nodes_by_storage_key.get((key, model_dict.get(key, None)), None)
+            if model is not None:
+                return model
+        # Rexster returns the label of edges under the _label key
+        label = model_dict.get('_label', None)
+        for key in self._relationship_storage_keys:
+            model = self._relationships_by_storage_key.get((key, model_dict.get(key, label)), None)
+            if model is not None:
+                return model
+        # The model may not be imported yet
+        if self._deferred:
+            model_names = (
+                model_dict.get(Node.model_name_storage_key, None),
+                model_dict.get(Relationship.model_name_storage_key, label)
+            )
+            for model_name in model_names:
+                if self._load_deferred(model_name):
+                    return self.for_dict(model_dict)
         return None
 
+    def merge(self, other):
+        """ Registers all the models of another metadata map in this one. The
+        models are moved to this metadata, so that the code generated for them
+        is cached along with the other models.
+
+        Example use :
+        >>> metadata = MetaData()
+        >>> metadata.merge(blog.metadata).merge(shop.metadata)
+
+        :param other: The metadata map to merge.
+        :type other: graphalchemy.blueprints.schema.Metadata
+        :returns: This object itself.
+        :rtype: graphalchemy.blueprints.schema.Metadata
+        :raises: Exception if a model name is already used by another model.
+        """
+        if other is self:
+            return self
+        for class_, model in other._nodes.items() + other._relationships.items():
+            known = self._nodes_by_model_name.get(model.model_name, None) \
+                or self._relationships_by_model_name.get(model.model_name, None)
+            if known is model:
+                continue
+            if known is not None:
+                raise Exception('Model '+model.model_name+' is already defined.')
+            if model.is_node():
+                self.bind_node(class_, model)
+            else:
+                self.bind_relationship(class_, model)
+            model.metadata = self
+        for model_name, module_path in other._deferred.iteritems():
+            self._deferred.setdefault(model_name, module_path)
+        return self
+
+    def defer(self, model_name, module_path):
+        """ Declares the module of a model, which is only imported when the
+        model is first looked up by name or met in a database result. Its
+        metadata is then merged in this one.
+
+        Example use :
+        >>> metadata.defer('Website', 'myapp.models.website')
+
+        :param model_name: The name of the model.
+        :type model_name: str
+        :param module_path: The dotted path of the module, which holds the
+        model in a module-level 'metadata' variable.
+        :type module_path: str
+        :returns: This object itself.
+        :rtype: graphalchemy.blueprints.schema.Metadata
+        """
+        if self.frozen:
+            raise Exception('Cannot defer a model in a frozen metadata.')
+        self._deferred[model_name] = module_path
+        return self
+
+    def load(self, module_path):
+        """ Imports a module of models and merges its metadata in this one.
+
+        :param module_path: The dotted path of the module, which holds its
+        models in a module-level 'metadata' variable.
+        :type module_path: str
+        :returns: This object itself.
+        :rtype: graphalchemy.blueprints.schema.Metadata
+        """
+        module = importlib.import_module(module_path)
+        metadata = module.__dict__.get('metadata', None)
+        if metadata is None:
+            raise Exception('Module '+module_path+' has no metadata.')
+        return self.merge(metadata)
+
+    def _load_deferred(self, model_name):
+        """ Imports the module of a deferred model.
+
+        :param model_name: The name of the model.
+        :type model_name: str
+        :returns: True if a module was imported.
+        :rtype: bool
+        """
+        module_path = self._deferred.pop(model_name, None)
+        if module_path is None:
+            return False
+        self._load_frozen(module_path)
+        return True
+
+    def _load_deferred_module(self, module_path):
+        """ Imports a module holding deferred models.
+
+        :param module_path: The dotted path of the module.
+        :type module_path: str
+        :returns: True if the module was imported.
+        :rtype: bool
+        """
+        model_names = [model_name for model_name, path in self._deferred.iteritems() if path == module_path]
+        if not len(model_names):
+            return False
+        for model_name in model_names:
+            del self._deferred[model_name]
+        self._load_frozen(module_path)
+        return True
+
+    def _load_frozen(self, module_path):
+        """ Imports a module of deferred models, which can still be bound
+        once this metadata is frozen.
+
+        :param module_path: The dotted path of the module.
+        :type module_path: str
+        :returns: This object itself.
+        :rtype: graphalchemy.blueprints.schema.Metadata
+        """
+        frozen, self.frozen = self.frozen, False
+        try:
+            return self.load(module_path)
+        finally:
+            self.frozen = frozen
+
+    def freeze(self, cache_dir=None):
+        """ Prevents any further binding or model change, except for the
+        deferred models. Nothing is compiled here : the hydrators, record
+        classes and validators of each model are still compiled on first use.
+
+        Given a cache directory, the code generated for a model is marshalled
+        there on first use, in a file named after the fingerprint of the
+        model, so that later starts load it instead of compiling it.
+
+        Example use :
+        >>> metadata.freeze(cache_dir='/var/cache/graphalchemy')
+
+        :param cache_dir: The directory of the cache, or None.
+        :type cache_dir: str
+        :returns: This object itself.
+        :rtype: graphalchemy.blueprints.schema.Metadata
+        """
+        self.cache_dir = cache_dir
+        self.frozen = True
+        return self
+
+
+    def fingerprint(self):
+        """ Computes a fingerprint of the schema : the models, their
+        properties with the parameters of their types, and their adjacencies.
+
+        :returns: The fingerprint.
+        :rtype: str
+        """
+        models = self._nodes.values() + self._relationships.values()
+        models = sorted(models, key=lambda model: (model.model_type, model.model_name))
+        description = [self._describe_model(model) for model in models]
+        return hashlib.sha1(repr(description)).hexdigest()
+
+
+    def _describe_model(self, model):
+        """ :returns: A description of everything the code generated for a
+        model depends on.
+        :rtype: tuple
+        """
+        def describe_type(type_):
+            class_ = type_.__class__
+            return (class_.__module__, class_.__name__, sorted(vars(type_).items()))
+
+        def describe_property(prop):
+            return (prop.name_py, prop.name_db, describe_type(prop.type), prop.nullable)
+
+        def describe_adjacency(name, adjacency):
+            return (name, adjacency.out_node.model_name, adjacency.relationship.model_name, adjacency.in_node.model_name)
+
+        return (
+            model.model_type,
+            model.model_name,
+            model.model_name_storage_key,
+            sorted([describe_property(prop) for prop in model._properties.itervalues()]),
+            sorted([describe_adjacency(name, adjacency) for name, adjacency in model._adjacencies.iteritems()]),
+        )
+
+
+    def _compile(self, kind, model, source):
+        """ Compiles the code generated for a model, unless the same source was
+        compiled already or is in the cache directory.
+
+        :param kind: The kind of code, for instance 'hydrator'.
+        :type kind: str
+        :param model: The model.
+        :type model: graphalchemy.blueprints.schema.Model
+        :param source: The generated source.
+        :type source: str
+        :returns: The code object.
+        :rtype: code
+        """
+        key = (kind, model.model_name)
+        cached = self._code.get(key, None)
+        if cached is not None and cached[0] == source:
+            return cached[1]
+        path = None
+        if self.cache_dir is not None:
+            name = hashlib.sha1(repr((sys.version_info[:2], kind, self._describe_model(model)))).hexdigest()
+            path = os.path.join(self.cache_dir, 'graphalchemy-'+name+'.cache')
+            cached = self._load_code(path)
+            # The source is compared anyway, as it depends on the code of
+            # graphalchemy as well
+            if cached is not None and cached[0] == source:
+                self._code[key] = cached
+                return cached[1]
+        code = compile(source, '<'+kind+' '+model.model_name+'>', 'exec')
+        self._code[key] = (source, code)
+        if path is not None:
+            self._dump_code(path, (source, code))
+        return code
+
+
+    def _load_code(self, path):
+        """ Loads generated code cached in a file.
+
+        :returns: The source and the code object, or None if the file does
+        not exist or cannot be read.
+        :rtype: tuple
+        """
+        try:
+            with open(path, 'rb') as handle:
+                cached = marshal.load(handle)
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(cached, tuple) or len(cached) != 2:
+            return None
+        return cached
+
+
+    def _dump_code(self, path, cached):
+        """ Writes generated code in a cache file. The file is replaced
+        atomically, since several processes may start at the same time.
+        """
+        temporary = path+'.'+str(os.getpid())
+        try:
+            with open(temporary, 'wb') as handle:
+                marshal.dump(cached, handle)
+            os.rename(temporary, path)
+        except (IOError, OSError):
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        return self
+
+
     def bind_node(self, class_, model):
         """ Registers the given model in this metadata map by binding it to
         its corresponding class.
@@ -639,9 +1530,16 @@ class MetaData(object):
         :returns: This object itself.
         :rtype: graphalchemy.blueprints.schema.Metadata
         """
+        if self.frozen:
+            raise Exception('Cannot bind a model to a frozen metadata.')
         if not model.is_node():
             raise Exception('Bound model is not a node !')
         self._nodes[class_] = model
+        self._classes[model] = class_
+        self._nodes_by_model_name[model.model_name] = model
+        self._nodes_by_storage_key[(model.model_name_storage_key, model.model_name)] = model
+        if model.model_name_storage_key not in self._node_storage_keys:
+            self._node_storage_keys.append(model.model_name_storage_key)
         return self
 
     def bind_relationship(self, class_, model):
@@ -653,9 +1551,16 @@ class MetaData(object):
         :returns: This object itself.
         :rtype: graphalchemy.blueprints.schema.Metadata
         """
+        if self.frozen:
+            raise Exception('Cannot bind a model to a frozen metadata.')
         if not model.is_relationship():
             raise Exception('Bound model is not a relationship !')
         self._relationships[class_] = model
+        self._classes[model] = class_
+        self._relationships_by_model_name[model.model_name] = model
+        self._relationships_by_storage_key[(model.model_name_storage_key, model.model_name)] = model
+        if model.model_name_storage_key not in self._relationship_storage_keys:
+            self._relationship_storage_keys.append(model.model_name_storage_key)
         return self
 
     def is_node(self, obj):
@@ -666,6 +1571,8 @@ class MetaData(object):
         :type obj: object
         :rtype: boolean
         """
+        if obj.__class__ not in self._nodes and obj.__class__ not in self._relationships:
+            self._load_deferred_module(obj.__class__.__module__)
         return obj.__class__ in self._nodes
 
     def is_relationship(self, obj):
@@ -710,33 +1617,48 @@ class MetaData(object):
         if model is None:
             return None
         # Remove item for field validation
-        dict_.pop(model.model_name_storage_key)
+        dict_.pop(model.model_name_storage_key, None)
 
         # Verify type
         _type = dict_.pop('_type')
-        # self._check_type(_type)
+
+        # Remove edge ends, they are not properties
+        if _type == 'edge':
+            for key in ('_label', '_outV', '_inV'):
+                dict_.pop(key, None)
 
         # Build object
-        class_ = self.for_model(model)
-        obj = class_(dict_)
-        self._update_object(obj, dict_, model)
-        # obj.id = id
-        return obj
+        return model.get_hydrator()(dict_)
+
 
+    def _objects_from_dicts(self, dicts, records=False):
+        """ Builds the objects of a whole result list. Rows of models that are
+        not mapped give None.
 
-    def _update_object(self, obj, results, model):
-        for property_db, value_db in results.iteritems():
-            if property_db == '_id':
-                setattr(obj, 'id', value_db)
+        :param dicts: The database rows, modified in place.
+        :type dicts: list<dict>
+        :param records: Whether to build read-only records instead of mapped
+        objects.
+        :type records: bool
+        :returns: The objects, in the same order.
+        :rtype: list<object>
+        """
+        hydrators = {}
+        objs = []
+        for dict_ in dicts:
+            model = self.for_dict(dict_)
+            if model is None:
+                objs.append(None)
                 continue
-            found = False
-            for property in model._properties.values():
-                if property.name_db != property_db:
-                    continue
-                found = True
-                break
-            if not found:
-                raise Exception('Property retrieved but not found : '+property_db)
-            value_py = property.to_py(value_db)
-            setattr(obj, property.name_py, value_py)
-        return obj
+            dict_.pop(model.model_name_storage_key, None)
+            if dict_.pop('_type') == 'edge':
+                for key in ('_label', '_outV', '_inV'):
+                    dict_.pop(key, None)
+            hydrator = hydrators.get(model, None)
+            if hydrator is None:
+                if records:
+                    hydrator = hydrators[model] = model.get_record_hydrator()
+                else:
+                    hydrator = hydrators[model] = model.get_hydrator()
+            objs.append(hydrator(dict_))
+        return objs
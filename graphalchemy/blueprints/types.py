@@ -8,6 +8,11 @@
 from datetime import datetime
 from datetime import date
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 # ==============================================================================
 #                                    EXTENSIONS
@@ -25,6 +30,9 @@ class Type(object):
     # https://code.google.com/p/kryo/#Default_serializers
     name_db = None
 
+    # The NumPy dtype of columns of values of this type, or None for objects
+    dtype = None
+
     def to_py(self, value):
         """ Coerces the value to the appropriate python type.
 
@@ -41,6 +49,65 @@ class Type(object):
         """
         return value
 
+    def to_py_many(self, values):
+        """ Coerces a sequence of values to the appropriate python type, as
+        to_py() would one by one. None values are kept.
+
+        NumPy arrays give arrays, cast at once to the dtype of the Type when
+        possible, or holding the coerced objects otherwise.
+
+        :param values: The values to coerce.
+        :type values: list | numpy.ndarray
+        :returns: The coerced values.
+        :rtype: list | numpy.ndarray
+        """
+        identity = type(self).to_py.im_func is Type.to_py.im_func
+        return self._map_many(self.to_py, values, identity=identity)
+
+    def to_db_many(self, values):
+        """ Coerces a sequence of values to the appropriate database type, as
+        to_db() would one by one. None values are kept. NumPy arrays give
+        lists, since database values are sent as JSON.
+
+        :param values: The values to coerce.
+        :type values: list | numpy.ndarray
+        :returns: The coerced values.
+        :rtype: list
+        """
+        identity = type(self).to_db.im_func is Type.to_db.im_func
+        if numpy is not None and isinstance(values, numpy.ndarray):
+            values = values.tolist()
+        return self._map_many(self.to_db, values, identity=identity)
+
+    def _map_many(self, function, values, identity=False):
+        """ Applies a coercion function to a sequence of values, skipping the
+        None values. Builtins such as float() are applied without any Python
+        level call.
+
+        :param function: The coercion function.
+        :type function: callable
+        :param values: The values to coerce.
+        :type values: list | numpy.ndarray
+        :param identity: Whether the function leaves the values unchanged.
+        :type identity: bool
+        :returns: The coerced values.
+        :rtype: list | numpy.ndarray
+        """
+        if numpy is not None and isinstance(values, numpy.ndarray):
+            if self.dtype is not None \
+            and values.dtype != object \
+            and numpy.can_cast(values.dtype, self.dtype):
+                return values.astype(self.dtype)
+            array = numpy.empty(len(values), dtype=object)
+            array[:] = self._map_many(function, values.tolist(), identity=identity)
+            return array
+        values = list(values)
+        if identity:
+            return values
+        if None in values:
+            return [None if value is None else function(value) for value in values]
+        return map(function, values)
+
     def validate(self, value):
         """ Validates the value against the specifications of the Type.
 
@@ -51,6 +118,43 @@ class Type(object):
         """
         return True, []
 
+    def validate_many(self, values):
+        """ Validates a whole column of values at once, with vectorized
+        operations where the dtype of the array allows it, and value by value
+        otherwise. The column must not hold any None.
+
+        :param values: The values to validate.
+        :type values: numpy.ndarray
+        :returns: The mask of the valid values.
+        :rtype: numpy.ndarray
+        """
+        if type(self).validate.im_func is Type.validate.im_func:
+            return numpy.ones(len(values), dtype=bool)
+        return numpy.fromiter(
+            (self.validate(value)[0] for value in values.tolist()),
+            dtype=bool,
+            count=len(values)
+        )
+
+    def invalid_expression(self, value, bind):
+        """ Generates the Python expression that is true when a value does not
+        pass validate(), for compiled validators. It must not allocate any
+        error message. Types whose validation cannot be expressed return a
+        call to validate() itself.
+
+        :param value: The name of the variable holding the value, which is
+        never None.
+        :type value: str
+        :param bind: The function making a constant available to the
+        expression, which returns the name to use for it.
+        :type bind: callable
+        :returns: The expression, or None if every value is valid.
+        :rtype: str | None
+        """
+        if type(self).validate.im_func is Type.validate.im_func:
+            return None
+        return 'not '+bind(self.validate)+'('+value+')[0]'
+
     def __repr__(self):
         """ Returns a readable representation of the Type.
         """
@@ -60,6 +164,10 @@ class Type(object):
 class Numeric(Type):
 
     name_db = "Float.class"
+    dtype = 'float64'
+
+    # The kinds of NumPy arrays whose values all have the right type
+    _kinds = 'biuf'
 
     def __init__(self, min_value=None, max_value=None):
         """ Defines the specifications of the Type.
@@ -84,12 +192,34 @@ class Numeric(Type):
             return False, [u'Too small : '+str(value)+u' < '+str(self.min_value)]
         return super(Numeric, self).validate(value)
 
-
-class Integer(Type):
+    def validate_many(self, values):
+        if values.dtype.kind not in self._kinds:
+            return super(Numeric, self).validate_many(values)
+        valid = numpy.ones(len(values), dtype=bool)
+        if self.max_value is not None:
+            valid &= values <= self.max_value
+        if self.min_value is not None:
+            valid &= values >= self.min_value
+        return valid
+
+    def invalid_expression(self, value, bind):
+        checks = []
+        if self.max_value is not None:
+            checks.append(value+' > '+bind(self.max_value))
+        if self.min_value is not None:
+            checks.append(value+' < '+bind(self.min_value))
+        if not len(checks):
+            return None
+        return ' or '.join(checks)
+
+
+class Integer(Numeric):
 
     name_db = "Integer.class"
+    dtype = 'int64'
+    _kinds = 'biu'
 
-    def __init__(self, n_digits=10):
+    def __init__(self, n_digits=10, min_value=None, max_value=None):
         """ Defines the specifications of the Type.
 
         This class interfaces python conception of Integer with java
@@ -99,7 +229,12 @@ class Integer(Type):
 
         :param n_digits: The maximal number of digits composing the value.
         :type n_digits: int
+        :param min_value: The minimal value that can be taken.
+        :type min_value: int
+        :param max_value: The maximal value that can be taken.
+        :type max_value: int
         """
+        super(Integer, self).__init__(min_value=min_value, max_value=max_value)
         if 10 < n_digits < 20:
             self.__class__ = Long
         elif n_digits >= 20:
@@ -110,10 +245,20 @@ class Integer(Type):
     def to_py(self, value):
         return int(value)
 
+    def to_py_many(self, values):
+        return self._map_many(int, values)
+
     def validate(self, value):
         if not isinstance(value, int):
             return False, [u'Wrong type : expected int, got '+str(type(value))]
-        return True
+        return super(Integer, self).validate(value)
+
+    def validate_many(self, values):
+        # The type is checked by the kind of the array, see Numeric
+        return super(Integer, self).validate_many(values)
+
+    def invalid_expression(self, value, bind):
+        return _type_check(value, bind(int), super(Integer, self).invalid_expression(value, bind))
 
 
 class Long(Integer):
@@ -124,6 +269,7 @@ class Long(Integer):
 class BigInteger(Integer):
 
     name_db = "BigInteger.class"
+    dtype = None
 
 
 class Float(Numeric):
@@ -131,22 +277,51 @@ class Float(Numeric):
     def to_py(self, value):
         return float(value)
 
+    _kinds = 'f'
+
+    def to_py_many(self, values):
+        return self._map_many(float, values)
+
     def validate(self, value):
         if not isinstance(value, float):
             return False, [u'Wrong type : expected float, got '+str(type(value))]
         return super(Float, self).validate(value)
 
+    def validate_many(self, values):
+        # The type is checked by the kind of the array, see Numeric
+        return super(Float, self).validate_many(values)
+
+    def invalid_expression(self, value, bind):
+        return _type_check(value, bind(float), super(Float, self).invalid_expression(value, bind))
+
 
 class Boolean(Integer):
 
+    dtype = 'bool'
+    _kinds = 'b'
+
     def to_py(self, value):
         return bool(value)
 
+    def to_py_many(self, values):
+        # Numbers are true when they are not zero, as with bool()
+        if numpy is not None and isinstance(values, numpy.ndarray) \
+        and values.dtype.kind in 'biuf':
+            return values.astype(bool)
+        return self._map_many(bool, values)
+
     def validate(self, value):
         if not isinstance(value, bool):
             return False, [u'Wrong type : expected bool, got '+str(type(value))]
         return super(Boolean, self).validate(value)
 
+    def validate_many(self, values):
+        # The type is checked by the kind of the array, see Numeric
+        return super(Boolean, self).validate_many(values)
+
+    def invalid_expression(self, value, bind):
+        return _type_check(value, bind(bool), super(Boolean, self).invalid_expression(value, bind))
+
 
 class Const(Type):
 
@@ -165,6 +340,21 @@ class Const(Type):
             return False, [u'Value '+str(value)+u' is not in ('+u", ".join([str(choice) for choice in self.choices])+u')']
         return super(Const, self).validate(value)
 
+    def validate_many(self, values):
+        if values.dtype.kind in 'biufSU':
+            try:
+                return numpy.in1d(values, list(self.choices))
+            except (TypeError, ValueError):
+                pass
+        return super(Const, self).validate_many(values)
+
+    def invalid_expression(self, value, bind):
+        try:
+            choices = frozenset(self.choices)
+        except TypeError:
+            choices = tuple(self.choices)
+        return value+' not in '+bind(choices)
+
 
 class String(Type):
 
@@ -181,6 +371,9 @@ class String(Type):
     def to_py(self, value):
         return unicode(value)
 
+    def to_py_many(self, values):
+        return self._map_many(unicode, values)
+
     def validate(self, value):
         if not isinstance(value, basestring):
             return False, [u'Wrong type : expected basestring, got '+str(type(value))]
@@ -189,6 +382,19 @@ class String(Type):
             return False, [u'Value is too long : '+str(len(value))+u' > '+str(self.size)]
         return super(String, self).validate(value)
 
+    def validate_many(self, values):
+        if values.dtype.kind not in 'SU':
+            return super(String, self).validate_many(values)
+        if self.size is None:
+            return numpy.ones(len(values), dtype=bool)
+        return numpy.char.str_len(values) <= self.size
+
+    def invalid_expression(self, value, bind):
+        check = None
+        if self.size is not None:
+            check = 'len('+value+') > '+bind(self.size)
+        return _type_check(value, bind(basestring), check)
+
 
 class Text(Type):
 
@@ -197,11 +403,22 @@ class Text(Type):
     def to_py(self, value):
         return unicode(value)
 
+    def to_py_many(self, values):
+        return self._map_many(unicode, values)
+
     def validate(self, value):
         if not isinstance(value, basestring):
             return False, [u'Wrong type : expected basestring, got '+str(type(value))]
         return super(Text, self).validate(value)
 
+    def validate_many(self, values):
+        if values.dtype.kind not in 'SU':
+            return super(Text, self).validate_many(values)
+        return numpy.ones(len(values), dtype=bool)
+
+    def invalid_expression(self, value, bind):
+        return _type_check(value, bind(basestring))
+
 
 class Url(String):
 
@@ -225,6 +442,9 @@ class DateTime(Type):
             return False, [u'Wrong type : expected datetime, got '+str(type(value))]
         return super(DateTime, self).validate(value)
 
+    def invalid_expression(self, value, bind):
+        return _type_check(value, bind(datetime))
+
 
 class Date(Type):
 
@@ -235,6 +455,46 @@ class Date(Type):
             return False, [u'Wrong type : expected date, got '+str(type(value))]
         return super(Date, self).validate(value)
 
+    def invalid_expression(self, value, bind):
+        return _type_check(value, bind(date))
+
+
+def defining_class(class_, name):
+    """ Finds the class that defines an attribute in the hierarchy of a
+    class. Compiled and vectorized validations use it to detect types that
+    override validate() without overriding their fast counterpart.
+
+    :param class_: The class.
+    :type class_: type
+    :param name: The name of the attribute.
+    :type name: str
+    :returns: The class defining the attribute, or None.
+    :rtype: type
+    """
+    for klass in class_.__mro__:
+        if name in klass.__dict__:
+            return klass
+    return None
+
+
+def _type_check(value, class_, check=None):
+    """ Builds the expression that is true when a value is not an instance of
+    a class, or fails a further check.
+
+    :param value: The name of the variable holding the value.
+    :type value: str
+    :param class_: The name of the class.
+    :type class_: str
+    :param check: The expression of the further check, or None.
+    :type check: str
+    :returns: The expression.
+    :rtype: str
+    """
+    expression = 'not isinstance('+value+', '+class_+')'
+    if check is None:
+        return expression
+    return expression+' or '+check
+
 
 class List(Type):
 
@@ -5,11 +5,44 @@
 #                                      IMPORTS
 # ==============================================================================
 
+# System
+from collections import deque
+from itertools import islice
+from multiprocessing import cpu_count
+from multiprocessing import Pool
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Services
+from graphalchemy.blueprints.schema import compile_validator
+from graphalchemy.blueprints.schema import MetaData
+from graphalchemy.blueprints.schema import Node
+from graphalchemy.blueprints.schema import Property
 
 # ==============================================================================
 #                                      MODEL
 # ==============================================================================
 
+class ValidationError(Exception):
+    """ Raised when an object that is not valid is about to be written.
+    """
+
+    def __init__(self, obj, errors):
+        """ :param obj: The invalid object.
+        :type obj: object
+        :param errors: The lists of errors by property name.
+        :type errors: dict<str, list>
+        """
+        message = ', '.join([name_py+' : '+' '.join(messages) for name_py, messages in sorted(errors.items())])
+        super(ValidationError, self).__init__('Invalid '+str(obj)+' : '+message)
+        self.obj = obj
+        self.errors = errors
+
+
+
 class Validator(object):
     """ Validates each property value of the given object against its specifications.
 
@@ -31,7 +64,8 @@ class Validator(object):
 
 
     def run(self, obj):
-        """ Validates an object against its specification.
+        """ Validates an object against its specification, with the validator
+        compiled for its model.
 
         :param obj: The object to validate.
         :type obj: graphalchemy.blueprints.schema.Model
@@ -40,20 +74,196 @@ class Validator(object):
         :rtype: boolean, dict<string, list>
         """
         metadata = self.metadata_map.for_object(obj)
-        all_errors = {}
-        ok = True
-        for property in metadata._properties.values():
-            python_value = getattr(obj, property.name_py)
-            _ok, errors = property.validate(python_value)
-            if _ok:
-                self._log('  Property '+str(property)+' is valid')
-            else:
-                all_errors[property.name_py] = errors
-                ok = False
-                self._log('  Property '+str(property)+' is invalid : '+" ".join(errors))
+        ok, all_errors = metadata.get_validator()(obj)
+        for name_py, errors in all_errors.iteritems():
+            self._log('  Property '+str(metadata._properties[name_py])+' is invalid : '+" ".join(errors))
         return ok, all_errors
 
 
+    def is_valid(self, obj):
+        """ Checks whether an object is valid, without building any error
+        message.
+
+        :param obj: The object to validate.
+        :type obj: object
+        :rtype: bool
+        """
+        return self.metadata_map.for_object(obj).is_valid(obj)
+
+
+    def run_columns(self, columns, model, present=None):
+        """ Validates columns of values, such as the arrays of a CSV file or
+        of graphalchemy.ogm.query.Query.to_columns(), property by property
+        with vectorized operations. Properties without a column are null.
+
+        Example use :
+        >>> valid, errors = validator.run_columns({
+        ...     'name': numpy.array(['Foo', 'Bar']),
+        ...     'rating': numpy.array([4.5, 12.0]),
+        ... }, model='Website')
+        >>> valid
+        array([ True, False])
+        >>> errors
+        {'rating': array([1])}
+
+        :param columns: The values of each property, by property name.
+        :type columns: dict<str, list | numpy.ndarray>
+        :param model: The model of the values, or its name.
+        :type model: graphalchemy.blueprints.schema.Model | str
+        :param present: The masks of the values that are not null, by property
+        name. Defaults to the values that are not None.
+        :type present: dict<str, numpy.ndarray>
+        :returns: The mask of the valid rows, and the indices of the invalid
+        values by property name.
+        :rtype: numpy.ndarray, dict<str, numpy.ndarray>
+        """
+        if numpy is None:
+            raise Exception('run_columns() requires numpy.')
+        if isinstance(model, basestring):
+            model = self.metadata_map.for_model_name(model)
+        present = present or {}
+        for name_py in columns:
+            if name_py not in model._properties:
+                raise Exception('Property %s not found in model %s' % (name_py, model, ))
+        lengths = set([len(column) for column in columns.values()])
+        if len(lengths) != 1:
+            raise Exception('Columns must all have the same length.')
+        length = lengths.pop()
+
+        valid_rows = numpy.ones(length, dtype=bool)
+        errors = {}
+        for name_py, prop in model._properties.iteritems():
+            if name_py in columns:
+                valid = prop.validate_many(columns[name_py], present.get(name_py, None))
+            else:
+                valid = prop.validate_many([None] * length)
+            if not valid.all():
+                errors[name_py] = numpy.flatnonzero(~valid)
+                valid_rows &= valid
+                self._log('  Property '+str(prop)+' has '+str(len(errors[name_py]))+' invalid values')
+        return valid_rows, errors
+
+
+    def run_many(self, objs, model=None, workers=None, chunk_size=10000):
+        """ Validates many objects, in a pool of processes. See run_iter().
+
+        Example use :
+        >>> ok, errors = validator.run_many(rows, model='Website', workers=8)
+        >>> errors
+        {12: {'name': [u'Property is not nullable.']}}
+
+        :returns: A boolean stating if all objects are valid, and the errors of
+        the invalid ones by index in the input.
+        :rtype: boolean, dict<int, dict<string, list>>
+        """
+        errors = dict(self.run_iter(objs, model=model, workers=workers, chunk_size=chunk_size))
+        return not len(errors), errors
+
+
+    def run_iter(self, objs, model=None, workers=None, chunk_size=10000):
+        """ Validates objects as they come, in a pool of processes, and
+        generates the errors of the invalid ones, in order. The input is
+        consumed chunk by chunk, with a bounded number of chunks in flight,
+        so that it can be unbounded.
+
+        The processes validate dictionaries of the values by property name,
+        against a snapshot of the models : mapped objects are converted in
+        this process first.
+
+        Example use :
+        >>> for index, errors in validator.run_iter(read_dump(), model='Page'):
+        ...     print index, errors
+
+        :param objs: Mapped objects, or dictionaries of values by property
+        name.
+        :type objs: iterable
+        :param model: The model of the dictionaries, or its name.
+        :type model: graphalchemy.blueprints.schema.Model | str
+        :param workers: The number of processes. Defaults to the number of
+        cores. With a single worker, objects are validated in this process.
+        :type workers: int
+        :param chunk_size: The number of objects sent to a process at once.
+        :type chunk_size: int
+        :returns: The index of each invalid object and its errors.
+        :rtype: generator<int, dict<string, list>>
+        """
+        if isinstance(model, basestring):
+            model = self.metadata_map.for_model_name(model)
+        workers = workers or cpu_count()
+        chunks = self._chunks(objs, model, chunk_size)
+
+        if workers == 1:
+            validators = {}
+            for chunk_model, start, rows in chunks:
+                if chunk_model.model_name not in validators:
+                    validators[chunk_model.model_name] = compile_validator(chunk_model, dicts=True)
+                for index, errors in _validate_chunk((chunk_model.model_name, start, rows), validators):
+                    yield index, errors
+            return
+
+        # The snapshots are only sent once to each process
+        specs = dict([(spec[0], spec) for spec in map(snapshot_model, self._models(model))])
+        pool = Pool(workers, initializer=_init_worker, initargs=(specs, ))
+        self._log('Validating in '+str(workers)+' processes')
+        try:
+            pending = deque()
+            for chunk_model, start, rows in chunks:
+                chunk = (chunk_model.model_name, start, rows)
+                pending.append(pool.apply_async(_validate_chunk, (chunk, )))
+                if len(pending) < 2 * workers:
+                    continue
+                for index, errors in pending.popleft().get():
+                    yield index, errors
+            while len(pending):
+                for index, errors in pending.popleft().get():
+                    yield index, errors
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+    def _models(self, model):
+        """ :returns: The models the objects may belong to.
+        :rtype: list<graphalchemy.blueprints.schema.Model>
+        """
+        if model is not None:
+            return [model]
+        return self.metadata_map._nodes.values() + self.metadata_map._relationships.values()
+
+
+    def _chunks(self, objs, model, chunk_size):
+        """ Splits objects in chunks of dictionaries of a single model.
+
+        :returns: The model, the index of the first object and the
+        dictionaries, for each chunk.
+        :rtype: generator<graphalchemy.blueprints.schema.Model, int, list<dict>>
+        """
+        objs = iter(objs)
+        start = 0
+        while True:
+            chunk = list(islice(objs, chunk_size))
+            if not len(chunk):
+                return
+            rows = []
+            current = None
+            for obj in chunk:
+                if isinstance(obj, dict):
+                    if model is None:
+                        raise Exception('The model of dictionaries must be given.')
+                    obj_model, row = model, obj
+                else:
+                    obj_model = self.metadata_map.for_object(obj)
+                    row = dict([(name_py, getattr(obj, name_py)) for name_py in obj_model._properties])
+                if obj_model is not current and len(rows):
+                    yield current, start, rows
+                    start += len(rows)
+                    rows = []
+                current = obj_model
+                rows.append(row)
+            yield current, start, rows
+            start += len(rows)
+
+
     def _log(self, message, level=10):
         """ Thin wrapper for logging purposes.
 
@@ -67,3 +277,77 @@ class Validator(object):
         if self.logger is not None:
             self.logger.log(level, message)
         return self
+
+
+
+# ==============================================================================
+#                                     WORKERS
+# ==============================================================================
+
+def snapshot_model(model):
+    """ Builds a picklable snapshot of the specifications of a model, for
+    validation in another process.
+
+    :param model: The model.
+    :type model: graphalchemy.blueprints.schema.Model
+    :returns: The name of the model and the name, type and nullability of
+    its properties.
+    :rtype: tuple
+    """
+    properties = [(prop.name_py, prop.type, prop.nullable) for prop in model._properties.values()]
+    return model.model_name, tuple(properties)
+
+
+def _build_validator(spec):
+    """ Compiles the validator of dictionaries from a model snapshot.
+    """
+    model_name, properties = spec
+    model = Node(model_name, MetaData(), *[
+        Property(name_py, type_, nullable=nullable)
+        for name_py, type_, nullable in properties
+    ])
+    return compile_validator(model, dicts=True)
+
+
+# Model snapshots and validators of the current worker process, by model name
+_worker_specs = {}
+_worker_validators = {}
+
+
+def _init_worker(specs):
+    """ Registers the model snapshots of a worker process. Their validators
+    are compiled on first use.
+
+    :param specs: The snapshots of the models, by name.
+    :type specs: dict<str, tuple>
+    """
+    _worker_specs.clear()
+    _worker_specs.update(specs)
+    _worker_validators.clear()
+
+
+def _validate_chunk(chunk, validators=None):
+    """ Validates a chunk of dictionaries of a single model.
+
+    :param chunk: The name of the model, the index of the first dictionary
+    and the dictionaries.
+    :type chunk: tuple
+    :param validators: The validators by model name, or None for those of the
+    worker process.
+    :type validators: dict
+    :returns: The index and the errors of the invalid dictionaries.
+    :rtype: list<tuple>
+    """
+    model_name, start, rows = chunk
+    if validators is None:
+        validator = _worker_validators.get(model_name, None)
+        if validator is None:
+            validator = _worker_validators[model_name] = _build_validator(_worker_specs[model_name])
+    else:
+        validator = validators[model_name]
+    is_valid = validator.is_valid
+    invalid = []
+    for i, row in enumerate(rows):
+        if not is_valid(row):
+            invalid.append((start + i, validator(row)[1]))
+    return invalid
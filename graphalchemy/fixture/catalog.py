@@ -0,0 +1,31 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+# Models that live in their own module, to test merged and deferred metadata.
+
+class Book(object):
+    def __init__(self, *args, **kwargs):
+        self.element_type = "Book"
+        self.title = None
+        for key in kwargs:
+            setattr(self, key, kwargs[key])
+
+
+from graphalchemy.blueprints.schema import MetaData
+from graphalchemy.ogm.mapper import Mapper
+metadata = MetaData()
+mapper = Mapper()
+
+from graphalchemy.blueprints.schema import Node
+from graphalchemy.blueprints.types import String
+from graphalchemy.blueprints.schema import Property
+
+book = Node('Book', metadata,
+    Property('title', String(127), nullable=False)
+)
+
+mapper(Book, book)
@@ -0,0 +1,346 @@
+#! /usr/bin/env python
+#-*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+# System
+import socket
+import threading
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+# Services
+from graphalchemy.ogm.query import build_request
+from graphalchemy.ogm.query import Query
+from graphalchemy.ogm.query import QueryCancelled
+from graphalchemy.ogm.query import QueryTimeout
+
+
+# ==============================================================================
+#                                     SERVICE
+# ==============================================================================
+
+class GatherHandle(object):
+    """ Handle on a set of queries being executed concurrently by an Executor.
+
+    Example use :
+    >>> handle = executor.gather_async([query1, query2])
+    >>> handle.ready()
+    False
+    >>> results1, results2 = handle.result()
+
+    The queries that are not done yet can be cancelled :
+    >>> handle.cancel()
+    """
+
+    def __init__(self, session, queries):
+        """ Creates the handle.
+
+        :param session: The session the queries are hydrated in.
+        :type session: graphalchemy.ogm.session.Session
+        :param queries: The queries being executed.
+        :type queries: list<graphalchemy.ogm.query.Query>
+        """
+        self.session = session
+        self.queries = queries
+        self._async_result = None
+        self._results = None
+        self._cancelled = threading.Event()
+        # Connections of the requests in flight
+        self._https = set()
+        self._lock = threading.Lock()
+
+
+    def ready(self):
+        """ :returns: True if all the queries have been executed.
+        :rtype: bool
+        """
+        return self._async_result.ready()
+
+
+    def result(self, timeout=None):
+        """ Waits for the queries and hydrates their results, one query after
+        the other, in the calling thread.
+
+        :param timeout: The maximal number of seconds to wait for.
+        :type timeout: float
+        :returns: The results of each query, in order.
+        :rtype: list<list>
+        :raises: graphalchemy.ogm.query.QueryTimeout if the timeout expires,
+        in which case the queries are cancelled.
+        :raises: graphalchemy.ogm.query.QueryCancelled if the queries were
+        cancelled.
+        """
+        if self._results is not None:
+            return self._results
+        # The session stays usable while the requests are in flight
+        try:
+            raws = self._async_result.get(timeout)
+        except TimeoutError:
+            self.cancel()
+            raise QueryTimeout('Queries not done after '+str(timeout)+' seconds.')
+        with self.session.lock:
+            if self._results is None:
+                for query, raw in zip(self.queries, raws):
+                    query._results = raw
+                    query.hydrate()
+                self._results = [query._results for query in self.queries]
+        return self._results
+
+
+    def cancel(self):
+        """ Cancels the queries : those that are not sent yet are skipped, and
+        the connections of those in flight are shut down and dropped. The server
+        may still work on these until their deadline, if they have one.
+
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.executor.GatherHandle
+        """
+        self._cancelled.set()
+        with self._lock:
+            for http in self._https:
+                self._close(http)
+        return self
+
+
+    def cancelled(self):
+        """ :returns: True if the queries were cancelled.
+        :rtype: bool
+        """
+        return self._cancelled.is_set()
+
+
+    def _start(self, http):
+        """ Registers the connection of a request about to be sent.
+
+        :raises: graphalchemy.ogm.query.QueryCancelled if the queries were
+        cancelled.
+        """
+        with self._lock:
+            if self.cancelled():
+                raise QueryCancelled('Queries were cancelled.')
+            self._https.add(http)
+        return self
+
+
+    def _stop(self, http):
+        with self._lock:
+            self._https.discard(http)
+        return self
+
+
+    def _close(self, http):
+        """ Shuts down and closes the connections of a request, and removes
+        them from it, so that its next request opens a new one. Connections
+        that are not open yet are dropped as well.
+
+        :param http: The HTTP connection of the request.
+        :type http: httplib2.Http
+        """
+        for key, connection in http.connections.items():
+            sock = getattr(connection, 'sock', None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+            connection.close()
+            http.connections.pop(key, None)
+        return self
+
+
+
+class Executor(object):
+    """ Executes independent queries concurrently, on a bounded pool of
+    threads that each own their HTTP connection. Results are hydrated in the
+    calling thread, so the identity map is never updated concurrently.
+
+    Example use :
+    >>> executor = Executor(session, workers=4)
+    >>> websites, pages = executor.gather([query1, query2])
+
+    The queries can also be sent in a single script, which saves the round
+    trips altogether :
+    >>> websites, pages = executor.gather([query1, query2], pipeline=True)
+    """
+
+    DEFAULT_WORKERS = 8
+
+    def __init__(self, session, workers=None, logger=None):
+        """ Creates the executor. The threads are started on first use.
+
+        :param session: The session the queries are hydrated in.
+        :type session: graphalchemy.ogm.session.Session
+        :param workers: The number of threads, and thus of concurrent requests.
+        :type workers: int
+        :param logger: An optionnal logger.
+        :type logger: logging.Logger
+        """
+        self.session = session
+        self.workers = workers or self.DEFAULT_WORKERS
+        self.logger = logger
+        self._pool = None
+        self._local = threading.local()
+
+
+    def gather(self, queries, pipeline=False, timeout=None):
+        """ Executes the queries and returns their results in the same order.
+
+        :param queries: The queries to execute.
+        :type queries: list<graphalchemy.ogm.query.Query>
+        :param pipeline: Whether to send all the queries in a single script.
+        :type pipeline: bool
+        :param timeout: The maximal number of seconds to wait for all of them.
+        :type timeout: float
+        :returns: The results of each query.
+        :rtype: list<list>
+        :raises: graphalchemy.ogm.query.QueryTimeout if the timeout expires.
+        """
+        queries = list(queries)
+        if pipeline:
+            return self._gather_pipeline(queries, timeout=timeout)
+        return self.gather_async(queries).result(timeout)
+
+
+    def gather_async(self, queries):
+        """ Starts executing the queries and returns immediately.
+
+        :param queries: The queries to execute.
+        :type queries: list<graphalchemy.ogm.query.Query>
+        :returns: A handle on the execution.
+        :rtype: graphalchemy.ogm.executor.GatherHandle
+        """
+        queries = list(queries)
+        handle = GatherHandle(self.session, queries)
+        tasks = [(query, query.compile(), handle) for query in queries]
+        self._log('Gathering '+str(len(tasks))+' queries on '+str(self.workers)+' threads')
+        handle._async_result = self._get_pool().map_async(self._fetch, tasks)
+        return handle
+
+
+    def close(self):
+        """ Stops the threads.
+
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.executor.Executor
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        return self
+
+
+    def _fetch(self, task):
+        """ Executes a compiled query in a worker thread, and returns its raw
+        results.
+
+        :param task: The query, its compiled script and parameters, and the
+        handle on its execution.
+        :type task: tuple
+        :returns: The raw results.
+        :rtype: list
+        """
+        query, (script, params), handle = task
+        request = self._get_request()
+        http = request.http
+        handle._start(http)
+        query._connection = request
+        # Checked again right before sending
+        query._cancelled = handle.cancelled
+        try:
+            return query._fetch(script, params)
+        except Exception:
+            if not handle.cancelled():
+                raise
+            raise QueryCancelled('Queries were cancelled.')
+        finally:
+            query._connection = None
+            query._cancelled = None
+            handle._stop(http)
+            # A request sent while the queries were cancelled leaves its
+            # connection open
+            if handle.cancelled():
+                handle._close(http)
+
+
+    def _gather_pipeline(self, queries, timeout=None):
+        """ Sends all the queries in a single script. Each query is wrapped in
+        a closure, so that their parameters and deadlines cannot collide, and
+        their deadlines all count from the start of the script.
+
+        :param queries: The queries to execute.
+        :type queries: list<graphalchemy.ogm.query.Query>
+        :param timeout: The maximal number of seconds to wait for the script.
+        :type timeout: float
+        :returns: The results of each query.
+        :rtype: list<list>
+        :raises: graphalchemy.ogm.query.QueryTimeout if the server stopped one
+        of the queries at its deadline.
+        """
+        if not len(queries):
+            return []
+        scripts = []
+        params = {}
+        for i, query in enumerate(queries):
+            script, query_params = query.compile()
+            script, query_params = query._bind_deadline(script, query_params, timeout=timeout, start='_start')
+            names = sorted(query_params.keys())
+            arguments = []
+            for name in names:
+                argument = 'q'+str(i)+'_'+name
+                params[argument] = query_params[name]
+                arguments.append(argument)
+            scripts.append('{'+', '.join(names)+' -> '+script+'}.call('+', '.join(arguments)+')')
+        script = 'def _start = System.currentTimeMillis(); ['+', '.join(scripts)+']'
+        self._log('Pipelining '+str(len(queries))+' queries')
+
+        # The queries of the caller are left untouched
+        raws = Query(self.session, logger=self.logger)._fetch(script, params, timeout=timeout)
+        for query, raw in zip(queries, raws):
+            query._check_expired(raw)
+        with self.session.lock:
+            for query, raw in zip(queries, raws):
+                # Single elements are not wrapped in a list by the server
+                if raw is None:
+                    raw = []
+                elif not isinstance(raw, list):
+                    raw = [raw]
+                query._results = raw
+                query.hydrate()
+        return [query._results for query in queries]
+
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ThreadPool(self.workers)
+        return self._pool
+
+
+    def _get_request(self):
+        """ :returns: The request of the current thread, as the
+        httplib2.Http objects of requests cannot be shared between threads.
+        :rtype: bulbs.rest.Request
+        """
+        request = getattr(self._local, 'request', None)
+        if request is None:
+            request = build_request(self.session.client)
+            self._local.request = request
+        return request
+
+
+    def _log(self, message, level=10):
+        """ Thin wrapper for logging purposes.
+
+        :param message: The message to log.
+        :type message: str
+        :param level: The level of the log.
+        :type level: int
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.executor.Executor
+        """
+        if self.logger is not None:
+            self.logger.log(level, message)
+        return self
@@ -21,17 +21,38 @@ class IdentityMap(dict):
     and values are the corresponding state.
     """
 
-    def add(self, obj, update=False):
+    def __init__(self, *args, **kwargs):
+        super(IdentityMap, self).__init__(*args, **kwargs)
+        self._ids = {}
+        # The session the tracked entities load their relations through
+        self.session = None
+
+
+    def add(self, obj, update=False, attributes=None):
         """ Adds an object to the identity map. If the object is not known, creates
         a fresh InstanceState.
+
+        :param obj: The object to track.
+        :type obj: object
+        :param update: Whether the object is persisted, and its id and
+        attributes must be recorded.
+        :type update: bool
+        :param attributes: The persisted python values of the object, used to
+        detect further changes.
+        :type attributes: dict
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.identity.IdentityMap
         """
         if obj in self:
             return self
         state = InstanceState(obj)
         if update:
             state.update_id(obj.id)
-            state.update_attributes(data)
-        return super(IdentityMap, self).__setitem__(obj, state)
+            state.update_attributes(attributes or {})
+            self._ids[obj.id] = obj
+        state.attach(obj, self.session)
+        super(IdentityMap, self).__setitem__(obj, state)
+        return self
 
 
     def get_by_id(self, id):
@@ -43,8 +64,30 @@ class IdentityMap(dict):
         """
         if id is None:
             return None
-        for obj, state in self.iteritems():
-            if obj.id == id:
-                return obj
-        return None
+        return self._ids.get(id, None)
+
+
+    def remove_by_id(self, id):
+        """ Stops tracking the entity with the given id, if any.
+
+        :param id: The numerical identifier of the entity.
+        :type id: int
+        :returns: The entity that was tracked, or None.
+        :rtype: object
+        """
+        obj = self._ids.pop(id, None)
+        if obj is not None:
+            state = super(IdentityMap, self).pop(obj, None)
+            if state is not None:
+                state.detach()
+        return obj
+
+
+    def clear(self):
+        """ Stops tracking all entities.
+        """
+        for state in self.itervalues():
+            state.detach()
+        self._ids.clear()
+        return super(IdentityMap, self).clear()
 
@@ -33,3 +33,19 @@ class Mapper(object):
             node.add_adjacency(adjacency, name)
             relationship = adjacency.relationship
             relationship.add_adjacency(adjacency, name)
+
+
+    def compact(self, model):
+        """ Returns the compact variant of the class mapped to a model : a
+        read-only record with slots for the id and the properties, that
+        read-only queries hydrate.
+
+        Example use :
+        >>> PageRecord = mapper.compact(page)
+
+        :param model: The model to build the record class of.
+        :type model: graphalchemy.blueprints.schema.Model
+        :returns: The record class.
+        :rtype: type
+        """
+        return model.get_record_class()
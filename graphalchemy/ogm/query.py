@@ -5,9 +5,29 @@
 #                                      IMPORTS
 # ==============================================================================
 
+import socket
+import threading
+import time
+import weakref
 from urllib import quote
 
 from bulbs.gremlin import Gremlin
+from bulbs.rest import GET
+from bulbs.rest import POST
+
+from graphalchemy.blueprints.schema import Adjacency
+from graphalchemy.blueprints.types import Boolean
+from graphalchemy.blueprints.types import Numeric
+
+# Optional, for columnar results
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# The path of the Gremlin extension of Rexster
+GREMLIN_PATH = 'tp/gremlin'
 
 
 # ==============================================================================
@@ -20,6 +40,134 @@ class NoResultFound(Exception):
 class MultipleResultsFound(Exception):
     pass
 
+class QueryTimeout(Exception):
+    pass
+
+class QueryCancelled(Exception):
+    pass
+
+
+# ==============================================================================
+#                                      HELPERS
+# ==============================================================================
+
+def quote_groovy(value):
+    """ Builds a Groovy string literal from a python string.
+
+    :param value: The string to quote.
+    :type value: str
+    :returns: The quoted string, escaped for Groovy.
+    :rtype: str
+    """
+    value = unicode(value).replace(u'\\', u'\\\\') \
+                          .replace(u'"', u'\\"') \
+                          .replace(u'$', u'\\$')
+    return u'"'+value+u'"'
+
+
+class TimedRequest(object):
+    """ Mixin of the bulbs requests sent by queries, that records on each
+    response the time spent on the network and on decoding it.
+    """
+
+    def request(self, method, path, params):
+        start = time.time()
+        response = super(TimedRequest, self).request(method, path, params)
+        response.timings = {
+            'network': response.received - start,
+            'decode': time.time() - response.received,
+        }
+        return response
+
+    def response_class(self, http_response, config):
+        received = time.time()
+        response = super(TimedRequest, self).response_class(http_response, config)
+        response.received = received
+        return response
+
+
+# Timed request classes, by request class of the clients
+_timed_request_classes = {}
+
+def build_request(client):
+    """ Creates a request of the class of a client, with its own HTTP
+    connection, for use in another thread, as httplib2.Http objects cannot be
+    shared between threads.
+
+    :param client: The client of the database.
+    :type client: bulbs.client.Client
+    :returns: The request.
+    :rtype: bulbs.rest.Request
+    """
+    base = client.request_class
+    class_ = _timed_request_classes.get(base, None)
+    if class_ is None:
+        class_ = type('Timed'+base.__name__, (TimedRequest, base), {})
+        _timed_request_classes[base] = class_
+    return class_(client.config, client.type_system.content_type)
+
+
+def to_array(values, dtype=None):
+    """ Builds a NumPy array from a list of values that may be None.
+
+    :param values: The values.
+    :type values: list
+    :param dtype: The dtype of the array, or None for an array of objects.
+    Nulls are stored as NaN in floats, NaT in datetimes and 0 or False
+    otherwise.
+    :type dtype: str
+    :returns: The array, and the mask of the values that are not None.
+    :rtype: numpy.ndarray, numpy.ndarray
+    """
+    valid = numpy.fromiter((value is not None for value in values), dtype=bool, count=len(values))
+    if dtype is None:
+        array = numpy.empty(len(values), dtype=object)
+        array[:] = values
+        return array, valid
+    if valid.all():
+        filled = values
+    else:
+        filled = [0 if value is None else value for value in values]
+    if dtype.startswith('datetime64'):
+        array = numpy.array(filled, dtype='int64').astype(dtype)
+        array[~valid] = numpy.datetime64('NaT')
+    else:
+        array = numpy.array(filled, dtype=dtype)
+        if array.dtype.kind == 'f':
+            array[~valid] = numpy.nan
+    return array, valid
+
+
+class Bind(object):
+    """ A placeholder for a value that is only given when a prepared query is
+    executed. See graphalchemy.ogm.query.PreparedQuery.
+    """
+
+    def __init__(self, name):
+        """ :param name: The name of the value in PreparedQuery.execute().
+        :type name: str
+        """
+        self.name = name
+
+    def __repr__(self):
+        return '<Bind '+str(self.name)+'>'
+
+
+def bind(name):
+    """ Creates a placeholder for a value given when executing a prepared
+    query.
+
+    Example use :
+    >>> prepared = repository.prepare(domain=bind('d'))
+    >>> websites = prepared.execute(d='allrecipes.com').all()
+
+    :param name: The name of the value.
+    :type name: str
+    :returns: The placeholder.
+    :rtype: graphalchemy.ogm.query.Bind
+    """
+    return Bind(name)
+
 
 # ==============================================================================
 #                                      SERVICE
@@ -33,6 +181,26 @@ class Query(object):
     EDGE = 'edge'
     VERTEX = 'vertex'
 
+    # Whether plain lookups can be sent through the REST API of Rexster
+    use_rexster = True
+
+    # Maximal number of elements removed per request by delete()
+    DELETE_CHUNK_SIZE = 1000
+
+    # Whether a deadline is checked in the scripts of queries that have a
+    # timeout, so that the server stops working on them as well
+    server_timeout = True
+
+    # Server-side check of the deadline, inserted after the steps that can
+    # iterate over many elements
+    DEADLINE_CHECK = '.sideEffect{if (System.currentTimeMillis() > _deadline) throw _expired}'
+
+    # What a script stopped by its deadline check returns
+    TIMEOUT_MARKER = '_graphalchemy_timeout'
+
+    # Phases measured by profile()
+    PROFILE_PHASES = ('compile', 'network', 'decode', 'hydrate', 'identity_map', 'total')
+
     def __init__(self, session, *args, **kwargs):
 
         # Clients
@@ -45,9 +213,19 @@ class Query(object):
         self._indices = {}
         self._offset = None
         self._limit = None
+        self._steps = []
+        self._order = []
 
         # Results
         self._results = None
+        self._profile = None
+        self._timeout = None
+
+        # Request to send instead of the one of the session, for instance
+        # when the query is executed in another thread.
+        self._connection = None
+        # Tells whether the query was cancelled before it is sent, if it can be
+        self._cancelled = None
 
         self.logger = kwargs.get('logger', None)
 
@@ -120,6 +298,257 @@ class Query(object):
         return self
 
 
+    def out(self, label=None):
+        """ Walks to the adjacent vertices through outgoing edges.
+
+        Example:
+        >>> query.vertices().filter(name='Foo').out('hosts')
+        gremlin> g.V.has("name", name).out("hosts")
+
+        :param label: The label of the edges to walk through.
+        :type label: str
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        return self._add_step('out', label)
+
+
+    def in_(self, label=None):
+        """ Walks to the adjacent vertices through incoming edges.
+
+        :param label: The label of the edges to walk through.
+        :type label: str
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        return self._add_step('in', label)
+
+
+    def both(self, label=None):
+        """ Walks to the adjacent vertices through edges of both directions.
+
+        :param label: The label of the edges to walk through.
+        :type label: str
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        return self._add_step('both', label)
+
+
+    def outE(self, label=None):
+        """ Walks to the outgoing edges.
+
+        :param label: The label of the edges to walk to.
+        :type label: str
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        return self._add_step('outE', label)
+
+
+    def inE(self, label=None):
+        """ Walks to the incoming edges.
+
+        :param label: The label of the edges to walk to.
+        :type label: str
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        return self._add_step('inE', label)
+
+
+    def bothE(self, label=None):
+        """ Walks to the edges of both directions.
+
+        :param label: The label of the edges to walk to.
+        :type label: str
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        return self._add_step('bothE', label)
+
+
+    def outV(self):
+        """ Walks from edges to their outgoing vertex.
+
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        return self._add_step('outV')
+
+
+    def inV(self):
+        """ Walks from edges to their incoming vertex.
+
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        return self._add_step('inV')
+
+
+    def has(self, key, value):
+        """ Filters the current elements of the traversal on a property.
+
+        Example:
+        >>> query.vertices().filter(name='Foo').out('hosts').has('title', 'Bar')
+        gremlin> g.V.has("name", name).out("hosts").has("title", _has0)
+
+        :param key: The property key.
+        :type key: str
+        :param value: The value the property must have.
+        :type value: mixed
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        return self._add_step('has', key, value)
+
+
+    def dedup(self):
+        """ Removes duplicate elements from the traversal.
+
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        return self._add_step('dedup')
+
+
+    def range(self, start, stop=None):
+        """ Keeps the elements of the traversal between start (included) and
+        stop (excluded), as a python slice would.
+
+        :param start: The index of the first element to keep.
+        :type start: int
+        :param stop: The index of the first element not to keep.
+        :type stop: int
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        if stop is not None and stop <= start:
+            raise Exception('Empty range : '+str(start)+' to '+str(stop))
+        return self._add_step('range', int(start), None if stop is None else int(stop))
+
+
+    def as_(self, name):
+        """ Names the current step of the traversal so it can be gone back to.
+
+        :param name: The name of the step.
+        :type name: str
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        return self._add_step('as', name)
+
+
+    def back(self, name):
+        """ Goes back to a step previously named with as_().
+
+        Example:
+        >>> query.vertices().out('hosts').as_('page').out('describes').back('page')
+        gremlin> g.V.out("hosts").as("page").out("describes").back("page")
+
+        :param name: The name of the step.
+        :type name: str
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        return self._add_step('back', name)
+
+
+    def timeout(self, seconds):
+        """ Limits the time each request of this query can take. The session
+        timeout and deadline apply as well, the earliest one winning.
+
+        Example:
+        >>> query.vertices().filter(name='Foo').timeout(2.5).all()
+
+        :param seconds: The maximal duration of a request, or None.
+        :type seconds: float
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        self._timeout = seconds
+        return self
+
+
+    def order_by(self, key, desc=False):
+        """ Orders the elements the query ends on by the value of a property,
+        server-side. Calling it again orders by further properties, for equal
+        values of the previous ones. Combined with limit() and offset(), only
+        the requested elements are sent back.
+
+        Example:
+        >>> query.edges().filter(label='hosts').order_by('since', desc=True).limit(20)
+        gremlin> g.E.has("label", label).order{it.b.getProperty("since") <=> it.a.getProperty("since")}[0..19]
+
+        :param key: The name of the property.
+        :type key: str
+        :param desc: Whether the greatest values come first.
+        :type desc: bool
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        return self._add_order(key, desc)
+
+
+    def _add_order(self, key, desc, sort_key=False):
+        """ Appends an ordering criterion.
+
+        :param key: The name of the property in the database.
+        :type key: str
+        :param desc: Whether the greatest values come first.
+        :type desc: bool
+        :param sort_key: Whether the property is the sort key of the edges the
+        query ends on, in which case the edges of a vertex are already stored
+        in ascending order.
+        :type sort_key: bool
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        self._order.append((key, bool(desc), sort_key))
+        return self
+
+
+    def _add_step(self, *step):
+        """ Appends a traversal step to the pipeline.
+
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        self._steps.append(step)
+        return self
+
+
+    def _compile_step(self, step, params, i):
+        """ Builds the Groovy fragment of a traversal step.
+
+        :param step: The step, as a tuple of its name and arguments.
+        :type step: tuple
+        :param params: The parameters of the query, updated in place.
+        :type params: dict
+        :param i: The position of the step, used to name its parameters.
+        :type i: int
+        :returns: The gremlin fragment.
+        :rtype: str
+        """
+        name = step[0]
+        if name in ('out', 'in', 'both', 'outE', 'inE', 'bothE'):
+            if step[1] is None:
+                return '.'+name
+            return '.'+name+'('+quote_groovy(step[1])+')'
+        elif name in ('outV', 'inV', 'dedup'):
+            return '.'+name+'()'
+        elif name == 'has':
+            param = '_has'+str(i)
+            params[param] = step[2]
+            return '.has('+quote_groovy(step[1])+', '+param+')'
+        elif name == 'range':
+            start, stop = step[1], step[2]
+            return '['+str(start)+'..'+str(-1 if stop is None else stop - 1)+']'
+        elif name in ('as', 'back'):
+            return '.'+name+'('+quote_groovy(step[1])+')'
+        raise Exception('Unknown step : '+str(name))
+
+
     def _compile_groovy(self):
         """ Builds the Groovy Gremlin statement that corresponds to this query.
         @todo: For now, this only work on a single node or relationship.
@@ -138,12 +567,16 @@ class Query(object):
         # If the id is in the parameters :
         if 'eid' in self._filters:
             if self._on == self.EDGE:
-                query += '.e'
+                method = 'e'
             elif self._on == self.VERTEX:
-                query += '.v'
-            query += '(eid)'
-            params['eid'] = self._filters['eid']
-            self._filters.pop('eid')
+                method = 'v'
+            # A list of ids is resolved in a single script
+            if isinstance(self._filters['eid'], (list, tuple, set, frozenset)):
+                query = 'eid.collect{g.'+method+'(it)}.findAll{it != null}._()'
+                params['eid'] = list(self._filters['eid'])
+            else:
+                query += '.'+method+'(eid)'
+                params['eid'] = self._filters['eid']
             started = True
 
         if self._on == self.EDGE:
@@ -163,86 +596,478 @@ class Query(object):
         if started == False:
             query += prefix
 
+        # The deadline is checked as the elements are iterated over
+        deadline = self.server_timeout and self._has_timeout()
+        if deadline:
+            params['_timeout'] = None
+            if not isinstance(self._filters.get('eid', []), (int, long, basestring)):
+                query += self.DEADLINE_CHECK
+
         # Fillup with remaining filters
         for key, value in self._filters.iteritems():
+            if key == 'eid':
+                continue
             query += '.has("'+key+u'", '+key+u')'
             params[key] = value
 
+        # Traversal
+        for i, step in enumerate(self._steps):
+            query += self._compile_step(step, params, i)
+            if deadline and step[0] not in ('has', 'dedup', 'as', 'back', 'range'):
+                query += self.DEADLINE_CHECK
+
+        query += self._compile_order()
+
+        # Range
+        if self._limit == 0:
+            query += '.filter{false}'
+        elif self._offset is not None or self._limit is not None:
+            start = self._offset or 0
+            stop = -1 if self._limit is None else start + self._limit - 1
+            query += '['+str(start)+'..'+str(stop)+']'
+
         return query, params
 
 
-    def _compile_rexster(self, **kwargs):
-        """ Builds a gremlin query string from a set of filtering arguments.
-        @todo : no escaping is implemented yet.
+    def _compile_order(self):
+        """ Builds the order step. It is left out when the edges of a single
+        vertex are ordered ascending by their sort key (the primaryKey of the
+        relationship), since vertex-centric indices already return them in
+        that order.
 
-        :returns: string, dict -- The gremlin query.
+        :returns: The gremlin fragment.
+        :rtype: str
+        """
+        if not len(self._order):
+            return ''
+        if len(self._order) == 1 \
+        and self._order[0][1] is False \
+        and self._order[0][2] is True \
+        and self._is_vertex_centric():
+            return ''
+        comparisons = []
+        for key, desc, sort_key in self._order:
+            first, second = ('b', 'a') if desc else ('a', 'b')
+            comparisons.append('it.'+first+'.getProperty('+quote_groovy(key)+') <=> '
+                               'it.'+second+'.getProperty('+quote_groovy(key)+')')
+        if len(comparisons) == 1:
+            return '.order{'+comparisons[0]+'}'
+        return '.order{'+' ?: '.join(['('+c+')' for c in comparisons])+'}'
+
+
+    def _is_vertex_centric(self):
+        """ :returns: Whether the query walks from a single vertex to its
+        edges of one label, and only filters them afterwards.
+        :rtype: bool
+        """
+        if self._on != self.VERTEX \
+        or 'eid' not in self._filters \
+        or isinstance(self._filters['eid'], (list, tuple, set, frozenset)) \
+        or len(self._indices) \
+        or not len(self._steps):
+            return False
+        name, label = self._steps[0][0:2]
+        if name not in ('outE', 'inE') or label is None:
+            return False
+        for step in self._steps[1:]:
+            if step[0] != 'has':
+                return False
+        return True
+
+
+    def _compile_rexster(self):
+        """ Builds the Rexster REST request that corresponds to this query, if
+        it needs no traversal : a lookup by id, or by a single indexed value.
+
+        :returns: The path and parameters of the request, or None if the
+        query can only be expressed in Gremlin.
+        :rtype: (str, dict) | None
         """
         def clean(value):
-            return quote(unicode(value), safe='')
-
-        path = ''
+            return quote(unicode(value).encode('utf-8'), safe='')
+
+        if not self.use_rexster \
+        or self._on is None \
+        or len(self._steps) \
+        or len(self._order) \
+        or self._offset is not None \
+        or self._limit is not None:
+            return None
+        if self._on == self.EDGE:
+            collection = 'edges'
+        else:
+            collection = 'vertices'
 
         # If the id is in the parameters :
-        if 'id' in kwargs:
-            path = '/vertices/'+clean(kwargs['id'])
-            return path
+        if 'eid' in self._filters:
+            eid = self._filters['eid']
+            if len(self._filters) > 1 \
+            or isinstance(eid, (list, tuple, set, frozenset)):
+                return None
+            return '/'+collection+'/'+clean(eid), {}
+
+        # If one of the parameters is indexed, and is the only filter. Only
+        # strings are sent through the REST API, other values would have to be
+        # typed for the index to match.
+        if len(self._filters) or len(self._indices) != 1:
+            return None
+        index, value = self._indices.items()[0]
+        if not isinstance(value['value'], basestring):
+            return None
+        params = {'key': value['key'], 'value': value['value']}
+        if index == value['key']:
+            # Key index, which only exists for stored and indexed keys
+            if not self._is_key_indexed(value['key']):
+                return None
+            return '/'+collection, params
+        return '/indices/'+clean(index), params
 
-        # If one of the parameters is indexed :
-        if self._indices:
-            for index, value in self._indices.items():
-                path += '/indices/'+clean(index)+u'?key='+clean(value['key'])+u'&value='+clean(value['value'])
-                # For now, we can only query on one index
-                break
-            # For now, we can only handle one index
-            return path
 
-        # If no parameter is indexed :
-        if self.model.is_node():
-            path += '/vertices'
-        else:
-            path += '/edges'
+    def _is_key_indexed(self, key):
+        """ :param key: The key of a lookup.
+        :type key: str
+        :returns: Whether the key can be looked up in a key index through the
+        REST API. The label of edges is not a property, and cannot.
+        :rtype: bool
+        """
+        return not (self._on == self.EDGE and key == 'label')
 
-        # Fillup with remaining filters
-        for key, val in kwargs.iteritems():
-            path += u'?key='+clean(key)+u'&value='+clean(val)
-            # For now, Rexster seems to support only one key/value query
-            break
 
-        return path
+    def compile(self):
+        """ Compiles the current request in Gremlin and resets all parameters.
+        execute() chooses between this and the Rexster REST API.
+        """
+        query, params = self._compile_groovy()
+        self._reset()
 
+        return query, params
 
-    def compile(self):
-        """ Compiles the current request by choosing the best method (Rexster
-        or Gremlin) and resets all parameters.
+
+    def prepare(self):
+        """ Compiles this query once, for it to be executed many times with
+        different values for its bind parameters. The query itself is not reset.
+
+        Example use :
+        >>> prepared = query.vertices().filter(name=bind('name')).out('hosts').prepare()
+        >>> pages = prepared.execute(name='Foo').all()
+
+        :returns: The prepared query.
+        :rtype: graphalchemy.ogm.query.PreparedQuery
         """
-        # Rexster :
-        # path = self._compile_rexster()
+        script, params = self._compile_groovy()
+        return PreparedQuery(script, params, self._factory())
+
+
+    def _factory(self):
+        """ :returns: A callable creating an empty query of the same kind,
+        in the same session, to execute prepared queries.
+        :rtype: callable
+        """
+        session, class_, logger, timeout = self.session, self.__class__, self.logger, self._timeout
+        return lambda: class_(session, logger=logger).timeout(timeout)
 
-        # Groovy
-        query, params = self._compile_groovy()
 
-        # Reset
+    def _reset(self):
+        """ Resets the definition of the query.
+
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
         self._filters = {}
         self._indices = {}
+        self._steps = []
+        self._order = []
+        self._offset = None
+        self._limit = None
         self._on = None
+        return self
 
-        return query, params
+
+    def _access_path(self):
+        """ Describes how the elements the query starts from are retrieved,
+        as decided by _compile_groovy().
+
+        :returns: The access path: its method ('id', 'index' or 'scan') and
+        the index or ids involved.
+        :rtype: dict
+        """
+        if 'eid' in self._filters:
+            return {'method': 'id', 'on': self._on, 'eid': self._filters['eid']}
+        for index, value in self._indices.items():
+            return {'method': 'index', 'on': self._on, 'index': index, 'key': value['key']}
+        return {'method': 'scan', 'on': self._on}
+
+
+    def explain(self):
+        """ Describes how this query will be executed, without executing it
+        nor resetting it.
+
+        Example:
+        >>> repository.filter(name='Foo').explain()
+        {'script': u'g.V("name", name)', 'params': {'name': 'Foo'},
+         'access_path': {'method': 'index', 'on': 'vertex', 'index': 'name', 'key': 'name'}}
+
+        :returns: The compiled script, its parameters and the access path.
+        :rtype: dict
+        """
+        script, params = self._compile_groovy()
+        return {
+            'script': script,
+            'params': params,
+            'access_path': self._access_path(),
+            'rexster': self._compile_rexster()
+        }
+
+
+    def profile(self):
+        """ Executes this query and measures the time spent in each phase :
+        compile, network, decode (of the server response), hydrate and
+        identity_map (lookups, included in hydrate).
+
+        Example:
+        >>> profile = repository.filter(name='Foo').profile()
+        >>> profile['timings']['network'], profile['rows']
+        (0.012, 1)
+
+        The results are then available on the query itself.
+
+        :returns: The explanation of the query, the timings (in seconds) and
+        the number of rows received, of objects hydrated and of identity map
+        hits.
+        :rtype: dict
+        """
+        self._profile = {
+            'timings': dict.fromkeys(self.PROFILE_PHASES, 0.),
+            'rows': 0,
+            'hydrated': 0,
+            'identity_map_hits': 0,
+        }
+        try:
+            start = time.time()
+            explanation = self.explain()
+            self._reset()
+            self._profile['timings']['compile'] = time.time() - start
+            if explanation['rexster'] is not None:
+                self.execute_raw_rexster(*explanation['rexster'])
+            else:
+                self.execute_raw_groovy(explanation['script'], explanation['params'])
+            self._profile['timings']['total'] = time.time() - start
+            explanation.update(self._profile)
+        finally:
+            self._profile = None
+        self._log('Profiled '+explanation['script']+' : '+str(explanation['timings']))
+        return explanation
 
 
     def execute(self):
+        """ Executes the query through the REST API of Rexster if it is a
+        plain lookup, and through Gremlin otherwise.
+
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        rexster = self._compile_rexster()
+        if rexster is not None:
+            self._reset()
+            return self.execute_raw_rexster(*rexster)
         script, params = self.compile()
         return self.execute_raw_groovy(script, params)
 
 
     def execute_raw_groovy(self, query, params={}):
-        response = self.gremlin.execute(query, params=params)
-        self._results = response.content['results']
+        self._results = self._fetch(query, params)
+        return self
+
+
+    def _fetch(self, query, params={}, timeout=None):
+        """ Executes a Groovy script and returns the raw results, without
+        hydrating them.
+
+        :param query: The Groovy script.
+        :type query: str
+        :param params: The parameters bound in the script.
+        :type params: dict
+        :param timeout: The maximal number of seconds to wait for, on top of
+        the timeouts of the query and of the session.
+        :type timeout: float
+        :returns: The decoded results.
+        :rtype: list
+        :raises: graphalchemy.ogm.query.QueryTimeout if the server stopped
+        the script at its deadline.
+        """
+        query, params = self._bind_deadline(query, params, timeout=timeout)
+        data = {'script': query, 'params': params}
+        client = self.session.client
+        if client.config.server_scripts is True:
+            data['load'] = [client.scripts.default_namespace]
+        response = self._request(POST, GREMLIN_PATH, data, timeout=timeout)
+        results = response.content['results']
+        self._check_expired(results)
+        if self._profile is not None:
+            self._profile['rows'] += len(results or [])
+        return results
+
+
+    def _bind_deadline(self, query, params, timeout=None, start='System.currentTimeMillis()'):
+        """ Gives the server the time left to execute a script compiled with
+        a deadline check. The script is run eagerly, so that the deadline
+        check stops it within the block that catches it, and it then returns
+        the timeout marker instead of its results.
+
+        :param query: The Groovy script.
+        :type query: str
+        :param params: The parameters bound in the script.
+        :type params: dict
+        :param timeout: The maximal number of seconds to give the script, on
+        top of the timeouts of the query and of the session.
+        :type timeout: float
+        :param start: The Groovy expression of the time the deadline counts
+        from, in milliseconds.
+        :type start: str
+        :returns: The script, starting with the computation of its deadline,
+        and its parameters.
+        :rtype: str, dict
+        """
+        if '_timeout' not in params:
+            return query, params
+        params = dict(params)
+        remaining = self._remaining(timeout)
+        params['_timeout'] = None if remaining is None else int(remaining * 1000)
+        query = 'def _deadline = _timeout == null ? Long.MAX_VALUE : '+start+' + _timeout; ' \
+                'def _expired = new RuntimeException(); ' \
+                'try { def _results = {'+query+'}(); ' \
+                '(_results instanceof Iterator || _results instanceof Iterable) ? _results.toList() : _results } ' \
+                'catch (Throwable e) { ' \
+                'for (def cause = e; cause != null; cause = cause.cause) { if (cause.is(_expired)) return '+quote_groovy(self.TIMEOUT_MARKER)+' }; ' \
+                'throw e }'
+        return query, params
+
+
+    def _check_expired(self, results):
+        """ Detects the marker returned by a script stopped by its deadline
+        check.
+
+        :param results: The decoded results of the script.
+        :type results: mixed
+        :raises: graphalchemy.ogm.query.QueryTimeout if the script was
+        stopped.
+        """
+        if isinstance(results, list) and len(results) == 1:
+            results = results[0]
+        if results == self.TIMEOUT_MARKER:
+            raise QueryTimeout('The server stopped the script at its deadline.')
+        return self
+
+
+    def _has_timeout(self):
+        """ :returns: Whether a timeout or a deadline applies to this query.
+        :rtype: bool
+        """
+        return self._timeout is not None \
+            or self.session.timeout is not None \
+            or self.session.deadline is not None
+
+
+    def _remaining(self, timeout=None):
+        """ :param timeout: A further limit, in seconds.
+        :type timeout: float
+        :returns: The number of seconds left for the next request, given
+        the timeout of this query and the timeout and deadline of the
+        session, or None if there is no limit.
+        :rtype: float
+        :raises: graphalchemy.ogm.query.QueryTimeout if the deadline is past.
+        """
+        limits = [limit for limit in (timeout, self._timeout, self.session.timeout) if limit is not None]
+        if self.session.deadline is not None:
+            limits.append(self.session.deadline - time.time())
+        if not len(limits):
+            return None
+        remaining = min(limits)
+        if remaining <= 0:
+            raise QueryTimeout('The deadline of the session has passed.')
+        return remaining
+
+
+    def hydrate(self):
+        """ Converts the raw results in place. Raw queries keep them as is.
+
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
         return self
 
 
     def execute_raw_rexster(self, query, params={}):
-        response = self.session.client.request.get(query, params=params)
-        self._results = response.results
+        try:
+            response = self._request(GET, query, params)
+        except LookupError:
+            # Unknown id or index
+            self._results = []
+            return self
+        results = response.content.get('results', None)
+        if results is None:
+            results = []
+        elif not isinstance(results, list):
+            results = [results]
+        self._results = results
+        if self._profile is not None:
+            self._profile['rows'] += len(results)
+        return self
+
+
+    def _request(self, method, path, params, timeout=None):
+        """ Sends a request with the timed request of the session. The
+        network round trip and the decoding of the response are measured
+        separately when the query is profiled.
+
+        :param method: The HTTP method.
+        :type method: str
+        :param path: The path of the resource, relative to the graph.
+        :type path: str
+        :param params: The parameters of the request.
+        :type params: dict
+        :param timeout: The maximal number of seconds to wait for, on top of
+        the timeouts of the query and of the session.
+        :type timeout: float
+        :returns: The decoded response.
+        :rtype: bulbs.base.Response
+        """
+        request = self._connection or self.session.get_request()
+        http = request.http
+        self._log(method+' '+path+' '+str(params))
+        timeout = self._remaining(timeout)
+        default = http.timeout
+        try:
+            if timeout is not None:
+                self._set_http_timeout(http, timeout)
+            if self._cancelled is not None and self._cancelled():
+                raise QueryCancelled('Query was cancelled.')
+            response = request.request(method, path, params)
+        except socket.timeout:
+            raise QueryTimeout('No response after '+str(timeout)+' seconds : '+path)
+        finally:
+            if timeout is not None:
+                self._set_http_timeout(http, default)
+        if self._profile is not None:
+            self._profile['timings']['network'] += response.timings['network']
+            self._profile['timings']['decode'] += response.timings['decode']
+        return response
+
+
+    def _set_http_timeout(self, http, timeout):
+        """ Sets the timeout of an HTTP connection, including the sockets it
+        keeps alive.
+
+        :param http: The HTTP connection.
+        :type http: httplib2.Http
+        :param timeout: The timeout in seconds, or None.
+        :type timeout: float
+        """
+        http.timeout = timeout
+        for connection in http.connections.values():
+            connection.timeout = timeout
+            if getattr(connection, 'sock', None) is not None:
+                connection.sock.settimeout(timeout)
         return self
 
 
@@ -279,8 +1104,11 @@ class Query(object):
         """Return the first result of this Query or None if the result doesn't
         contain any row.
 
-        Calling ``first()`` results in an execution of the underlying query.
+        Calling ``first()`` results in an execution of the underlying query,
+        that only retrieves one element.
         """
+        if self._results is None:
+            self.limit(1)
         ret = list(self)[0:1]
         if len(ret) > 0:
             return ret[0]
@@ -302,6 +1130,7 @@ class Query(object):
 
         if self._offset == 0:
             self._offset = None
+        return self
 
 
     def limit(self, limit):
@@ -327,10 +1156,384 @@ class Query(object):
             yield result
 
 
-    def delete(self):
+    def delete(self, chunk_size=None, progress=None):
+        """ Removes the elements matched by this query, server-side, in
+        batches of chunk_size elements per request. For vertices, their edges
+        are removed first, also in batches. The removed elements are evicted
+        from the session.
+
+        Each batch is taken among the elements that still match the query, so
+        a delete that was interrupted is resumed by running it again.
+
+        Example use :
+        >>> def progress(_type, count):
+        ...     print '%s %s removed' % (count, _type)
+        >>> repository.filter().delete(chunk_size=500, progress=progress)
+
+        :param chunk_size: The maximal number of elements removed per request.
+        :type chunk_size: int
+        :param progress: A callable, called after each batch with the type of
+        the elements being removed ('edge' or 'vertex') and the number of
+        them removed so far.
+        :type progress: callable
+        :returns: The number of removed elements.
+        :rtype: int
+        """
+        chunk_size = chunk_size or self.DELETE_CHUNK_SIZE
+        on = self._on
         script, params = self.compile()
-        script += '.remove()'
-        return self.execute_raw_groovy(script, params)
+        pipeline = '('+script+')._()'
+
+        # Edges first, then vertices
+        pipelines = []
+        if on == self.VERTEX:
+            pipelines.append((self.EDGE, pipeline+'.bothE.dedup()'))
+        pipelines.append((on, pipeline))
+
+        total = 0
+        for _type, pipeline in pipelines:
+            batch = 'r = '+pipeline+'[0..'+str(chunk_size - 1)+'].toList(); ' \
+                    'ids = r.collect{it.id}; r.each{it.remove()}; ids'
+            count = 0
+            while True:
+                ids = self._fetch(batch, params) or []
+                self.session.evict_ids(ids)
+                count += len(ids)
+                self._log('Removed '+str(count)+' '+_type+'s')
+                if progress is not None:
+                    progress(_type, count)
+                if len(ids) < chunk_size:
+                    break
+            total += count
+        return total
+
+
+    def update(self, **values):
+        """ Sets properties on all the elements matched by this query, in a
+        single server-side script, without loading them. None removes the
+        property. The matched elements that are loaded in the session are
+        evicted from it, since their state is no longer known.
+
+        Example use :
+        >>> query.edges().filter(label='hosts').update(accessible=False)
+        gremlin> (g.E.has("label", label))._().sideEffect{it.setProperty("accessible", set0)}.id
+
+        :param values: The values to set, by property name in the database.
+        :type values: dict
+        :returns: The number of updated elements.
+        :rtype: int
+        """
+        ids = self._update(values)
+        self.session.evict_ids(ids)
+        return len(ids)
+
+
+    def _update(self, values):
+        """ Compiles this query into a mutation setting the given values.
+
+        :param values: The values to set, by property name in the database.
+        :type values: dict
+        :returns: The ids of the updated elements.
+        :rtype: list
+        """
+        if not len(values):
+            raise Exception('No value to update.')
+        script, params = self.compile()
+        assignments = []
+        for i, (key, value) in enumerate(sorted(values.items())):
+            if value is None:
+                assignments.append('it.removeProperty('+quote_groovy(key)+')')
+            else:
+                param = 'set'+str(i)
+                params[param] = value
+                assignments.append('it.setProperty('+quote_groovy(key)+', '+param+')')
+        script = '('+script+')._().sideEffect{'+'; '.join(assignments)+'}.id'
+        ids = self._fetch(script, params) or []
+        self._log('Updated '+str(len(ids))+' elements')
+        return ids
+
+
+    def group_count(self, key):
+        """ Counts the elements matched by this query per value of a property,
+        server-side. Only the counts are sent back.
+
+        Example use :
+        >>> query.vertices().group_count('element_type')
+        {u'Website': 12, u'Page': 3456}
+        gremlin> (g.V)._().groupCount{it.getProperty(_key)}.cap.next().collect{[it.key, it.value]}
+
+        :param key: The name of the property.
+        :type key: str
+        :returns: The number of elements, by value of the property. Elements
+        without the property are counted under None.
+        :rtype: dict
+        """
+        script, params = self._compile_aggregate('group_count', key)
+        decode = self._aggregate_decoder(key)
+        counts = {}
+        for value, count in self._fetch(script, params) or []:
+            if value is not None:
+                value = decode(value)
+            counts[value] = count
+        return counts
+
+
+    def sum(self, key):
+        """ Sums the values of a property over the elements matched by this
+        query, server-side. Elements without the property are ignored.
+
+        :param key: The name of the property.
+        :type key: str
+        :returns: The sum, or None if no element has the property.
+        :rtype: mixed
+        :raises: Exception if the property is not numeric.
+        """
+        self._check_numeric(key)
+        count, total, lowest, highest = self._reduce(key, 'sum')
+        if not count:
+            return None
+        return self._aggregate_decoder(key)(total)
+
+
+    def mean(self, key):
+        """ Averages the values of a property over the elements matched by this
+        query, server-side. Elements without the property are ignored.
+
+        :param key: The name of the property.
+        :type key: str
+        :returns: The mean, or None if no element has the property.
+        :rtype: float
+        :raises: Exception if the property is not numeric.
+        """
+        self._check_numeric(key)
+        count, total, lowest, highest = self._reduce(key, 'sum')
+        if not count:
+            return None
+        return float(total) / count
+
+
+    def min(self, key):
+        """ Finds the lowest value of a property over the elements matched by
+        this query, server-side.
+
+        :param key: The name of the property.
+        :type key: str
+        :returns: The lowest value, or None if no element has the property.
+        :rtype: mixed
+        """
+        count, total, lowest, highest = self._reduce(key, 'range')
+        if not count:
+            return None
+        return self._aggregate_decoder(key)(lowest)
+
+
+    def max(self, key):
+        """ Finds the highest value of a property over the elements matched by
+        this query, server-side.
+
+        :param key: The name of the property.
+        :type key: str
+        :returns: The highest value, or None if no element has the property.
+        :rtype: mixed
+        """
+        count, total, lowest, highest = self._reduce(key, 'range')
+        if not count:
+            return None
+        return self._aggregate_decoder(key)(highest)
+
+
+    def histogram(self, key, bins=10):
+        """ Counts the values of a property falling in each bin, server-side.
+        Bins are half-open, [edge_i, edge_i+1[, except for the last one which
+        includes its upper edge. Values outside of the bins are ignored.
+
+        Example use :
+        >>> edges, counts = query.edges().histogram('since', bins=4)
+
+        :param key: The name of the property.
+        :type key: str
+        :param bins: Either a number of bins of equal width between the lowest
+        and the highest value (which costs an extra request), or the ascending
+        list of the edges of the bins.
+        :type bins: int | list
+        :returns: The edges of the bins, and the number of values in each of
+        them. Numeric properties have the same values in Python and in the
+        database, so that both kinds of edges are values of the property.
+        :rtype: list, list<int>
+        :raises: Exception if the property is not numeric.
+        """
+        self._check_numeric(key)
+        if isinstance(bins, (int, long)):
+            if bins < 1:
+                raise Exception('At least one bin is required.')
+            compiled = self.compile()
+            script, params = self._compile_aggregate('range', key, compiled=compiled)
+            count, total, lowest, highest = self._fetch(script, params)
+            if not count:
+                return [], []
+            width = float(highest - lowest) / bins
+            edges = [lowest + width * i for i in range(bins)] + [highest]
+            if width == 0:
+                edges = [lowest, highest]
+            script, params = self._compile_aggregate('histogram', key, edges=edges, compiled=compiled)
+        else:
+            edges = list(bins)
+            if len(edges) < 2:
+                raise Exception('At least two edges are required.')
+            if edges != sorted(edges):
+                raise Exception('The edges of the bins must be ascending.')
+            script, params = self._compile_aggregate('histogram', key, edges=self._aggregate_encoder(key)(edges))
+        counts = self._fetch(script, params) or []
+        return edges, counts
+
+
+    def to_columns(self, keys):
+        """ Retrieves properties of the elements matched by this query as
+        NumPy arrays, one per property, without building any object. Only the
+        ids and the requested properties are sent back.
+
+        The dtype of each column comes from the type of its property : float64
+        for Float, int64 for Integer and Long and bool for Boolean. Other
+        properties, dates included, and properties of queries that are not
+        model aware, give arrays of objects.
+
+        Example use :
+        >>> ids, columns, valid = repository.filter().to_columns(['timeTotal', 'timePreparation'])
+        >>> columns['timeTotal'][valid['timeTotal']].mean()
+
+        :param keys: The names of the properties.
+        :type keys: list<str>
+        :returns: The ids of the elements, their values for each property, and
+        for each property the mask of the elements that have a value.
+        :rtype: numpy.ndarray, dict<str, numpy.ndarray>, dict<str, numpy.ndarray>
+        """
+        if numpy is None:
+            raise Exception('to_columns() requires numpy.')
+        keys = list(keys)
+        script, params = self.compile()
+        params = dict(params)
+        params['_columns'] = [self._aggregate_key(key) for key in keys]
+        script = '('+script+')._().transform{e -> [e.id] + _columns.collect{e.getProperty(it)}}'
+        rows = self._fetch(script, params) or []
+        self._log('Retrieved '+str(len(rows))+' rows of '+str(len(keys))+' columns')
+
+        if len(rows):
+            values = zip(*rows)
+        else:
+            values = [()] * (len(keys) + 1)
+        try:
+            ids = numpy.array(values[0], dtype='int64')
+        except (TypeError, ValueError, OverflowError):
+            ids, _ = to_array(list(values[0]))
+        columns = {}
+        valid = {}
+        for key, column in zip(keys, values[1:]):
+            type_ = self._column_type(key)
+            if type_ is None:
+                columns[key], valid[key] = to_array(list(column))
+                continue
+            columns[key], valid[key] = to_array(type_.to_py_many(column), type_.dtype)
+        return ids, columns, valid
+
+
+    def _column_type(self, key):
+        """ :returns: The type of a property retrieved by to_columns(), or
+        None if it is not known.
+        :rtype: graphalchemy.blueprints.types.Type
+        """
+        return None
+
+
+    def _check_numeric(self, key):
+        """ Checks that a property can be summed, averaged and binned.
+
+        :param key: The name of the property.
+        :type key: str
+        :raises: Exception if the property is known not to be numeric.
+        """
+        return self
+
+
+    def _reduce(self, key, kind):
+        """ Executes a reduction of a property.
+
+        :param key: The name of the property.
+        :type key: str
+        :param kind: 'sum' or 'range'.
+        :type kind: str
+        :returns: The number of values, their sum (if kind is 'sum') and their
+        lowest and highest values (if kind is 'range').
+        :rtype: list
+        """
+        script, params = self._compile_aggregate(kind, key)
+        return self._fetch(script, params) or [0, None, None, None]
+
+
+    def _compile_aggregate(self, kind, key, edges=None, compiled=None):
+        """ Compiles this query into a script aggregating a property.
+
+        :param kind: 'group_count', 'sum', 'range' or 'histogram'.
+        :type kind: str
+        :param key: The name of the property.
+        :type key: str
+        :param edges: The edges of the bins, in database values, for histograms.
+        :type edges: list
+        :param compiled: The script and parameters of this query, when it has
+        already been compiled.
+        :type compiled: (str, dict)
+        :returns: The gremlin script and its parameters.
+        :rtype: str, dict
+        """
+        if compiled is None:
+            compiled = self.compile()
+        script, params = compiled
+        params = dict(params)
+        params['_key'] = self._aggregate_key(key)
+        pipeline = '('+script+')._()'
+        values = pipeline+'.transform{it.getProperty(_key)}.filter{it != null}'
+
+        if kind == 'group_count':
+            return pipeline+'.groupCount{it.getProperty(_key)}.cap.next()' \
+                   '.collect{[it.key, it.value]}', params
+        elif kind == 'sum':
+            return '_n = 0; _s = 0L; '+values+'.sideEffect{_n += 1; _s += it}' \
+                   '.iterate(); [_n, _s, null, null]', params
+        elif kind == 'range':
+            return '_n = 0; _lo = null; _hi = null; '+values+'.sideEffect{' \
+                   '_n += 1; if (_lo == null || it < _lo) _lo = it; ' \
+                   'if (_hi == null || it > _hi) _hi = it}' \
+                   '.iterate(); [_n, null, _lo, _hi]', params
+        elif kind == 'histogram':
+            params['_edges'] = edges
+            return '_c = [0] * (_edges.size() - 1); '+values+'.sideEffect{' \
+                   '_v = it; _i = _edges.findLastIndexOf{it <= _v}; ' \
+                   'if (_i >= 0 && (_i < _c.size() || _v == _edges[-1])) ' \
+                   '_c[Math.min(_i, _c.size() - 1)] += 1}' \
+                   '.iterate(); _c', params
+        raise Exception('Unknown aggregate : '+str(kind))
+
+
+    def _aggregate_key(self, key):
+        """ :returns: The name in the database of an aggregated property.
+        :rtype: str
+        """
+        return key
+
+
+    def _aggregate_decoder(self, key):
+        """ :returns: The function converting aggregated database values of a
+        property to Python values.
+        :rtype: callable
+        """
+        return lambda value: value
+
+
+    def _aggregate_encoder(self, key):
+        """ :returns: The function converting a list of Python values of a
+        property to database values.
+        :rtype: callable
+        """
+        return lambda values: values
 
 
     def _log(self, message, level=10):
@@ -350,31 +1553,506 @@ class Query(object):
 
 
 class ModelAwareQuery(Query):
+    """ A query that hydrates its results into mapped objects.
+
+    When it is given the model it starts from, the traversal steps are checked
+    against the adjacencies of the metadata, and the property names are
+    converted to their database names :
+    >>> query = ModelAwareQuery(session, model=website).vertices()
+    >>> query = query.filter(name='Foo').out('hosts').as_('page')
+    >>> query = query.out('describes').back('page').dedup()
+    """
 
     def __init__(self, session, *args, **kwargs):
         self.metadata_map = session.metadata_map
         super(ModelAwareQuery, self).__init__(session, *args, **kwargs)
+        # Model of the elements at the current position of the traversal, and
+        # the adjacencies that led there.
+        self._model = kwargs.get('model', None)
+        self._adjacencies = []
+        self._named = {}
+        self._read_only = False
+
+
+    def out(self, label=None):
+        self._walk(label, 'out', edge=False)
+        return super(ModelAwareQuery, self).out(label)
+
+
+    def in_(self, label=None):
+        self._walk(label, 'in', edge=False)
+        return super(ModelAwareQuery, self).in_(label)
+
+
+    def both(self, label=None):
+        self._walk(label, 'both', edge=False)
+        return super(ModelAwareQuery, self).both(label)
+
+
+    def outE(self, label=None):
+        self._walk(label, 'out', edge=True)
+        return super(ModelAwareQuery, self).outE(label)
+
+
+    def inE(self, label=None):
+        self._walk(label, 'in', edge=True)
+        return super(ModelAwareQuery, self).inE(label)
+
+
+    def bothE(self, label=None):
+        self._walk(label, 'both', edge=True)
+        return super(ModelAwareQuery, self).bothE(label)
+
+
+    def outV(self):
+        self._leave_edge('out')
+        return super(ModelAwareQuery, self).outV()
+
+
+    def inV(self):
+        self._leave_edge('in')
+        return super(ModelAwareQuery, self).inV()
+
+
+    def has(self, key, value):
+        if self._model is not None:
+            prop = self._model._properties.get(key, None)
+            if prop is None:
+                raise Exception('Property %s not found in model %s' % (key, self._model, ))
+            key = prop.name_db
+        return super(ModelAwareQuery, self).has(key, value)
+
+
+    def order_by(self, key, desc=False):
+        if self._model is None:
+            return super(ModelAwareQuery, self).order_by(key, desc)
+        prop = self._model._properties.get(key, None)
+        if prop is None:
+            raise Exception('Property %s not found in model %s' % (key, self._model, ))
+        sort_key = bool(self._model.is_relationship() and prop.primaryKey)
+        return self._add_order(prop.name_db, desc, sort_key=sort_key)
+
+
+    def as_(self, name):
+        self._named[name] = (self._model, self._adjacencies)
+        return super(ModelAwareQuery, self).as_(name)
+
+
+    def back(self, name):
+        if name not in self._named:
+            raise Exception('No step named '+str(name))
+        self._model, self._adjacencies = self._named[name]
+        return super(ModelAwareQuery, self).back(name)
+
+
+    def update(self, **values):
+        """ Sets properties on all the elements matched by this query, in a
+        single server-side script, without loading them. The values are
+        validated and converted by the properties of the model the query ends
+        on, and the matching objects of the session are updated accordingly.
+
+        Their loaded relations are kept : the edges of a relation only depend
+        on their class and their ends, which an update does not change, and
+        they hold the same objects, which see the new values.
+
+        Example use :
+        >>> repository.filter(name='Foo').outE('hosts').update(accessible=False)
+
+        :param values: The values to set, by property name in Python.
+        :type values: dict
+        :returns: The number of updated elements.
+        :rtype: int
+        """
+        if self._model is None:
+            raise Exception('Cannot update elements of an unknown model.')
+        values_db = {}
+        for name_py, value in values.iteritems():
+            prop = self._model._properties.get(name_py, None)
+            if prop is None:
+                raise Exception('Property %s not found in model %s' % (name_py, self._model, ))
+            ok, errors = prop.validate(value)
+            if not ok:
+                raise Exception('Invalid value for %s : %s' % (prop, ', '.join(errors), ))
+            values_db[prop.name_db] = None if value is None else prop.to_db(value)
+
+        ids = self._update(values_db)
+
+        # Synchronize the loaded objects
+        with self.session.lock:
+            for id in ids:
+                obj = self.session.identity_map.get_by_id(id)
+                if obj is None:
+                    continue
+                for name_py, value in values.iteritems():
+                    setattr(obj, name_py, value)
+                self.session.identity_map[obj].update_attributes(values)
+        return len(ids)
+
+
+    def read_only(self):
+        """ Hydrates the results into compact, read-only records instead of
+        mapped objects. They are not tracked by the session, which saves the
+        identity map lookups, and take much less memory. They can be promoted
+        to mapped objects when needed.
+
+        Example use :
+        >>> for page in repository.filter().read_only():
+        ...     print page.title
+
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.ModelAwareQuery
+        """
+        self._read_only = True
+        return self
+
+
+    def _factory(self):
+        session, model, logger, timeout = self.session, self._model, self.logger, self._timeout
+        read_only = self._read_only
+        def factory():
+            query = ModelAwareQuery(session, model=model, logger=logger).timeout(timeout)
+            query._read_only = read_only
+            return query
+        return factory
+
+
+    def _is_key_indexed(self, key):
+        if self._model is None:
+            return super(ModelAwareQuery, self)._is_key_indexed(key)
+        # Nodes are looked up by model name
+        if self._model.is_node() and key == self._model.model_name_storage_key:
+            return True
+        return key in [prop.name_db for prop in self._model.indices.itervalues()]
+
+
+    def _aggregated_property(self, key):
+        """ Finds the property aggregated by group_count(), sum(), etc. in the
+        model the query ends on. Its model name is aggregated as is.
+
+        :param key: The name of the property in Python.
+        :type key: str
+        :returns: The property, or None if the key is not mapped.
+        :rtype: graphalchemy.blueprints.schema.Property
+        """
+        if self._model is None \
+        or key == self._model.model_name_storage_key:
+            return None
+        prop = self._model._properties.get(key, None)
+        if prop is None:
+            raise Exception('Property %s not found in model %s' % (key, self._model, ))
+        return prop
+
+
+    def _aggregate_key(self, key):
+        prop = self._aggregated_property(key)
+        if prop is None:
+            return key
+        return prop.name_db
+
+
+    def _column_type(self, key):
+        prop = self._aggregated_property(key)
+        if prop is None:
+            return None
+        return prop.type
+
+
+    def _check_numeric(self, key):
+        prop = self._aggregated_property(key)
+        if prop is None:
+            return self
+        # Booleans and dates are stored as numbers, but cannot be summed
+        if not isinstance(prop.type, Numeric) or isinstance(prop.type, Boolean):
+            raise Exception('Property %s of model %s is not numeric.' % (key, self._model, ))
+        return self
+
+
+    def _aggregate_decoder(self, key):
+        prop = self._aggregated_property(key)
+        if prop is None:
+            return lambda value: value
+        return prop.to_py
+
+
+    def _aggregate_encoder(self, key):
+        prop = self._aggregated_property(key)
+        if prop is None:
+            return lambda values: values
+        return prop.to_db_many
+
+
+    def _walk(self, label, direction, edge):
+        """ Moves the current model of the traversal through the adjacencies
+        of the given label.
+
+        :param label: The label of the relationship to walk through.
+        :type label: str
+        :param direction: 'out', 'in' or 'both'.
+        :type direction: str
+        :param edge: Whether the traversal stops on the edges.
+        :type edge: bool
+        """
+        if self._model is None:
+            return self
+        if not self._model.is_node():
+            raise Exception('Cannot walk to adjacent elements from '+str(self._model))
+
+        adjacencies = []
+        for adjacency in self._model._adjacencies.values():
+            if label is not None \
+            and adjacency.relationship.model_name != label:
+                continue
+            if direction in ('out', 'both') and adjacency.out_node is self._model:
+                adjacencies.append((adjacency, adjacency.in_node))
+            if direction in ('in', 'both') and adjacency.in_node is self._model:
+                adjacencies.append((adjacency, adjacency.out_node))
+        if not len(adjacencies):
+            raise Exception('No adjacency %s %s found for %s' % (direction, label, self._model, ))
+
+        self._adjacencies = [adjacency for adjacency, node in adjacencies]
+        if edge:
+            models = set([adjacency.relationship for adjacency, node in adjacencies])
+        else:
+            models = set([node for adjacency, node in adjacencies])
+        self._model = models.pop() if len(models) == 1 else None
+        return self
+
+
+    def _leave_edge(self, direction):
+        """ Moves the current model of the traversal from edges to one of their
+        ends.
+
+        :param direction: 'out' or 'in'.
+        :type direction: str
+        """
+        if self._model is None:
+            return self
+        if not self._model.is_relationship():
+            raise Exception('Cannot walk to the vertices of '+str(self._model))
+        adjacencies = self._adjacencies or self._model._adjacencies.values()
+        if direction == 'out':
+            models = set([adjacency.out_node for adjacency in adjacencies])
+        else:
+            models = set([adjacency.in_node for adjacency in adjacencies])
+        self._model = models.pop() if len(models) == 1 else None
+        return self
 
 
     def execute_raw_groovy(self, query, params={}):
         super(ModelAwareQuery, self).execute_raw_groovy(query, params=params)
         if self._results is not None:
             self.hydrate()
+        return self
+
+
+    def execute_raw_rexster(self, query, params={}):
+        super(ModelAwareQuery, self).execute_raw_rexster(query, params=params)
+        if self._results is not None:
+            self.hydrate()
+        return self
 
 
     def hydrate(self):
-        for i, result in enumerate(self._results):
-            self._results[i] = self._build_object(result)
+        start = time.time()
+        if self._read_only:
+            records = self.metadata_map._objects_from_dicts(self._results, records=True)
+            for i, record in enumerate(records):
+                # Elements that are not mapped are kept as is
+                if record is not None:
+                    self._results[i] = record
+            if self._profile is not None:
+                self._profile['hydrated'] += len(records)
+                self._profile['timings']['hydrate'] += time.time() - start
+            return self
+        # The identity map is shared by all the queries of the session
+        with self.session.lock:
+            results = self._results
+            # Rows that are not in the session, by id, hydrated all at once
+            pending = {}
+            for i, result in enumerate(results):
+                obj = self._lookup(result)
+                if obj:
+                    results[i] = obj
+                    continue
+                key = result.get('_id', None)
+                pending.setdefault(i if key is None else ('_id', key), []).append(i)
+            rows = [results[positions[0]] for positions in pending.itervalues()]
+            objs = self.metadata_map._objects_from_dicts(rows)
+            for positions, obj in zip(pending.itervalues(), objs):
+                # Elements that are not mapped are kept as is
+                if obj is None:
+                    continue
+                self._register(obj)
+                for i in positions:
+                    results[i] = obj
+            # The states of the objects may be shared with other queries
+            self._remember_cohort(results)
+        if self._profile is not None:
+            self._profile['timings']['hydrate'] += time.time() - start
+        # Eager relations are loaded out of the lock, which is not held
+        # during round trips : their own hydration and filling take it.
+        self._load_eager([obj for obj in objs if obj is not None])
+        return self
+
+
+    def _remember_cohort(self, objs):
+        """ Links the objects of a result set together, so that the first
+        lazy relation read on one of them loads it for all of them.
+
+        :param objs: The hydrated results.
+        :type objs: list<object>
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.ModelAwareQuery
+        """
+        states = {}
+        for obj in objs:
+            state = getattr(obj, '__ga_state', None)
+            if state is not None:
+                states[id(obj)] = (obj, state)
+        if len(states) < 2:
+            return self
+        cohort = [weakref.ref(obj) for obj, state in states.itervalues()]
+        for obj, state in states.itervalues():
+            state.join(cohort)
+        return self
+
+
+    def _load_eager(self, objs):
+        """ Loads the relations of the new objects whose adjacency is eager,
+        in one traversal per class and relation.
+
+        :param objs: The objects that were just hydrated.
+        :type objs: list<object>
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.ModelAwareQuery
+        """
+        classes = {}
+        for obj in objs:
+            classes.setdefault(obj.__class__, []).append(obj)
+        for class_, instances in classes.iteritems():
+            model = self.metadata_map.for_class(class_)
+            if not model.is_node():
+                continue
+            for name, adjacency in model._adjacencies.iteritems():
+                if adjacency.loading == Adjacency.EAGER:
+                    self.session._load_relations(instances, name)
+        return self
+
 
     def _build_object(self, result):
+        obj = self._lookup(result)
+        if obj:
+            return obj
+        obj = self.metadata_map._object_from_dict(result)
+        # Elements that are not mapped are returned as is
+        if obj is None:
+            return result
+        self._register(obj)
+        return obj
+
+
+    def _lookup(self, result):
+        """ :returns: The object of the session with the id of a result, if
+        any.
+        :rtype: object
+        """
         if not isinstance(result, dict):
             raise Exception('Expected dict, got '+str(result))
-        # Check if not in session
+        if self._profile is None:
+            return self.session.identity_map.get_by_id(result.get('_id'))
+        start = time.time()
         obj = self.session.identity_map.get_by_id(result.get('_id'))
+        self._profile['timings']['identity_map'] += time.time() - start
         if obj:
-            return obj
-        obj = self.metadata_map._object_from_dict(result)
-        # Register in identity map
-        self.session.identity_map.add(obj, update=True)
+            self._profile['identity_map_hits'] += 1
+        return obj
+
+
+    def _register(self, obj):
+        """ Registers a hydrated object in the identity map, with the values of
+        its properties as its persisted state.
+        """
+        if self._profile is not None:
+            self._profile['hydrated'] += 1
+        model = self.metadata_map.for_object(obj)
+        attributes = {}
+        for property in model._properties.itervalues():
+            attributes[property.name_py] = getattr(obj, property.name_py, None)
+        self.session.identity_map.add(obj, update=True, attributes=attributes)
         return obj
 
+
+
+class PreparedQuery(object):
+    """ A query compiled once and executed many times with different values.
+    The script sent to the server never changes, so that the server can cache
+    its compilation, and only the parameters are bound at each execution.
+
+    Prepared queries are not modified by their execution : each one creates a
+    new query holding its results, sent over a connection of its own thread.
+    They can thus be shared between threads.
+
+    Example use :
+    >>> prepared = repository.prepare(domain=bind('d'))
+    >>> website = prepared.execute(d='allrecipes.com').one()
+    """
+
+    def __init__(self, script, params, factory):
+        """ Creates the prepared query.
+
+        :param script: The compiled script.
+        :type script: str
+        :param params: The parameters of the script, some of them being bind
+        parameters.
+        :type params: dict
+        :param factory: Creates the queries that execute the script.
+        :type factory: callable
+        """
+        self.script = script
+        self._params = dict(params)
+        self._factory = factory
+        self.binds = frozenset([value.name for value in self._params.itervalues() if isinstance(value, Bind)])
+        self._local = threading.local()
+
+
+    def execute(self, **values):
+        """ Executes the query with the given values of its bind parameters.
+
+        :param values: The values, by name of bind parameter.
+        :type values: dict
+        :returns: A new query holding the results.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        unknown = set(values.keys()) - self.binds
+        if len(unknown):
+            raise Exception('Unknown bind parameters : '+', '.join(sorted(unknown)))
+        params = {}
+        for name, value in self._params.iteritems():
+            if isinstance(value, Bind):
+                if value.name not in values:
+                    raise Exception('Missing value for bind parameter '+str(value.name))
+                value = values[value.name]
+            params[name] = value
+
+        query = self._factory()
+        query._connection = self._get_request(query.session)
+        try:
+            query.execute_raw_groovy(self.script, params)
+        finally:
+            query._connection = None
+        return query
+
+
+    def _get_request(self, session):
+        """ :returns: The request of the current thread.
+        :rtype: bulbs.rest.Request
+        """
+        request = getattr(self._local, 'request', None)
+        if request is None:
+            request = build_request(session.client)
+            self._local.request = request
+        return request
+
+
+    def __repr__(self):
+        return '<PreparedQuery '+self.script+'>'
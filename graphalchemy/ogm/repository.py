@@ -6,6 +6,7 @@
 # ==============================================================================
 
 from graphalchemy.ogm.query import ModelAwareQuery
+from graphalchemy.ogm.query import NoResultFound
 
 
 # ==============================================================================
@@ -78,7 +79,8 @@ class Repository(object):
 
 
     def get(self, id):
-        """ Retrieves an element from its id.
+        """ Retrieves an element from its id, in a single request if it is not
+        already in the identity map.
 
         Example use :
         >>> website = repository.get(123)
@@ -87,44 +89,88 @@ class Repository(object):
         :type id: int
         :returns: The object with the given id in the database.
         :rtype: object
+        :raises: graphalchemy.ogm.query.NoResultFound if no element exists.
         """
 
         # Retrieve from DB or identity map
-        response, loaded = self.session.get_vertex(id)
+        try:
+            if self.model.is_relationship():
+                response, loaded = self.session.get_edge(id)
+            else:
+                response, loaded = self.session.get_vertex(id)
+        except LookupError:
+            raise NoResultFound('No element was found for id '+str(id))
         if not loaded:
             self._log('Object found in entity map')
+            model = self.session.metadata_map.for_object(response)
+            self._check_model_name(model.model_name)
             return response
         self._log('Object not found in entity map')
-        results = response.content['results']
+        result = response.content['results']
 
-        # Verify id
-        result = ModelAwareQuery(self.session).vertices() \
-                                              .filter(eid=id) \
-                                              .one()
-
-        # @todo
-        # add a check model
+        # Verify model
+        self._check_type(result.get('_type'))
+        if self.model.is_relationship():
+            self._check_model_name(result.get('_label'))
+        else:
+            self._check_model_name(result.get(self.model.model_name_storage_key))
 
+        # Hydrate from the same response
+        result = ModelAwareQuery(self.session)._build_object(result)
         if int(result.id) != int(id):
             raise Exception('Expected '+str(id)+', got '+str(result.id ))
 
         return result
 
 
+    def get_many(self, ids, missing='none', chunk_size=None):
+        """ Retrieves a list of elements from their ids, in as few requests as
+        possible.
+
+        Example use :
+        >>> websites = repository.get_many([123, 456], missing='skip')
+
+        :param ids: The element ids.
+        :type ids: iterable<int>
+        :param missing: The policy for ids that are not found, see
+        graphalchemy.ogm.session.Session.get_many().
+        :type missing: str
+        :param chunk_size: The maximal number of ids sent in one request.
+        :type chunk_size: int
+        :returns: The objects with the given ids, in the same order.
+        :rtype: list<object>
+        """
+        results = self.session.get_many(ids,
+            _type=self.model.model_type,
+            missing=missing,
+            chunk_size=chunk_size
+        )
+        for result in results:
+            if result is None:
+                continue
+            model = self.session.metadata_map.for_object(result)
+            self._check_model_name(model.model_name)
+        return results
+
+
     def filter(self, **kwargs):
         """ We have to pre-process the query here to use the right index.
         """
-        query = ModelAwareQuery(self.session).vertices()
+        query = ModelAwareQuery(self.session, model=self.model, logger=self.logger)
+        if self.model.is_relationship():
+            query.edges()
+        else:
+            query.vertices()
         # If one of the arguments is indexed, we use it first.
         indices = self.model._useful_indices_among(kwargs)
         if len(indices):
-            index_name = indices[0]
+            index_name = self.model.indices[indices[0]].name_db
             key = index_name
-            value = kwargs[index_name]
+            value = kwargs.pop(indices[0])
             query.filter_on_index(index_name, key, value)
-            kwargs.pop(index_name)
-        # Else, we simply use the index on the model name.
-        else:
+        # Else, we simply use the index on the model name. Edges have no such
+        # index, as their model name is their label, not a property.
+        elif self.model.is_node():
             index_name = self.model.model_name_storage_key
             key = index_name
             value = self.model.model_name
@@ -135,21 +181,89 @@ class Repository(object):
         for name_py, value in kwargs.iteritems():
             prop = self.model._properties.get(name_py, None)
             if prop is None:
-                raise Exception('Property %s not found in model %s' % (name_py, prop, ))
+                raise Exception('Property %s not found in model %s' % (name_py, self.model, ))
             filters[prop.name_db] = value
 
+        if self.model.is_relationship():
+            filters[self.model.model_name_storage_key] = self.model.model_name
         query.filter(**filters)
         return query
 
 
-    def truncate(self):
-        query = self.filter().delete()
+    def prepare(self, **kwargs):
+        """ Compiles a filter once, for it to be executed many times with the
+        values of its bind parameters.
+
+        Example use :
+        >>> prepared = repository.prepare(domain=bind('d'))
+        >>> website = prepared.execute(d='allrecipes.com').one()
+
+        :returns: The prepared query, that can be shared between threads.
+        :rtype: graphalchemy.ogm.query.PreparedQuery
+        """
+        return self.filter(**kwargs).prepare()
+
+
+    def out(self, label=None):
+        """ Starts a traversal from all the elements of this repository, to
+        the adjacent vertices through outgoing edges.
+
+        Example use :
+        >>> pages = repository.out('hosts').all()
+
+        :param label: The label of the edges to walk through.
+        :type label: str
+        :returns: The query, that can be refined with further steps.
+        :rtype: graphalchemy.ogm.query.ModelAwareQuery
+        """
+        return self.filter().out(label)
+
+
+    def in_(self, label=None):
+        """ Starts a traversal from all the elements of this repository, to
+        the adjacent vertices through incoming edges.
+
+        :param label: The label of the edges to walk through.
+        :type label: str
+        :returns: The query, that can be refined with further steps.
+        :rtype: graphalchemy.ogm.query.ModelAwareQuery
+        """
+        return self.filter().in_(label)
+
+
+    def both(self, label=None):
+        """ Starts a traversal from all the elements of this repository, to
+        the adjacent vertices through edges of both directions.
+
+        :param label: The label of the edges to walk through.
+        :type label: str
+        :returns: The query, that can be refined with further steps.
+        :rtype: graphalchemy.ogm.query.ModelAwareQuery
+        """
+        return self.filter().both(label)
+
+
+    def truncate(self, chunk_size=None, progress=None):
+        """ Removes all the elements of this repository, in batches.
+
+        Example use :
+        >>> repository.truncate(chunk_size=500)
+
+        :param chunk_size: The maximal number of elements removed per request.
+        :type chunk_size: int
+        :param progress: A callable, called after each batch, see
+        graphalchemy.ogm.query.Query.delete().
+        :type progress: callable
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.repository.Repository
+        """
+        self.filter().delete(chunk_size=chunk_size, progress=progress)
         return self
 
 
     def _check_model_name(self, model_name):
         if model_name != self.model.model_name:
-            raise Exception('Expected vertex, got '+str(model_name))
+            raise Exception('Expected '+self.model.model_name+', got '+str(model_name))
         return True
 
 
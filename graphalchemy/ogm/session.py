@@ -7,12 +7,28 @@
 
 # System
 import importlib
+import threading
+import time
 
 # Services
+from graphalchemy.blueprints.schema import MetaData
+from graphalchemy.blueprints.schema import Relationship
+from graphalchemy.blueprints.schema import RelationProxy
+from graphalchemy.blueprints.schema import discard_relationship
+from graphalchemy.blueprints.schema import expire_relations
+from graphalchemy.blueprints.schema import iter_relations
+from graphalchemy.blueprints.validation import ValidationError
 from graphalchemy.ogm.identity import IdentityMap
 from graphalchemy.ogm.unitofwork import UnitOfWork
 from graphalchemy.ogm.repository import Repository
+from graphalchemy.ogm.query import Query
 from graphalchemy.ogm.query import ModelAwareQuery
+from graphalchemy.ogm.query import NoResultFound
+from graphalchemy.ogm.query import build_request
+from graphalchemy.ogm.executor import Executor
+
+# Clients
+from bulbs.rest import GET
 
 
 # ==============================================================================
@@ -25,14 +41,62 @@ class OGM(object):
     as a proxy for the current session.
     """
 
-    def __init__(self, client, model_paths=[], logger=None):
+    def __init__(self, client, model_paths=[], logger=None, workers=None, timeout=None, cache_dir=None, validation=None):
+        """ Creates the OGM.
+
+        Example use :
+        >>> ogm = OGM(client, model_paths=[
+        ...     'myapp.models.blog',
+        ...     {'Product': 'myapp.models.shop', 'Order': 'myapp.models.shop'}
+        ... ])
+
+        :param client: The client of the database.
+        :type client: bulbs.client.Client
+        :param model_paths: The modules of the models, each holding them in a
+        module-level 'metadata' variable. Dictionaries map model names to the
+        module that is only imported on first use of the model.
+        :type model_paths: list<str|dict>
+        :param validation: The validation policy of the sessions, see
+        graphalchemy.ogm.session.Session.VALIDATION_RAISE.
+        :type validation: str
+        """
         self.logger = logger
         self.client = client
-        module = importlib.import_module(model_paths[0])
-        self.metadata = module.__dict__.get('metadata')
+        self.metadata = self._load_metadata(model_paths)
+        # The metadata is frozen, and its generated code cached on disk as
+        # models are used
+        if cache_dir is not None:
+            self.metadata.freeze(cache_dir=cache_dir)
         self._session = None
+        self._executor = None
+        self.workers = workers
+        self.timeout = timeout
+        self.validation = validation or Session.VALIDATION_RAISE
         self.repositorys = {}
 
+    def _load_metadata(self, model_paths):
+        """ Imports the modules of the models and merges their metadata.
+
+        :param model_paths: The modules of the models, or dictionaries of the
+        deferred ones by model name.
+        :type model_paths: list<str|dict>
+        :returns: The metadata of all models.
+        :rtype: graphalchemy.blueprints.schema.Metadata
+        """
+        paths = [path for path in model_paths if not isinstance(path, dict)]
+        deferred = [path for path in model_paths if isinstance(path, dict)]
+        # A single module keeps its own metadata
+        if len(paths) == 1 and not len(deferred):
+            module = importlib.import_module(paths[0])
+            return module.__dict__.get('metadata')
+        metadata = MetaData()
+        for path in paths:
+            metadata.load(path)
+        for models in deferred:
+            for model_name, path in models.iteritems():
+                metadata.defer(model_name, path)
+        return metadata
+
     def repository(self, model_name):
         """ Returns the repository corresponding to the requested model.
         """
@@ -56,6 +120,10 @@ class OGM(object):
     def close(self):
         self.get_session().clear()
         self._session = None
+        self.repositorys = {}
+        if self._executor is not None:
+            self._executor.close()
+            self._executor = None
         return self
 
     def get_session(self):
@@ -63,7 +131,9 @@ class OGM(object):
             self._session = Session(
                 client=self.client,
                 metadata=self.metadata,
-                logger=self.logger
+                logger=self.logger,
+                timeout=self.timeout,
+                validation=self.validation
             )
         return self._session
 
@@ -72,6 +142,52 @@ class OGM(object):
         query.execute_raw_groovy(groovy, params)
         return query
 
+    def gather(self, *queries, **kwargs):
+        """ Executes independent queries concurrently and returns their
+        results in the same order.
+
+        Example use :
+        >>> websites, pages = ogm.gather(
+        ...     ogm.repository('Website').filter(name='Foo'),
+        ...     ogm.repository('Page').filter(title='Bar')
+        ... )
+
+        :param queries: The queries to execute.
+        :type queries: graphalchemy.ogm.query.Query
+        :param pipeline: Whether to send all the queries in a single script
+        instead of one request per query.
+        :type pipeline: bool
+        :param timeout: The maximal number of seconds to wait for all of them.
+        :type timeout: float
+        :returns: The results of each query.
+        :rtype: list<list>
+        """
+        return self.get_executor().gather(queries, **kwargs)
+
+    def gather_async(self, *queries):
+        """ Starts executing independent queries concurrently, and returns
+        immediately.
+
+        Example use :
+        >>> handle = ogm.gather_async(query1, query2)
+        >>> results1, results2 = handle.result()
+
+        :param queries: The queries to execute.
+        :type queries: graphalchemy.ogm.query.Query
+        :returns: A handle on the execution.
+        :rtype: graphalchemy.ogm.executor.GatherHandle
+        """
+        return self.get_executor().gather_async(queries)
+
+    def get_executor(self):
+        if self._executor is None:
+            self._executor = Executor(
+                self.get_session(),
+                workers=self.workers,
+                logger=self.logger
+            )
+        return self._executor
+
 
 
 class Session(object):
@@ -81,11 +197,38 @@ class Session(object):
     is called.
     """
 
-    def __init__(self, client, metadata, logger=None):
+    # Policies applied by get_many() to ids that are not found
+    MISSING_NONE = 'none'
+    MISSING_SKIP = 'skip'
+    MISSING_RAISE = 'raise'
+
+    # Maximal number of ids sent in a single request by get_many()
+    GET_MANY_CHUNK_SIZE = 1000
+
+    # Policies applied by commit() to objects that are not valid
+    VALIDATION_RAISE = 'raise'
+    VALIDATION_COLLECT = 'collect'
+    VALIDATION_IGNORE = 'ignore'
+
+    def __init__(self, client, metadata, logger=None, timeout=None, validation=VALIDATION_RAISE):
         self.identity_map = IdentityMap()
+        self.identity_map.session = self
+        self.lock = threading.RLock()
         self.metadata_map = metadata
         self.client = client
         self.logger = logger
+        self._request = None
+
+        # Maximal duration of each request, and time by which all the requests
+        # of the session must be done.
+        self.timeout = timeout
+        self.deadline = None
+
+        # What commit() does with invalid objects : raise a ValidationError
+        # before anything is written, skip them and collect their errors in
+        # validation_errors, or write them anyway.
+        self.validation = validation
+        self.validation_errors = []
 
         self._add = []
         self._delete = []
@@ -127,6 +270,29 @@ class Session(object):
         return self
 
 
+    def evict_ids(self, ids):
+        """ Stops tracking the entities with the given ids, typically because
+        they were removed from the database by a query.
+
+        :param ids: The ids of the entities to evict.
+        :type ids: iterable<int>
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.session.Session
+        """
+        with self.lock:
+            for id in ids:
+                obj = self.identity_map.remove_by_id(id)
+                if obj is None:
+                    continue
+                # The loaded relations may not hold anymore
+                expire_relations(obj)
+                if obj in self._add:
+                    self._add.remove(obj)
+                if obj in self._delete:
+                    self._delete.remove(obj)
+        return self
+
+
     def clear(self):
         """ Clears the current session.
         :returns: This object itself.
@@ -138,6 +304,64 @@ class Session(object):
         return self
 
 
+    def promote(self, record):
+        """ Converts a read-only record into an object of the mapped class,
+        tracked by this session. If the element is already in the session, its
+        object is returned.
+
+        Example use :
+        >>> page = session.promote(record)
+
+        :param record: The record to promote.
+        :type record: graphalchemy.blueprints.schema.Record
+        :returns: The mapped object.
+        :rtype: object
+        """
+        with self.lock:
+            obj = self.identity_map.get_by_id(record.id)
+            if obj is not None:
+                return obj
+            model = record._model
+            class_ = self.metadata_map.for_model(model)
+            obj = class_.__new__(class_)
+            obj.id = record.id
+            for name_py in model._properties.iterkeys():
+                setattr(obj, name_py, getattr(record, name_py))
+            return ModelAwareQuery(self)._register(obj)
+
+
+    def get_request(self):
+        """ :returns: The request the queries of this session are sent with,
+        created on first use.
+        :rtype: bulbs.rest.Request
+        """
+        if self._request is None:
+            self._request = build_request(self.client)
+        return self._request
+
+
+    def set_deadline(self, seconds):
+        """ Sets the time by which all the requests of this session must be
+        done, for instance to bound the time spent serving a web request. Later
+        requests fail with graphalchemy.ogm.query.QueryTimeout.
+
+        Example use :
+        >>> session.set_deadline(2.)
+        >>> websites = repository.filter(name='Foo').all()
+
+        :param seconds: The number of seconds from now, or None to remove the
+        deadline.
+        :type seconds: float
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.session.Session
+        """
+        if seconds is None:
+            self.deadline = None
+        else:
+            self.deadline = time.time() + seconds
+        return self
+
+
     def commit(self):
         """ Performs all changes scheduled in the current session, grouped in
         a UnitOfWork.
@@ -146,31 +370,80 @@ class Session(object):
         """
 
         uow = UnitOfWork(self.client, self.identity_map, self.metadata_map, logger=self.logger)
+        add = self._validate(uow)
 
         # We need to save/update nodes first
-        for obj in self._add:
+        for obj in add:
             if self.metadata_map.is_node(obj):
                 uow.register_object(obj, 'add')
                 self._log("Inserted "+str(obj))
-        for obj in self._add:
+        for obj in add:
             if self.metadata_map.is_relationship(obj):
+                inserted = obj not in self.identity_map
                 uow.register_object(obj, 'add')
                 self._log("Inserted "+str(obj))
+                # Edges added outside of the relations of their ends
+                if inserted:
+                    self._expire_missing(obj)
 
         # We need to delete relations first
         for obj in self._delete:
             if self.metadata_map.is_relationship(obj):
                 uow.register_object(obj, 'delete')
+                discard_relationship(obj)
                 self._log("Deleted "+str(obj))
         for obj in self._delete:
             if self.metadata_map.is_node(obj):
                 uow.register_object(obj, 'delete')
+                for relation in iter_relations(obj):
+                    for relationship in dict.keys(relation):
+                        discard_relationship(relationship)
                 self._log("Deleted "+str(obj))
         self._delete = []
 
         return self
 
 
+    def _expire_missing(self, relationship):
+        """ Invalidates the relations of the ends of a new edge that do not
+        hold it.
+        """
+        for end in (getattr(relationship, 'outV', None), getattr(relationship, 'inV', None)):
+            for relation in iter_relations(end):
+                if relation._accepts(relationship) and not dict.__contains__(relation, relationship):
+                    relation.invalidate()
+        return self
+
+
+    def _validate(self, uow):
+        """ Validates the added objects before anything is written, and
+        applies the validation policy of the session.
+
+        :param uow: The unit of work of the commit.
+        :type uow: graphalchemy.ogm.unitofwork.UnitOfWork
+        :returns: The objects to write.
+        :rtype: list
+        :raises: graphalchemy.blueprints.validation.ValidationError if an
+        object is not valid and the policy is VALIDATION_RAISE.
+        """
+        self.validation_errors = []
+        if self.validation == self.VALIDATION_IGNORE:
+            return list(self._add)
+        if self.validation not in (self.VALIDATION_RAISE, self.VALIDATION_COLLECT):
+            raise Exception('Unknown validation policy : '+str(self.validation))
+        valid = []
+        for obj in self._add:
+            errors = uow.validate(obj)
+            if not len(errors):
+                valid.append(obj)
+                continue
+            if self.validation == self.VALIDATION_RAISE:
+                raise ValidationError(obj, errors)
+            self.validation_errors.append((obj, errors))
+            self._log('Skipped invalid '+str(obj), level=30)
+        return valid
+
+
     def _log(self, message, level=10):
         if self.logger is None:
             return self
@@ -179,8 +452,234 @@ class Session(object):
 
 
     def get_vertex(self, id):
+        """ Retrieves a vertex from the identity map, or from the database.
+
+        :param id: The id of the vertex.
+        :type id: int
+        :returns: The object and False if it was in the identity map, or the
+        database response and True otherwise.
+        :rtype: tuple
+        """
+        obj = self.identity_map.get_by_id(id)
+        if obj:
+            return obj, False
+        return Query(self)._request(GET, '/vertices/'+str(id), {}), True
+
+
+    def get_edge(self, id):
+        """ Retrieves an edge from the identity map, or from the database.
+
+        :param id: The id of the edge.
+        :type id: int
+        :returns: The object and False if it was in the identity map, or the
+        database response and True otherwise.
+        :rtype: tuple
+        """
         obj = self.identity_map.get_by_id(id)
         if obj:
             return obj, False
-        return self.client.get_vertex(id), True
+        return Query(self)._request(GET, '/edges/'+str(id), {}), True
+
+
+    def get_many(self, ids, _type='vertex', missing=MISSING_NONE, chunk_size=None):
+        """ Retrieves a list of elements from their ids. The identity map is
+        looked up first, and all the missing elements are fetched in a single
+        request (or one request per chunk for very large lists).
+
+        Example use :
+        >>> pages = session.get_many([123, 456, 789])
+
+        :param ids: The ids of the elements to retrieve.
+        :type ids: iterable<int>
+        :param _type: The type of elements to retrieve, 'vertex' or 'edge'.
+        :type _type: str
+        :param missing: What to do with ids that are not found : 'none' puts
+        None at their position, 'skip' drops them and 'raise' raises a
+        NoResultFound exception.
+        :type missing: str
+        :param chunk_size: The maximal number of ids sent in one request.
+        :type chunk_size: int
+        :returns: The elements, in the order of the given ids.
+        :rtype: list<object>
+        """
+        if missing not in (self.MISSING_NONE, self.MISSING_SKIP, self.MISSING_RAISE):
+            raise Exception('Unknown policy for missing ids : '+str(missing))
+        ids = list(ids)
+        chunk_size = chunk_size or self.GET_MANY_CHUNK_SIZE
+
+        # Retrieve from identity map
+        found = {}
+        to_fetch = []
+        seen = set()
+        for id in ids:
+            if id in seen:
+                continue
+            seen.add(id)
+            obj = self.identity_map.get_by_id(id)
+            if obj is None:
+                to_fetch.append(id)
+            else:
+                found[id] = obj
+        self._log(str(len(found))+' objects found in entity map, '+str(len(to_fetch))+' to fetch')
+
+        # Retrieve from DB
+        for start in xrange(0, len(to_fetch), chunk_size):
+            query = ModelAwareQuery(self, logger=self.logger)
+            if _type == 'edge':
+                query.edges()
+            else:
+                query.vertices()
+            for obj in query.filter(eid=to_fetch[start:start+chunk_size]):
+                # Unmapped elements are kept as dicts, and treated as missing
+                if isinstance(obj, dict):
+                    self._log('Unmapped element '+str(obj.get('_id', None))+' ignored')
+                    continue
+                found[obj.id] = obj
+
+        # Order results
+        results = []
+        for id in ids:
+            obj = found.get(id, None)
+            if obj is None:
+                if missing == self.MISSING_RAISE:
+                    raise NoResultFound('No element was found for id '+str(id))
+                elif missing == self.MISSING_SKIP:
+                    continue
+            results.append(obj)
+        return results
+
+
+    def load_relation(self, obj, name, refresh=False):
+        """ Loads the relations of a node for one of its adjacencies, in a
+        single traversal that retrieves the edges and the adjacent nodes. They
+        are tracked by this session. This is what a first read of a lazy
+        relation does, for the node and the other nodes of the result set it
+        was loaded with.
+
+        Example use :
+        >>> pages = session.load_relation(website, 'hosts').values()
+
+        :param obj: The node.
+        :type obj: object
+        :param name: The name of the relation.
+        :type name: str
+        :param refresh: Whether to load the relations again if they were
+        loaded already.
+        :type refresh: bool
+        :returns: The relation dictionary.
+        :rtype: graphalchemy.blueprints.schema.RelationDict
+        """
+        relation = getattr(obj, name)
+        if refresh:
+            relation.invalidate()
+        if not relation.is_loaded():
+            self._load_relations(self._cohort(obj), name)
+        return relation
+
+
+    def prefetch(self, objs, name):
+        """ Loads the relations of many nodes for one of their adjacencies,
+        with a single traversal per class of nodes, instead of one per node
+        on first read.
+
+        Example use :
+        >>> websites = session.get_many([123, 456, 789])
+        >>> session.prefetch(websites, 'hosts')
+        >>> pages = [website.hosts.values() for website in websites]
+
+        :param objs: The nodes.
+        :type objs: list<object>
+        :param name: The name of the relation.
+        :type name: str
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.session.Session
+        """
+        classes = {}
+        for obj in objs:
+            classes.setdefault(obj.__class__, []).append(obj)
+        for instances in classes.itervalues():
+            self._load_relations(instances, name)
+        return self
+
 
+    def _cohort(self, obj):
+        """ :returns: The node and the other nodes of the same class of its
+        last result set that are still tracked by this session.
+        :rtype: list<object>
+        """
+        state = getattr(obj, '__ga_state', None)
+        if state is None:
+            return [obj]
+        objs = [obj]
+        for member in state.cohort_objects():
+            if member is obj or member.__class__ is not obj.__class__:
+                continue
+            if getattr(member, '__ga_state').session is self:
+                objs.append(member)
+        return objs
+
+
+    def _load_relations(self, objs, name, chunk_size=None):
+        """ Loads the relations of nodes of the same class for one of their
+        adjacencies, in a single traversal per chunk of nodes. Relations that
+        are loaded already are skipped.
+
+        :param objs: The nodes.
+        :type objs: list<object>
+        :param name: The name of the relation.
+        :type name: str
+        :param chunk_size: The maximal number of nodes per traversal.
+        :type chunk_size: int
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.session.Session
+        """
+        chunk_size = chunk_size or self.GET_MANY_CHUNK_SIZE
+        pending = {}
+        proxy = None
+        for obj in objs:
+            if proxy is None:
+                proxy = getattr(obj.__class__, name, None)
+                if not isinstance(proxy, RelationProxy):
+                    raise Exception('Unknown relation '+str(name)+' of '+str(obj.__class__))
+            elif getattr(obj.__class__, name, None) is not proxy:
+                raise Exception('Relations can only be loaded for nodes of the same class.')
+            relation = getattr(obj, name)
+            if relation.is_loaded():
+                continue
+            if getattr(obj, 'id', None) is None:
+                relation._fill([])
+                continue
+            pending[obj.id] = relation
+        if not len(pending):
+            return self
+
+        adjacency = proxy.adjacency
+        if proxy.direction == Relationship.OUT:
+            step, end, other, vertex = 'outE', '_outV', adjacency.in_node, 'IN'
+        else:
+            step, end, other, vertex = 'inE', '_inV', adjacency.out_node, 'OUT'
+        # The edges and their other ends are retrieved by pairs
+        walk = '.transform{[it, it.getVertex(Direction.'+vertex+')]}.scatter()'
+
+        ids = pending.keys()
+        relations = dict([(id, []) for id in ids])
+        for start in xrange(0, len(ids), chunk_size):
+            query = Query(self, logger=self.logger).vertices().filter(eid=ids[start:start+chunk_size])
+            query._add_step(step, adjacency.relationship.model_name)
+            script, params = query.compile()
+            rows = query._fetch(script+walk, params) or []
+            ends = [row.get(end, None) for row in rows[0::2]]
+            hydrated = ModelAwareQuery(self, logger=self.logger)
+            hydrated._results = rows
+            results = hydrated.hydrate()._results
+            for id, relationship, node in zip(ends, results[0::2], results[1::2]):
+                # Edges with the same label may lead to other models
+                if id in relations and isinstance(node, other.class_) \
+                and isinstance(relationship, adjacency.relationship.class_):
+                    relations[id].append((relationship, node))
+        self._log('Loaded relation '+str(name)+' of '+str(len(ids))+' nodes')
+
+        with self.lock:
+            for id, relation in pending.iteritems():
+                relation._fill(relations[id])
+        return self
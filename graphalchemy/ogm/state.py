@@ -25,6 +25,53 @@ class InstanceState(object):
         self.state = self.ADD
         self.id = None
         self._attributes = {}
+        self.session = None
+        # The entities loaded along with this one, as weak references
+        self.cohort = None
+
+    def attach(self, obj, session):
+        """ Links the entity to this state, and to the session it loads its
+        relations through.
+
+        :param obj: The entity.
+        :type obj: object
+        :param session: The session.
+        :type session: graphalchemy.ogm.session.Session
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.state.InstanceState
+        """
+        self.session = session
+        setattr(obj, '__ga_state', self)
+        return self
+
+    def detach(self):
+        """ Unlinks the entity from its session, which stopped tracking it.
+        """
+        self.session = None
+        return self
+
+    def join(self, cohort):
+        """ Makes the entity part of a result set, whose members load their
+        relations all at once.
+
+        :param cohort: Weak references to the members of the result set,
+        shared by all of them.
+        :type cohort: list<weakref.ref>
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.state.InstanceState
+        """
+        self.cohort = cohort
+        return self
+
+    def cohort_objects(self):
+        """ :returns: The entities of the last result set of this one that
+        are still alive, or this entity alone.
+        :rtype: list<object>
+        """
+        if self.cohort is None:
+            obj = self.obj()
+            return [] if obj is None else [obj]
+        return [obj for obj in [ref() for ref in self.cohort] if obj is not None]
 
     def update_id(self, _id):
         if self.id is not None and _id != self.id:
@@ -62,11 +62,12 @@ class UnitOfWork(object):
 
         # Get data to update
         data = {}
+        attributes = {}
         for property in class_meta._properties.values():
             python_value = getattr(obj, property.name_py)
-            property.validate(python_value)
             if identity.attribute_has_changed(property.name_py, python_value):
                 data[property.name_db] = property.to_db(python_value)
+                attributes[property.name_py] = python_value
                 self._log('  Property '+str(property)+' changed to '+str(python_value)+', updating.')
             else:
                 self._log('  Property '+str(property)+' has not changed.')
@@ -78,12 +79,13 @@ class UnitOfWork(object):
 
         if class_meta.is_node():
             response = self.client.update_vertex(identity.id, data)
-            print response.content
             self._log("Updated node "+str(identity.id))
         elif class_meta.is_relationship():
             response = self.client.update_edge(identity.id, data)
             self._log("Updated edge "+str(identity.id))
 
+        # The persisted values are the reference for further changes
+        identity.update_attributes(attributes)
         return self
 
 
@@ -93,11 +95,12 @@ class UnitOfWork(object):
 
         # Get data to update
         data = {}
+        attributes = {}
         for property in class_meta._properties.values():
             self._log('  Property '+str(property)+' is new.')
             python_value = getattr(obj, property.name_py)
-            property.validate(python_value)
             data[property.name_db] = property.to_db(python_value)
+            attributes[property.name_py] = python_value
         data[class_meta.model_name_storage_key] = class_meta.model_name
 
         # Insert
@@ -117,10 +120,40 @@ class UnitOfWork(object):
         id = response.content['results']['_id']
         self._log('  Property '+str('id')+' updated to '+str(id))
         obj.id = id
-        self.identity_map.add(obj, update=True)
+        self.identity_map.add(obj, update=True, attributes=attributes)
         return self
 
 
+    def validate(self, obj):
+        """ Validates an object before it is written. New objects are
+        validated entirely, with the validator compiled for their model. For
+        objects that are already persisted, only the properties that changed
+        since they were loaded or last written are validated.
+
+        :param obj: The object to validate.
+        :type obj: object
+        :returns: The lists of errors by property name, empty if the object is
+        valid.
+        :rtype: dict<str, list>
+        """
+        class_meta = self.metadata_map.for_object(obj)
+        if obj not in self.identity_map:
+            errors = class_meta.get_validator()(obj)[1]
+        else:
+            identity = self.identity_map[obj]
+            errors = {}
+            for property in class_meta._properties.itervalues():
+                python_value = getattr(obj, property.name_py)
+                if not identity.attribute_has_changed(property.name_py, python_value):
+                    continue
+                ok, messages = property.validate(python_value)
+                if not ok:
+                    errors[property.name_py] = messages
+        for name_py, messages in errors.iteritems():
+            self._log('  Property '+name_py+' is invalid : '+' '.join(messages))
+        return errors
+
+
     def _log(self, message, level=10):
         if self.logger is None:
             return self
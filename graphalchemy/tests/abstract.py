@@ -5,14 +5,78 @@
 #                                      IMPORTS
 # ==============================================================================
 
+import copy
 from unittest import TestCase
 
+import httplib2
+from bulbs.rexster import RexsterClient
+
+from graphalchemy.ogm.query import GREMLIN_PATH
+from graphalchemy.ogm.session import Session
+
 
 # ==============================================================================
 #                                     TESTING
 # ==============================================================================
 
+class StubResponse(object):
+    """ Response of a StubRequest.
+    """
+
+    def __init__(self, results):
+        self.content = {'results': results}
+        self.timings = {'network': 0., 'decode': 0.}
+
+
+
+class StubRequest(object):
+    """ Stands for the request of a session, and answers from canned results
+    instead of a server.
+    """
+
+    def __init__(self, respond):
+        """ :param respond: Called with the method, the path and the
+        parameters of each request, returns the results or raises LookupError
+        for unknown elements.
+        :type respond: callable
+        """
+        self.respond = respond
+        self.http = httplib2.Http()
+        # Requests sent, and the timeout of each of them
+        self.sent = []
+        self.timeouts = []
+
+    def request(self, method, path, params):
+        self.sent.append((method, path, params))
+        self.timeouts.append(self.http.timeout)
+        # Each response is decoded anew, as it would be from the server
+        return StubResponse(copy.deepcopy(self.respond(method, path, params)))
+
+    def scripts(self):
+        """ :returns: The Gremlin scripts sent.
+        :rtype: list<str>
+        """
+        return [params['script'] for method, path, params in self.sent if path == GREMLIN_PATH]
+
+
+
 class GraphAlchemyTestCase(TestCase):
     """ Base class for GraphAlchemy tests.
     """
-    pass
\ No newline at end of file
+
+    def stub_session(self, metadata, respond=None):
+        """ Creates a session whose requests are answered without a server.
+
+        :param metadata: The models of the session.
+        :type metadata: graphalchemy.blueprints.schema.MetaData
+        :param respond: Called for each request, see StubRequest. Scripts get
+        no result by default.
+        :type respond: callable
+        :returns: The session, whose get_request() is the stub request.
+        :rtype: graphalchemy.ogm.session.Session
+        """
+        if respond is None:
+            respond = lambda method, path, params: []
+        session = Session(client=RexsterClient(), metadata=metadata)
+        session._request = StubRequest(respond)
+        return session
@@ -12,6 +12,9 @@ from graphalchemy.blueprints.validation import Validator
 
 # Model
 from graphalchemy.blueprints.schema import MetaData
+from graphalchemy.blueprints.schema import Node
+from graphalchemy.blueprints.schema import Property
+from graphalchemy.blueprints.types import String
 
 # Fixtures
 from graphalchemy.fixture.declarative import Website
@@ -76,11 +79,172 @@ class MetadataTestCase(TestCase):
         self.assertIsNone(metadata.for_dict(d0))
         self.assertIs(website, metadata.for_dict(d1))
         self.assertIs(websiteHostsPageZ, metadata.for_dict(d2))
+        self.assertIs(websiteHostsPageZ, metadata.for_dict({'_type': 'edge', '_label': 'hosts'}))
         self.assertIs(website, metadata.for_class(Website))
         self.assertIs(website, metadata.for_object(Website()))
         self.assertIs(websiteHostsPageZ, metadata.for_class(WebsiteHostsPage))
         self.assertIs(websiteHostsPageZ, metadata.for_object(WebsiteHostsPage()))
+        self.assertIs(website, metadata.for_model_name('Website'))
+        self.assertIs(websiteHostsPageZ, metadata.for_model_name('hosts'))
+        self.assertRaises(Exception, metadata.for_model_name, 'Page')
+        self.assertIs(Website, metadata.for_model(website))
+        self.assertIs(WebsiteHostsPage, metadata.for_model(websiteHostsPageZ))
+        self.assertRaises(Exception, metadata.for_model, page)
 
 
 
 
+
+
+    def test__object_from_dict(self):
+
+        metadata = MetaData()
+        metadata.bind_node(Website, website)
+        metadata.bind_relationship(WebsiteHostsPage, websiteHostsPageZ)
+
+        obj = metadata._object_from_dict({
+            '_id': 123,
+            '_type': 'vertex',
+            'element_type': 'Website',
+            'name': 'Foo',
+        })
+        self.assertIsInstance(obj, Website)
+        self.assertEquals(123, obj.id)
+        self.assertEquals(u'Foo', obj.name)
+        self.assertIsInstance(obj.name, unicode)
+        self.assertIsNone(obj.domain)
+
+        objs = metadata._objects_from_dicts([
+            {'_id': 1, '_type': 'edge', '_label': 'hosts', '_outV': 2, '_inV': 3, 'accessible': 1},
+            {'_id': 4, '_type': 'vertex', 'element_type': 'Page'},
+        ])
+        self.assertIsInstance(objs[0], WebsiteHostsPage)
+        self.assertIs(True, objs[0].accessible)
+        self.assertIsNone(objs[1])
+
+        # Unknown properties are rejected
+        self.assertRaises(Exception, metadata._object_from_dict, {
+            '_id': 123,
+            '_type': 'vertex',
+            'element_type': 'Website',
+            'foo': 'Bar',
+        })
+
+        # Constructors are not called, they may require arguments
+        class Author(object):
+            def __init__(self, name):
+                self.name = name
+        metadata.bind_node(Author, Node('Author', metadata, Property('name', String(127))))
+        obj = metadata._object_from_dict({'_id': 5, '_type': 'vertex', 'element_type': 'Author'})
+        self.assertIsInstance(obj, Author)
+        self.assertEquals(5, obj.id)
+        self.assertIsNone(obj.name)
+
+
+    def test__objects_from_dicts_records(self):
+
+        metadata = MetaData()
+        metadata.bind_node(Website, website)
+
+        record, = metadata._objects_from_dicts([{
+            '_id': 123,
+            '_type': 'vertex',
+            'element_type': 'Website',
+            'name': 'Foo',
+        }], records=True)
+        self.assertIs(website.get_record_class(), record.__class__)
+        self.assertEquals(123, record.id)
+        self.assertEquals(u'Foo', record.name)
+        self.assertIsNone(record.domain)
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertEquals({'id': 123, 'name': u'Foo', 'domain': None, 'description': None, 'content': None}, record.to_dict())
+        self.assertRaises(AttributeError, setattr, record, 'name', 'Bar')
+
+
+    def test_freeze(self):
+
+        import os
+        import marshal
+        import shutil
+        import tempfile
+
+        def build(size=127):
+            metadata = MetaData()
+            model = Node('Website', metadata,
+                Property('name', String(size), nullable=False),
+            )
+            metadata.bind_node(Website, model)
+            return metadata, model
+
+        # The parameters of the types are part of the fingerprint
+        self.assertEquals(build()[0].fingerprint(), build()[0].fingerprint())
+        self.assertNotEquals(build(127)[0].fingerprint(), build(255)[0].fingerprint())
+
+        cache_dir = tempfile.mkdtemp()
+        try:
+            # Nothing is compiled, nor imported, when freezing
+            metadata, model = build()
+            metadata.defer('Book', 'graphalchemy.fixture.catalog')
+            metadata.freeze(cache_dir=cache_dir)
+            self.assertTrue(metadata.frozen)
+            self.assertRaises(Exception, metadata.bind_node, Page, page)
+            self.assertEquals([], os.listdir(cache_dir))
+            self.assertIn('Book', metadata._deferred)
+
+            # Code is cached on first use, deferred models are still loaded
+            model.get_hydrator()
+            names = os.listdir(cache_dir)
+            self.assertEquals(1, len(names))
+            self.assertEquals('Book', metadata.for_model_name('Book').model_name)
+
+            # Later starts load it from the cache
+            path = os.path.join(cache_dir, names[0])
+            with open(path, 'rb') as handle:
+                source, code = marshal.load(handle)
+            with open(path, 'wb') as handle:
+                marshal.dump((source, compile(source, '<cached>', 'exec')), handle)
+            metadata, model = build()
+            metadata.freeze(cache_dir=cache_dir)
+            model.get_hydrator()
+            self.assertEquals('<cached>', metadata._code[('hydrator', 'Website')][1].co_filename)
+
+            # Another schema does not use it
+            metadata, model = build(255)
+            metadata.freeze(cache_dir=cache_dir)
+            model.get_hydrator()
+            self.assertNotEquals('<cached>', metadata._code[('hydrator', 'Website')][1].co_filename)
+            self.assertEquals(2, len(os.listdir(cache_dir)))
+        finally:
+            shutil.rmtree(cache_dir)
+
+
+    def test_merge(self):
+        from graphalchemy.fixture import catalog
+
+        metadata = MetaData()
+        metadata.merge(catalog.metadata)
+        self.assertEquals(catalog.book, metadata.for_model_name('Book'))
+        self.assertEquals(catalog.book, metadata.for_class(catalog.Book))
+        self.assertEquals(metadata, catalog.book.metadata)
+        # Merging twice is harmless, another model with the same name is not
+        metadata.merge(catalog.metadata)
+        other = MetaData()
+        Node('Book', other).register_class(Website)
+        self.assertRaises(Exception, metadata.merge, other)
+
+
+    def test_defer(self):
+        metadata = MetaData()
+        metadata.defer('Book', 'graphalchemy.fixture.catalog')
+        self.assertEquals(None, metadata.for_dict({'element_type': 'Chapter'}))
+        self.assertIn('Book', metadata._deferred)
+
+        # The module is imported on first hydration
+        book = metadata._object_from_dict({'_id': 3, '_type': 'vertex', 'element_type': 'Book', 'title': 'Dune'})
+        self.assertEquals('Dune', book.title)
+        self.assertEquals({}, metadata._deferred)
+
+        metadata = MetaData()
+        metadata.defer('Book', 'graphalchemy.fixture.catalog')
+        self.assertEquals('Book', metadata.for_model_name('Book').model_name)
+        self.assertRaises(Exception, metadata.for_model_name, 'Chapter')
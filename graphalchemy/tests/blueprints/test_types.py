@@ -35,6 +35,29 @@ class TypeTestCase(TestCase):
         self.assertEquals([], errors)
 
 
+    def test_to_py_many(self):
+
+        self.assertEquals([1, None, 'a'], Type().to_py_many((1, None, 'a')))
+        self.assertEquals([1.0, None, 2.5], Float().to_py_many([1, None, '2.5']))
+        self.assertEquals([1, 2], Integer().to_py_many([1.0, '2']))
+        self.assertEquals([True, False, None], Boolean().to_py_many([1, 0, None]))
+        self.assertEquals([u'a', u'1'], String().to_py_many(['a', 1]))
+        self.assertEquals([1.0, 2.0], Float().to_db_many([1.0, 2.0]))
+
+        # Arrays are cast at once when possible
+        import numpy
+        array = Float().to_py_many(numpy.array([1, 2]))
+        self.assertEquals('float64', array.dtype)
+        self.assertEquals([1.0, 2.0], array.tolist())
+        self.assertEquals('bool', Boolean().to_py_many(numpy.array([1.0, 0.0])).dtype)
+        array = Integer().to_py_many(numpy.array([1.5, None]))
+        self.assertEquals(object, array.dtype)
+        self.assertEquals([1, None], array.tolist())
+        db = Float().to_db_many(numpy.array([1.5, 2.0]))
+        self.assertEquals([1.5, 2.0], db)
+        self.assertEquals(float, type(db[0]))
+
+
 class IntegerTestCase(TestCase):
 
 	def test_validate(self):
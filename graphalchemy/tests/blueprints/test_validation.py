@@ -92,3 +92,123 @@ class ValidatorTestCase(TestCase):
         self.assertTrue(ok)
         self.assertEquals({}, errors)
 
+
+
+    def test_is_valid(self):
+        from graphalchemy.blueprints.types import Integer
+        from graphalchemy.blueprints.types import Const
+
+        class Recipe(object):
+            def __init__(self):
+                self.title = u'Apple pie'
+                self.url = None
+                self.servings = 4
+                self.difficulty = 'easy'
+        recipe = Node('Recipe', self.metadata,
+            Property('title', String(12), nullable=False),
+            Property('url', Url()),
+            Property('servings', Integer(min_value=1, max_value=12)),
+            Property('difficulty', Const(['easy', 'hard'])),
+        )
+        self.mapper(Recipe, recipe)
+        obj = Recipe()
+
+        # Nullable properties accept None
+        self.assertTrue(self.validator.is_valid(obj))
+        self.assertEquals((True, {}), self.validator.run(obj))
+
+        checks = [
+            ('title', None, [u'Property is not nullable.']),
+            ('title', 12, [u"Wrong type : expected basestring, got <type 'int'>"]),
+            ('title', u'*'*13, [u'Value is too long : 13 > 12']),
+            ('url', 'bla', [u'Unable to parse URL']),
+            ('servings', 13, [u'Too big : 13 > 12']),
+            ('servings', 0, [u'Too small : 0 < 1']),
+            ('servings', 1.0, [u"Wrong type : expected int, got <type 'float'>"]),
+            ('difficulty', 'medium', [u'Value medium is not in (easy, hard)']),
+        ]
+        for name, value, errors in checks:
+            obj = Recipe()
+            setattr(obj, name, value)
+            self.assertFalse(recipe.is_valid(obj))
+            self.assertEquals((False, {name: errors}), self.validator.run(obj))
+
+        # The validator is compiled again when the model changes
+        recipe.add_property(Property('author', String(), nullable=False))
+        obj = Recipe()
+        obj.author = None
+        self.assertFalse(recipe.is_valid(obj))
+
+
+    def test_run_many(self):
+
+        class Website(object):
+            def __init__(self, name):
+                self.name = name
+                self.url = 'http://www.url.com/'
+        website = Node('Website', self.metadata,
+            Property('name', String(3), nullable=False),
+            Property('url', Url()),
+        )
+        self.mapper(Website, website)
+
+        # Objects, validated in this process
+        objs = [Website('abc'), Website(None), Website('abc'), Website('abcd')]
+        ok, errors = self.validator.run_many(objs, workers=1, chunk_size=3)
+        self.assertFalse(ok)
+        self.assertEquals({
+            1: {'name': [u'Property is not nullable.']},
+            3: {'name': [u'Value is too long : 4 > 3']},
+        }, errors)
+
+        # Dictionaries streamed to a pool of processes
+        rows = ({'name': 'abc' if i % 4 else None} for i in range(10))
+        results = list(self.validator.run_iter(rows, model='Website', workers=2, chunk_size=3))
+        self.assertEquals([0, 4, 8], [index for index, _ in results])
+        self.assertEquals({'name': [u'Property is not nullable.']}, results[0][1])
+
+        self.assertEquals((True, {}), self.validator.run_many([], model=website, workers=2))
+        self.assertRaises(Exception, self.validator.run_many, [{}], workers=1)
+
+
+    def test_run_columns(self):
+        import numpy
+        from graphalchemy.blueprints.types import Integer
+        from graphalchemy.blueprints.types import Float
+        from graphalchemy.blueprints.types import Const
+
+        class Recipe(object):
+            pass
+        recipe = Node('Recipe', self.metadata,
+            Property('title', String(5), nullable=False),
+            Property('url', Url()),
+            Property('servings', Integer(min_value=1, max_value=12)),
+            Property('rating', Float(max_value=5.0)),
+            Property('difficulty', Const(['easy', 'hard'])),
+        )
+        self.mapper(Recipe, recipe)
+
+        valid, errors = self.validator.run_columns({
+            'title': ['Pie', None, 'Pie', 'Apple pie', 'Pie'],
+            'url': ['http://a.com/', None, 'bla', None, None],
+            'servings': numpy.array([4, 2, 13, 0, 1]),
+            'rating': numpy.array([4.5, numpy.nan, 1.0, 2.0, 5.5]),
+            'difficulty': numpy.array(['easy', 'easy', 'hard', 'medium', 'easy']),
+        }, model='Recipe', present={'rating': numpy.array([True, False, True, True, True])})
+        self.assertEquals([True, False, False, False, False], valid.tolist())
+        self.assertEquals({
+            'title': [1, 3],
+            'url': [2],
+            'servings': [2, 3],
+            'rating': [4],
+            'difficulty': [3],
+        }, dict([(name, indices.tolist()) for name, indices in errors.items()]))
+
+        # Values of the wrong type
+        valid, errors = self.validator.run_columns({
+            'title': ['Pie', 'Pie'],
+            'servings': [1, 1.5],
+            'rating': numpy.array([1, 2]),
+        }, model=recipe)
+        self.assertEquals({'servings': [1], 'rating': [0, 1]}, dict([(name, indices.tolist()) for name, indices in errors.items()]))
+        self.assertRaises(Exception, self.validator.run_columns, {'title': ['Pie'], 'url': []}, model=recipe)
@@ -0,0 +1,109 @@
+#! /usr/bin/env python
+#-*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+# System
+import socket
+import httplib2
+
+from graphalchemy.tests.abstract import GraphAlchemyTestCase
+
+# Services to test
+from graphalchemy.ogm.executor import Executor
+from graphalchemy.ogm.executor import GatherHandle
+from graphalchemy.ogm.query import Query
+from graphalchemy.ogm.query import QueryCancelled
+from graphalchemy.ogm.query import QueryTimeout
+
+# Model
+from graphalchemy.fixture.declarative import metadata
+
+
+# ==============================================================================
+#                                     TESTING
+# ==============================================================================
+
+class StubSocket(object):
+
+    def __init__(self):
+        self.shutdowns = []
+
+    def shutdown(self, how):
+        self.shutdowns.append(how)
+
+
+
+class StubConnection(object):
+
+    def __init__(self, sock=None):
+        self.sock = sock
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+
+class ExecutorTestCase(GraphAlchemyTestCase):
+
+    def setUp(self):
+        self.raws = []
+        self.session = self.stub_session(metadata, lambda method, path, params: self.raws)
+        self.executor = Executor(self.session)
+
+
+    def test_gather_pipeline(self):
+        query1 = Query(self.session).vertices().filter(eid=1).timeout(2)
+        query2 = Query(self.session).vertices().filter(name='Foo')
+        self.raws = [{'_id': 1}, [{'_id': 2}, {'_id': 3}]]
+        results = self.executor.gather([query1, query2], pipeline=True, timeout=1)
+        self.assertEquals([[{'_id': 1}], [{'_id': 2}, {'_id': 3}]], results)
+
+        # Each closure computes its own deadline, from the start of the script
+        request = self.session.get_request()
+        self.assertEquals(1, len(request.sent))
+        script = request.scripts()[0]
+        params = request.sent[0][2]['params']
+        self.assertEquals([1], request.timeouts)
+        self.assertTrue(script.startswith('def _start = System.currentTimeMillis(); [{_timeout, eid -> def _deadline = _timeout == null ? Long.MAX_VALUE : _start + _timeout; '))
+        self.assertTrue(script.endswith('}.call(q0__timeout, q0_eid), {name -> g.V.has("name", name)}.call(q1_name)]'))
+        self.assertEquals(1, params['q0_eid'])
+        self.assertTrue(0 < params['q0__timeout'] <= 1000)
+        self.assertEquals('Foo', params['q1_name'])
+
+        # The timeout of the queries is left untouched
+        self.assertEquals(2, query1._timeout)
+
+
+    def test_gather_pipeline_timeout(self):
+        query1 = Query(self.session).vertices().filter(eid=1).timeout(2)
+        query2 = Query(self.session).vertices().filter(eid=2).timeout(2)
+        self.raws = [{'_id': 1}, Query.TIMEOUT_MARKER]
+        self.assertRaises(QueryTimeout, self.executor.gather, [query1, query2], pipeline=True)
+
+
+    def test_cancel(self):
+        handle = GatherHandle(self.session, [])
+        http = httplib2.Http()
+        sock = StubSocket()
+        connected, connecting = StubConnection(sock), StubConnection()
+        http.connections = {'connected': connected, 'connecting': connecting}
+        handle._start(http)
+
+        # The connections in flight are shut down, closed and dropped
+        handle.cancel()
+        self.assertTrue(handle.cancelled())
+        self.assertEquals([socket.SHUT_RDWR], sock.shutdowns)
+        self.assertTrue(connected.closed)
+        self.assertTrue(connecting.closed)
+        self.assertEquals({}, http.connections)
+
+        # Nothing is sent afterwards
+        self.assertRaises(QueryCancelled, handle._start, httplib2.Http())
+        query = Query(self.session).vertices().filter(eid=1)
+        query._cancelled = handle.cancelled
+        self.assertRaises(QueryCancelled, query.all)
+        self.assertEquals([], self.session.get_request().sent)
@@ -31,7 +31,7 @@ class RepositoryTestCase(TestCase):
 
         website1 = Website(
             name='AllRecipes',
-            domain='allrecipes.com',
+            domain='http://allrecipes.com',
             description='The biggest recipe website !',
             content='100K+ yummy recipes.'
         )
@@ -68,15 +68,50 @@ class RepositoryTestCase(TestCase):
         self.assertIn(page2, query._results)
 
 
+    def test_gather(self):
 
+        website1 = Website(name='GatherWebsite', domain='http://gather.com')
+        page1 = Page(title='GatherPage', url='http://gather.com/page/1')
+        self.ogm.add(website1)
+        self.ogm.add(page1)
+        self.ogm.commit()
 
+        for pipeline in (False, True):
+            websites, pages = self.ogm.gather(
+                self.ogm.repository('Website').filter(name='GatherWebsite'),
+                self.ogm.repository('Page').filter(title='GatherPage'),
+                pipeline=pipeline
+            )
+            self.assertIn(website1, websites)
+            self.assertIn(page1, pages)
 
+        handle = self.ogm.gather_async(self.ogm.repository('Page').filter(title='GatherPage'))
+        pages, = handle.result()
+        self.assertIn(page1, pages)
 
 
+    def test_update(self):
 
+        website1 = Website(name='UpdatedWebsite', domain='http://updated.com')
+        page1 = Page(title='UpdatedPage', url='http://updated.com/page/1')
+        whp1 = WebsiteHostsPage(accessible=True)
+        website1.hosts[whp1] = page1
+        self.ogm.add(website1)
+        self.ogm.add(page1)
+        self.ogm.add(whp1)
+        self.ogm.commit()
 
-
-
-
-
+        # Updated server-side, and in the session
+        count = self.ogm.repository('Website').filter(name='UpdatedWebsite') \
+                                              .outE('hosts') \
+                                              .update(accessible=False)
+        self.assertEquals(1, count)
+        self.assertFalse(whp1.accessible)
+        self.ogm.close()
+        whp, = self.ogm.query("g.e(eid)", {'eid': whp1.id})._results
+        self.assertFalse(whp.accessible)
+
+        # Values are validated
+        query = self.ogm.repository('Website').filter(name='UpdatedWebsite').outE('hosts')
+        self.assertRaises(Exception, query.update, accessible='No')
 
@@ -5,13 +5,20 @@
 #                                      IMPORTS
 # ==============================================================================
 
-from unittest import TestCase
+from graphalchemy.tests.abstract import GraphAlchemyTestCase
 
 # Services
-from graphalchemy.ogm.repository import Query
+from graphalchemy.ogm.query import Query
+from graphalchemy.ogm.query import ModelAwareQuery
+from graphalchemy.ogm.query import QueryTimeout
+from graphalchemy.ogm.query import bind
 from graphalchemy.ogm.repository import Repository
 from graphalchemy.fixture.declarative import Page
 from graphalchemy.fixture.declarative import page
+from graphalchemy.fixture.declarative import Website
+from graphalchemy.fixture.declarative import website
+from graphalchemy.fixture.declarative import WebsiteHostsPage
+from graphalchemy.fixture.declarative import websiteHostsPageZ
 from graphalchemy.fixture.declarative import metadata
 
 
@@ -19,7 +26,7 @@ from graphalchemy.fixture.declarative import metadata
 #                                     TESTING
 # ==============================================================================
 
-class RepositoryTestCase(TestCase):
+class RepositoryTestCase(GraphAlchemyTestCase):
 
     def setUp(self):
         from bulbs.titan import TitanClient
@@ -115,4 +122,322 @@ class RepositoryTestCase(TestCase):
     def test_build(self):
 
         # Tests if the
+        pass
 
+
+    def test__compile_groovy_many(self):
+
+        query = Query(self.session)
+
+        self.assertEquals((
+            u'eid.collect{g.v(it)}.findAll{it != null}._()',
+            {'eid': [1, 2, 3]}
+        ), query.vertices().filter(eid=[1, 2, 3]).compile())
+
+        self.assertEquals((
+            u'eid.collect{g.e(it)}.findAll{it != null}._().has("name", name)',
+            {'eid': [1, 2], u'name': 'Foo'}
+        ), query.edges().filter(eid=(1, 2), name='Foo').compile())
+
+
+    def test__compile_groovy_traversal(self):
+
+        query = Query(self.session)
+        self.assertEquals((
+            u'g.V.has("name", name).out("hosts").has("title", _has1).dedup()[0..9]',
+            {u'name': 'Foo', '_has1': 'Bar'}
+        ), query.vertices().filter(name='Foo').out('hosts').has('title', 'Bar').dedup().range(0, 10).compile())
+
+        self.assertEquals((
+            u'g.v(eid).as("w").outE("hosts").inV().back("w")[5..-1]',
+            {'eid': 123}
+        ), query.vertices().filter(eid=123).as_('w').outE('hosts').inV().back('w').range(5).compile())
+
+        # Step parameters cannot collide with filtered properties
+        self.assertEquals((
+            u'g.V.has("p1", p1).out("hosts").has("title", _has1)',
+            {u'p1': 'Foo', '_has1': 'Bar'}
+        ), Query(self.session).vertices().filter(p1='Foo').out('hosts').has('title', 'Bar').compile())
+
+        # Model aware traversals are checked against adjacencies
+        repository = Repository(self.session, website, Website)
+        self.assertEquals((
+            u'g.V("name", name).out("hosts").has("title", _has1)',
+            {u'name': 'Foo', '_has1': 'Bar'}
+        ), repository.filter(name='Foo').out('hosts').has('title', 'Bar').compile())
+        self.assertEquals((
+            u'g.V("element_type", element_type).outE("hosts").has("accessible", _has1).inV().in("hosts")',
+            {u'element_type': 'Website', '_has1': True}
+        ), repository.filter().outE('hosts').has('accessible', True).inV().in_('hosts').compile())
+        self.assertRaises(Exception, repository.filter().in_, 'hosts')
+        self.assertRaises(Exception, repository.filter().out, 'describes')
+        self.assertRaises(Exception, repository.filter().out('hosts').has, 'name', 'Foo')
+
+
+    def test_explain(self):
+
+        query = Query(self.session).vertices().filter_on_index('name', 'name', 'Foo').filter(content='Bar')
+        self.assertEquals({
+            'script': u'g.V("name", name).has("content", content)',
+            'params': {u'content': 'Bar', u'name': 'Foo'},
+            'access_path': {'method': 'index', 'on': 'vertex', 'index': 'name', 'key': 'name'},
+            'rexster': None
+        }, query.explain())
+        # Explaining does not consume the query
+        self.assertEquals(query.explain(), query.explain())
+
+        query = Query(self.session).edges().filter(eid=123, name='Foo')
+        self.assertEquals({'method': 'id', 'on': 'edge', 'eid': 123}, query.explain()['access_path'])
+        self.assertEquals((u'g.e(eid).has("name", name)', {'eid': 123, u'name': 'Foo'}), query.compile())
+
+        query = Query(self.session).vertices().filter(name='Foo')
+        self.assertEquals({'method': 'scan', 'on': 'vertex'}, query.explain()['access_path'])
+
+
+    def test__compile_rexster(self):
+
+        # Lookups by id
+        self.assertEquals(('/vertices/123', {}), Query(self.session).vertices().filter(eid=123)._compile_rexster())
+        self.assertEquals(('/edges/123', {}), Query(self.session).edges().filter(eid=123)._compile_rexster())
+
+        # Lookups in a key index or in a named index
+        self.assertEquals(
+            ('/vertices', {'key': 'name', 'value': 'Foo'}),
+            Query(self.session).vertices().filter_on_index('name', 'name', 'Foo')._compile_rexster()
+        )
+        self.assertEquals(
+            ('/indices/websites', {'key': 'name', 'value': 'Foo'}),
+            Query(self.session).vertices().filter_on_index('websites', 'name', 'Foo')._compile_rexster()
+        )
+
+        # Anything else needs Gremlin
+        self.assertIsNone(Query(self.session).vertices().filter(eid=123, name='Foo')._compile_rexster())
+        self.assertIsNone(Query(self.session).vertices().filter(eid=[1, 2])._compile_rexster())
+        self.assertIsNone(Query(self.session).vertices().filter(name='Foo')._compile_rexster())
+        self.assertIsNone(Query(self.session).vertices().filter_on_index('since', 'since', 123)._compile_rexster())
+        self.assertIsNone(Query(self.session).vertices().filter_on_index('name', 'name', 'Foo').filter(content='Bar')._compile_rexster())
+        self.assertIsNone(Query(self.session).vertices().filter(eid=123).out('hosts')._compile_rexster())
+        # The label of edges is not a property
+        self.assertIsNone(Query(self.session).edges().filter_on_index('label', 'label', 'hosts')._compile_rexster())
+
+        # Models only look up the keys they declare as indexed
+        query = lambda model: ModelAwareQuery(self.session, model=model)
+        self.assertEquals(
+            ('/vertices', {'key': 'name', 'value': 'Foo'}),
+            query(website).vertices().filter_on_index('name', 'name', 'Foo')._compile_rexster()
+        )
+        self.assertEquals(
+            ('/vertices', {'key': 'element_type', 'value': 'Website'}),
+            query(website).vertices().filter_on_index('element_type', 'element_type', 'Website')._compile_rexster()
+        )
+        self.assertIsNone(query(website).vertices().filter_on_index('domain', 'domain', 'Foo')._compile_rexster())
+        self.assertIsNone(query(websiteHostsPageZ).edges().filter_on_index('since', 'since', 123)._compile_rexster())
+        self.assertIsNone(Repository(self.session, websiteHostsPageZ, WebsiteHostsPage).filter()._compile_rexster())
+        self.assertIsNone(Repository(self.session, websiteHostsPageZ, WebsiteHostsPage).filter(accessible=True)._compile_rexster())
+
+
+
+    def test__compile_aggregate(self):
+
+        query = Query(self.session)
+        self.assertEquals((
+            u'(g.V.has("name", name))._().groupCount{it.getProperty(_key)}.cap.next().collect{[it.key, it.value]}',
+            {u'name': 'Foo', '_key': 'element_type'}
+        ), query.vertices().filter(name='Foo')._compile_aggregate('group_count', 'element_type'))
+
+        script, params = query.edges()._compile_aggregate('histogram', 'since', edges=[0, 10, 20])
+        self.assertTrue(script.startswith(u'_c = [0] * (_edges.size() - 1); (g.E)._().transform{it.getProperty(_key)}'))
+        self.assertEquals({'_key': 'since', '_edges': [0, 10, 20]}, params)
+
+        # Model aware aggregations use the names of the database
+        repository = Repository(self.session, website, Website)
+        script, params = repository.filter(name='Foo').outE('hosts')._compile_aggregate('range', 'since')
+        self.assertEquals('since', params['_key'])
+        self.assertRaises(Exception, repository.filter()._compile_aggregate, 'sum', 'since')
+
+
+    def test_aggregate_numeric(self):
+
+        session = self.stub_session(metadata, lambda method, path, params: [2, 10, None, None])
+
+        # Dates and booleans are stored as numbers, but cannot be summed
+        repository = Repository(session, website, Website)
+        for key in ('since', 'accessible'):
+            self.assertRaises(Exception, repository.filter().outE('hosts').sum, key)
+            self.assertRaises(Exception, repository.filter().outE('hosts').mean, key)
+            self.assertRaises(Exception, repository.filter().outE('hosts').histogram, key, [0, 1])
+        self.assertEquals([], session.get_request().sent)
+
+        # Unmapped properties are aggregated as is
+        self.assertEquals(10, Query(session).edges().sum('since'))
+        self.assertEquals(5., Query(session).edges().mean('since'))
+
+
+    def test_delete(self):
+        batches = [[1, 2], [3], [4, 5], []]
+        def respond(method, path, params):
+            if path == '/vertices/4':
+                return {'_type': 'vertex', '_id': 4, 'element_type': 'Page', 'title': 'Foo'}
+            return batches.pop(0)
+        session = self.stub_session(metadata, respond)
+        repository = Repository(session, page, Page)
+        obj = repository.get(4)
+        request = session.get_request()
+
+        # Edges first, then vertices, until a batch is not full
+        calls = []
+        progress = lambda _type, count: calls.append((_type, count))
+        self.assertEquals(5, repository.filter(title='Foo').delete(chunk_size=2, progress=progress))
+        pipeline = u'r = (g.V("element_type", element_type).has("title", title))._()'
+        batch = u'[0..1].toList(); ids = r.collect{it.id}; r.each{it.remove()}; ids'
+        self.assertEquals([
+            pipeline+u'.bothE.dedup()'+batch,
+            pipeline+u'.bothE.dedup()'+batch,
+            pipeline+batch,
+            pipeline+batch,
+        ], request.scripts())
+        self.assertEquals({'element_type': 'Page', 'title': 'Foo'}, request.sent[-1][2]['params'])
+        self.assertEquals([('edge', 2), ('edge', 3), ('vertex', 2), ('vertex', 2)], calls)
+
+        # The removed elements are evicted
+        self.assertNotIn(obj, session.identity_map)
+        self.assertIsNone(session.identity_map.get_by_id(4))
+
+
+    def test_update(self):
+        def respond(method, path, params):
+            if path == '/vertices/1':
+                return {'_type': 'vertex', '_id': 1, 'element_type': 'Website', 'name': 'Foo'}
+            return [1, 7]
+        session = self.stub_session(metadata, respond)
+        repository = Repository(session, website, Website)
+        obj = repository.get(1)
+        request = session.get_request()
+
+        # Properties are set or removed in a single script
+        self.assertEquals(2, repository.filter(name='Foo').update(domain='http://foo.com', description=None))
+        self.assertEquals([
+            u'(g.V("name", name))._()'
+            u'.sideEffect{it.removeProperty("description"); it.setProperty("domain", set1)}.id'
+        ], request.scripts())
+        self.assertEquals({'name': 'Foo', 'set1': 'http://foo.com'}, request.sent[-1][2]['params'])
+
+        # The loaded objects are updated, and not dirty
+        self.assertEquals('http://foo.com', obj.domain)
+        self.assertIsNone(obj.description)
+        self.assertFalse(session.identity_map[obj].attribute_has_changed('domain', obj.domain))
+
+        # Without a model, they are evicted
+        self.assertEquals(2, Query(session).vertices().filter(name='Foo').update(domain=None))
+        self.assertEquals(u'(g.V.has("name", name))._().sideEffect{it.removeProperty("domain")}.id', request.scripts()[-1])
+        self.assertNotIn(obj, session.identity_map)
+        self.assertRaises(Exception, repository.filter().update)
+
+
+    def test_prepare(self):
+
+        repository = Repository(self.session, website, Website)
+        prepared = repository.prepare(name=bind('n'), domain=bind('d'))
+        self.assertEquals(u'g.V("name", name).has("domain", domain)', prepared.script)
+        self.assertEquals(frozenset(['n', 'd']), prepared.binds)
+        self.assertRaises(Exception, prepared.execute, n='Foo', d='foo.com', x=1)
+        self.assertRaises(Exception, prepared.execute, n='Foo')
+
+        # Preparing does not consume the query
+        query = Query(self.session).vertices().filter(eid=bind('id')).out('hosts')
+        self.assertEquals(query.prepare().script, query.prepare().script)
+        self.assertEquals((u'g.v(eid).out("hosts")', {'eid': query._filters['eid']}), query.compile())
+
+
+    def test__compile_order(self):
+
+        query = Query(self.session)
+        self.assertEquals((
+            u'g.E.has("label", label).order{it.b.getProperty("since") <=> it.a.getProperty("since")}[0..19]',
+            {u'label': 'hosts'}
+        ), query.edges().filter(label='hosts').order_by('since', desc=True).limit(20).compile())
+        self.assertEquals((
+            u'g.V.order{(it.a.getProperty("name") <=> it.b.getProperty("name")) ?: (it.b.getProperty("title") <=> it.a.getProperty("title"))}[10..14]',
+            {}
+        ), query.vertices().order_by('name').order_by('title', desc=True).slice(10, 15).compile())
+        self.assertEquals((u'g.V[5..-1]', {}), query.vertices().offset(5).compile())
+
+        # Edges of a single vertex are already sorted by their sort key
+        query.vertices().filter(eid=123).outE('hosts').has('accessible', True)._add_order('since', False, sort_key=True).limit(20)
+        self.assertEquals((
+            u'g.v(eid).outE("hosts").has("accessible", _has1)[0..19]',
+            {'eid': 123, '_has1': True}
+        ), query.compile())
+        query.vertices().filter(eid=123).outE('hosts')._add_order('since', True, sort_key=True)
+        self.assertEquals(u'g.v(eid).outE("hosts").order{it.b.getProperty("since") <=> it.a.getProperty("since")}', query.compile()[0])
+        query.vertices().filter(eid=123).out('hosts').outE('hosts')._add_order('since', False, sort_key=True)
+        self.assertEquals(u'g.v(eid).out("hosts").outE("hosts").order{it.a.getProperty("since") <=> it.b.getProperty("since")}', query.compile()[0])
+
+        # Model aware queries use the names of the database
+        repository = Repository(self.session, website, Website)
+        self.assertEquals(
+            u'g.V("element_type", element_type).outE("hosts").order{it.a.getProperty("since") <=> it.b.getProperty("since")}',
+            repository.filter().outE('hosts').order_by('since').compile()[0]
+        )
+        self.assertRaises(Exception, repository.filter().order_by, 'since')
+
+
+    def test__compile_deadline(self):
+
+        check = Query.DEADLINE_CHECK
+        query = Query(self.session)
+        self.assertEquals((
+            u'g.V'+check+'.has("name", name).out("hosts")'+check,
+            {u'name': 'Foo', '_timeout': None}
+        ), query.vertices().filter(name='Foo').out('hosts').timeout(2).compile())
+
+        # Single elements are not checked, and the deadline is bound on execution
+        script, params = query.vertices().filter(eid=123).timeout(2).compile()
+        self.assertEquals(u'g.v(eid)', script)
+        script, params = query._bind_deadline(script, params)
+        self.assertTrue(script.startswith('def _deadline = '))
+        self.assertIn('{g.v(eid)}()', script)
+        self.assertTrue(0 < params['_timeout'] <= 2000)
+
+        # Scripts stopped by the check return an explicit marker
+        self.assertRaises(QueryTimeout, query._check_expired, [Query.TIMEOUT_MARKER])
+        query._check_expired(['QueryTimeout'])
+
+
+    def test_request(self):
+
+        import httplib2
+        from bulbs.titan.client import TitanRequest
+        request = self.session.get_request()
+        self.assertIsInstance(request, TitanRequest)
+        self.assertIs(request, self.session.get_request())
+        def send(uri, method, body, headers):
+            return httplib2.Response({'status': '200'}), '{"results": ["QueryTimeout"], "success": true}'
+        request.http.request = send
+
+        # Only the marker means that the script was stopped
+        results = Query(self.session)._fetch('g.v(eid)', {'eid': 1})
+        self.assertEquals(['QueryTimeout'], results)
+        def send(uri, method, body, headers):
+            return httplib2.Response({'status': '200'}), '{"results": ["'+Query.TIMEOUT_MARKER+'"], "success": true}'
+        request.http.request = send
+        self.assertRaises(QueryTimeout, Query(self.session)._fetch, 'g.v(eid)', {'eid': 1})
+
+        # The network and the decoding are timed separately
+        response = Query(self.session)._request('GET', '/vertices/1', {})
+        self.assertTrue(response.timings['network'] >= 0)
+        self.assertTrue(response.timings['decode'] >= 0)
+
+
+    def test_to_array(self):
+
+        from graphalchemy.ogm.query import to_array
+        array, valid = to_array([1.5, None, 3.], 'float64')
+        self.assertEquals([True, False, True], valid.tolist())
+        self.assertEquals(1.5, array[0])
+        self.assertTrue(array[1] != array[1])
+        array, valid = to_array([0, None], 'datetime64[s]')
+        self.assertEquals('1970-01-01T00:00:00', str(array[0]))
+        self.assertEquals([True, False], valid.tolist())
+        array, valid = to_array([u'Foo', None])
+        self.assertEquals([u'Foo', None], array.tolist())
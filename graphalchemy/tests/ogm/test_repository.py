@@ -5,12 +5,15 @@
 #                                      IMPORTS
 # ==============================================================================
 
-from unittest import TestCase
 
 # Services
 from graphalchemy.ogm.repository import Repository
+from graphalchemy.ogm.query import NoResultFound
+from graphalchemy.tests.abstract import GraphAlchemyTestCase
 from graphalchemy.fixture.declarative import Page
 from graphalchemy.fixture.declarative import page
+from graphalchemy.fixture.declarative import WebsiteHostsPage
+from graphalchemy.fixture.declarative import websiteHostsPageZ
 from graphalchemy.fixture.declarative import metadata
 
 
@@ -18,7 +21,7 @@ from graphalchemy.fixture.declarative import metadata
 #                                     TESTING
 # ==============================================================================
 
-class RepositoryTestCase(TestCase):
+class RepositoryTestCase(GraphAlchemyTestCase):
 
     def setUp(self):
         from bulbs.titan import TitanClient
@@ -100,3 +103,136 @@ class RepositoryTestCase(TestCase):
         self.assertEquals(len(results), 1)
 
 
+    def test_get_many(self):
+
+        page1 = Page(title='Title1', url="http://allrecipes.com/page/1")
+        page2 = Page(title='Title2', url="http://allrecipes.com/page/2")
+        self.session.add(page1)
+        self.session.add(page2)
+        self.session.commit()
+        self.session.clear()
+
+        # Order is kept, missing ids are handled according to the policy
+        missing_id = max(page1.id, page2.id) * 1000
+        results = self.repository.get_many([page2.id, missing_id, page1.id])
+        self.assertEquals(len(results), 3)
+        self.assertEquals(results[0].id, page2.id)
+        self.assertIsNone(results[1])
+        self.assertEquals(results[2].id, page1.id)
+        results = self.repository.get_many([page2.id, missing_id, page1.id], missing='skip')
+        self.assertEquals([page2.id, page1.id], [result.id for result in results])
+        self.assertRaises(NoResultFound, self.repository.get_many, [missing_id], missing='raise')
+
+        # Objects already loaded are taken from the identity map
+        results = self.repository.get_many([page1.id, page1.id])
+        self.assertIs(results[0], results[1])
+        self.assertIs(results[0], self.repository.get_many([page1.id])[0])
+
+
+    def test_truncate(self):
+
+        pages = [Page(title='Truncated', url="http://allrecipes.com/page/%i" % i) for i in range(3)]
+        for page_obj in pages:
+            self.session.add(page_obj)
+        self.session.commit()
+
+        # Removed in batches, and evicted from the session
+        counts = []
+        self.repository.truncate(chunk_size=2, progress=lambda _type, count: counts.append((_type, count)))
+        self.assertIn(('vertex', 2), counts)
+        self.assertEquals(('vertex', counts[-1][1]), counts[-1])
+        for page_obj in pages:
+            self.assertNotIn(page_obj, self.session.identity_map)
+        self.assertEquals(0, len(self.repository.filter(title='Truncated').all()))
+
+
+
+class RepositoryGetTestCase(GraphAlchemyTestCase):
+
+    def setUp(self):
+        self.rows = {}
+        def respond(method, path, params):
+            # Batches of ids are looked up in a script
+            if 'script' in params:
+                return [self.rows[id] for id in params['params']['eid'] if id in self.rows]
+            if path not in self.rows:
+                raise LookupError(path)
+            return self.rows[path]
+        self.session = self.stub_session(metadata, respond)
+        self.requests = self.session.get_request().sent
+
+
+    def test_get_vertex(self):
+        repository = Repository(self.session, page, Page)
+        self.rows['/vertices/1'] = {'_type': 'vertex', '_id': 1, 'element_type': 'Page', 'title': 'Title'}
+        self.rows['/vertices/2'] = {'_type': 'vertex', '_id': 2, 'element_type': 'Website', 'name': 'Name'}
+        self.rows['/vertices/3'] = {'_type': 'edge', '_id': 3, '_label': 'hosts'}
+
+        # A cold get costs a single round trip, a warm one none
+        obj = repository.get(1)
+        self.assertIsInstance(obj, Page)
+        self.assertEquals('Title', obj.title)
+        self.assertEquals([('GET', '/vertices/1', {})], self.requests)
+        self.assertIs(obj, repository.get(1))
+        self.assertEquals(1, len(self.requests))
+
+        # Missing elements, other models and other types are rejected
+        self.assertRaises(NoResultFound, repository.get, 4)
+        self.assertRaises(Exception, repository.get, 2)
+        self.assertRaises(Exception, repository.get, 3)
+
+
+    def test_get_edge(self):
+        repository = Repository(self.session, websiteHostsPageZ, WebsiteHostsPage)
+        self.rows['/edges/5'] = {'_type': 'edge', '_id': 5, '_label': 'hosts', '_outV': 1, '_inV': 2}
+        self.rows['/edges/6'] = {'_type': 'edge', '_id': 6, '_label': 'describes', '_outV': 1, '_inV': 2}
+
+        obj = repository.get(5)
+        self.assertIsInstance(obj, WebsiteHostsPage)
+        self.assertEquals([('GET', '/edges/5', {})], self.requests)
+        self.assertIs(obj, repository.get(5))
+        self.assertEquals(1, len(self.requests))
+
+        self.assertRaises(NoResultFound, repository.get, 7)
+        self.assertRaises(Exception, repository.get, 6)
+
+
+    def test_get_many(self):
+        repository = Repository(self.session, page, Page)
+        self.rows[1] = {'_type': 'vertex', '_id': 1, 'element_type': 'Page', 'title': 'One'}
+        self.rows[2] = {'_type': 'vertex', '_id': 2, 'element_type': 'Page', 'title': 'Two'}
+        self.rows[3] = {'_type': 'vertex', '_id': 3, 'element_type': 'Unmapped'}
+
+        # Missing and unmapped elements follow the policy, in a single request
+        results = repository.get_many([2, 4, 1, 3, 2])
+        self.assertEquals(1, len(self.requests))
+        self.assertEquals([2, 4, 1, 3], self.requests[0][2]['params']['eid'])
+        self.assertEquals(['Two', None, 'One', None, 'Two'], [getattr(result, 'title', None) for result in results])
+        self.assertIs(results[0], results[4])
+        results = repository.get_many([2, 4, 1, 3], missing='skip')
+        self.assertEquals(['Two', 'One'], [result.title for result in results])
+        self.assertRaises(NoResultFound, repository.get_many, [3], missing='raise')
+
+        # Objects already loaded are taken from the identity map
+        del self.requests[:]
+        self.assertEquals(['Two', 'One'], [result.title for result in repository.get_many([2, 1])])
+        self.assertEquals([], self.requests)
+
+
+
+class RepositoryFilterTestCase(GraphAlchemyTestCase):
+
+    def setUp(self):
+        self.session = self.stub_session(metadata, lambda method, path, params: [])
+        self.requests = self.session.get_request().sent
+
+
+    def test_filter_relationship(self):
+        repository = Repository(self.session, websiteHostsPageZ, WebsiteHostsPage)
+
+        # Edges are filtered on their label, which is not a property
+        repository.filter().all()
+        self.assertEquals(1, len(self.requests))
+        method, path, params = self.requests[0]
+        self.assertEquals(u'g.E.has("label", label)', params['script'])
+        self.assertEquals({'label': 'hosts'}, params['params'])
@@ -0,0 +1,173 @@
+#! /usr/bin/env python
+#-*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+from graphalchemy.tests.abstract import GraphAlchemyTestCase
+
+# Services to test
+from graphalchemy.ogm.session import Session
+from graphalchemy.ogm.query import ModelAwareQuery
+from graphalchemy.ogm.unitofwork import UnitOfWork
+from graphalchemy.blueprints.validation import ValidationError
+
+# Model
+from graphalchemy.blueprints.schema import MetaData
+from graphalchemy.blueprints.schema import Node
+from graphalchemy.blueprints.schema import Property
+from graphalchemy.blueprints.schema import Relationship
+from graphalchemy.blueprints.schema import Adjacency
+from graphalchemy.blueprints.schema import discard_relationship
+from graphalchemy.blueprints.types import String
+from graphalchemy.ogm.mapper import Mapper
+
+
+# ==============================================================================
+#                                     TESTING
+# ==============================================================================
+
+class Website(object):
+    def __init__(self, name=None, description=None):
+        self.name = name
+        self.description = description
+
+
+class Page(object):
+    pass
+
+
+class WebsiteHostsPage(object):
+    pass
+
+
+class SessionTestCase(GraphAlchemyTestCase):
+
+    def setUp(self):
+        self.metadata = MetaData()
+        website = Node('Website', self.metadata,
+            Property('name', String(5), nullable=False),
+            Property('description', String(10)),
+        )
+        page = Node('Page', self.metadata)
+        websiteHostsPage = Relationship('hosts', self.metadata)
+        self.adjacency = Adjacency(website, websiteHostsPage, page)
+        mapper = Mapper()
+        mapper(WebsiteHostsPage, websiteHostsPage)
+        mapper(Page, page, adjacencies={'isHostedBy': self.adjacency})
+        mapper(Website, website, adjacencies={'hosts': self.adjacency})
+        self.rows = []
+        self.session = self.stub_session(self.metadata, lambda method, path, params: self.rows)
+
+
+    def test_commit_validation(self):
+
+        obj = Website(name=None)
+        self.session.add(obj)
+        try:
+            self.session.commit()
+            self.fail('ValidationError not raised.')
+        except ValidationError as e:
+            self.assertEquals(obj, e.obj)
+            self.assertEquals({'name': [u'Property is not nullable.']}, e.errors)
+
+        # Invalid objects are skipped
+        self.session.validation = Session.VALIDATION_COLLECT
+        self.session.commit()
+        self.assertEquals([(obj, {'name': [u'Property is not nullable.']})], self.session.validation_errors)
+
+
+    def test_validate_dirty(self):
+        uow = UnitOfWork(None, self.session.identity_map, self.metadata)
+
+        # Persisted objects only have their changes validated
+        obj = Website(name='Too long', description='Ok')
+        obj.id = 1
+        self.session.identity_map.add(obj, update=True, attributes={
+            'name': 'Too long',
+            'description': 'Ok'
+        })
+        self.assertEquals({}, uow.validate(obj))
+        obj.description = 'Far too long'
+        self.assertEquals({'description': [u'Value is too long : 12 > 10']}, uow.validate(obj))
+
+        # New objects are validated entirely
+        obj = Website(name='Too long', description='Ok')
+        self.assertEquals({'name': [u'Value is too long : 8 > 5']}, uow.validate(obj))
+
+
+    def test_load_relation(self):
+
+        # New objects have nothing to load
+        website = Website(name='Site')
+        self.assertTrue(website.hosts.is_loaded())
+        self.assertEquals({}, website.hosts)
+
+        # Persisted objects load their relations on first read
+        website.id = 1
+        self.session.identity_map.add(website, update=True, attributes={'name': 'Site'})
+        website.hosts.invalidate()
+        self.assertFalse(website.hosts.is_loaded())
+        self.rows = [
+            {'_type': 'edge', '_id': 10, '_label': 'hosts', '_outV': 1, '_inV': 2, 'label': 'hosts'},
+            {'_type': 'vertex', '_id': 2, 'element_type': 'Page'}
+        ]
+        pages = website.hosts.values()
+        website.hosts.keys()
+        scripts = self.session.get_request().scripts()
+        self.assertEquals(1, len(scripts))
+        self.assertIn('outE', scripts[0])
+        self.assertEquals(1, len(pages))
+        self.assertIsInstance(pages[0], Page)
+        self.assertIs(pages[0], self.session.identity_map.get_by_id(2))
+
+        # Deleted edges are removed from both ends
+        relationship = website.hosts.keys()[0]
+        discard_relationship(relationship)
+        self.assertEquals({}, website.hosts)
+
+
+    def test_load_strategies(self):
+        self.assertRaises(Exception, Adjacency, self.adjacency.out_node,
+            self.adjacency.relationship, self.adjacency.in_node, loading='sometimes')
+
+        website = Website(name='Site')
+        website.id = 1
+        self.session.identity_map.add(website, update=True, attributes={'name': 'Site'})
+        website.hosts.invalidate()
+        self.adjacency.loading = Adjacency.RAISE
+        self.assertRaises(Exception, len, website.hosts)
+        self.adjacency.loading = Adjacency.NOLOAD
+        self.assertEquals(0, len(website.hosts))
+
+
+    def test_load_cohort(self):
+        query = ModelAwareQuery(self.session)
+        query._results = [
+            {'_type': 'vertex', '_id': 1, 'element_type': 'Website', 'name': 'One'},
+            {'_type': 'vertex', '_id': 2, 'element_type': 'Website', 'name': 'Two'},
+            {'_type': 'vertex', '_id': 3, 'element_type': 'Website', 'name': 'Three'}
+        ]
+        websites = query.hydrate()._results
+        self.rows = [
+            {'_type': 'edge', '_id': 10, '_label': 'hosts', '_outV': 1, '_inV': 4, 'label': 'hosts'},
+            {'_type': 'vertex', '_id': 4, 'element_type': 'Page'},
+            {'_type': 'edge', '_id': 11, '_label': 'hosts', '_outV': 2, '_inV': 5, 'label': 'hosts'},
+            {'_type': 'vertex', '_id': 5, 'element_type': 'Page'}
+        ]
+        sent = self.session.get_request().sent
+
+        # The first read loads the relation of the whole result set
+        self.assertEquals(1, len(websites[0].hosts))
+        self.assertEquals(1, len(websites[1].hosts))
+        self.assertEquals(0, len(websites[2].hosts))
+        self.assertEquals(1, len(sent))
+
+        # Loaded relations are not prefetched again
+        self.session.prefetch(websites, 'hosts')
+        self.assertEquals(1, len(sent))
+        websites[0].hosts.invalidate()
+        self.session.prefetch(websites, 'hosts')
+        self.assertEquals(2, len(sent))
+        self.assertIs(self.session.identity_map.get_by_id(5), websites[1].hosts.values()[0])